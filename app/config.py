@@ -1,4 +1,5 @@
 # app/config.py
+import hashlib
 import os
 from functools import lru_cache
 from typing import Any
@@ -16,7 +17,24 @@ class Settings(BaseSettings):
     admin_ids: list[int]
     verify_chat_id: int | str
     invite_url: str
+    # "verify": users join through INVITE_URL and press a button to be checked.
+    # "join_request": each slug gets its own join-request link; requests are approved and the file sent right away.
+    unlock_mode: str = "verify"
     rate_limit_broadcast_per_sec: int = 18
+    broadcast_concurrency: int = 10
+    broadcast_max_retries: int = 3
+    # Outbound pacing shared by every sender; user-facing replies go ahead of broadcasts. 0 disables it.
+    outbound_global_per_sec: float = 30
+    outbound_per_chat_per_sec: float = 1.0
+    outbound_per_chat_burst: int = 3
+    # Bot API HTTP client: connection pool, keep-alive, DNS cache and timeouts (seconds, per method name).
+    bot_api_connection_limit: int = 100
+    bot_api_keepalive_sec: float = 60
+    bot_api_dns_cache_sec: int = 300
+    bot_api_timeout_sec: float = 60
+    bot_api_method_timeouts: dict[str, float] = {"getChatMember": 5, "answerCallbackQuery": 5}
+    # Use orjson for Bot API JSON; needs the orjson package.
+    bot_api_orjson: bool = False
 
     # Database
     db_host: str
@@ -24,12 +42,84 @@ class Settings(BaseSettings):
     db_user: str
     db_pass: str
     db_name: str
+    # Apply pending schema migrations on startup. Disable to run scripts/migrate.py as a separate deploy step.
+    auto_migrate: bool = True
+    # Prepared statements cached per pooled connection; 0 disables them (needed behind pgbouncer in transaction mode).
+    db_statement_cache_size: int = 256
+    # Pool for user-facing handlers.
+    db_pool_min_size: int = 2
+    db_pool_max_size: int = 10
+    db_pool_max_inactive_lifetime_sec: float = 300
+    db_command_timeout_sec: float = 10
+    db_statement_timeout_ms: int = 5000
+    # Separate pool for admin, analytics and broadcast work, so it can't starve the funnel. 0 shares the main pool.
+    db_background_pool_size: int = 3
+    db_background_statement_timeout_ms: int = 60000
+    # Log queries slower than this and waits for a connection longer than this, with their call site. 0 disables.
+    db_slow_query_ms: int = 250
+    db_slow_acquire_ms: int = 100
+    # After this many consecutive connection failures, fail fast and probe every db_breaker_reset_sec.
+    db_breaker_failures: int = 5
+    db_breaker_reset_sec: float = 5.0
+    # Writes made while the database is unavailable are appended to a per-process file in this
+    # directory and replayed later. Empty disables.
+    spool_dir: str = "data/spool"
+    spool_replay_interval_sec: float = 5.0
+
+    # Caches
+    slug_cache_refresh_sec: int = 300
+    membership_positive_ttl_sec: int = 300
+    membership_negative_ttl_sec: int = 5
+    membership_cache_size: int = 100_000
+    membership_strict: bool = False
+    # Background membership probes after /start, this many seconds later, so verify usually hits the cache.
+    # Capped at membership_prefetch_per_sec getChatMember calls (0 disables) and max_users users at a time.
+    membership_prefetch_per_sec: float = 5
+    membership_prefetch_delays: list[float] = [3, 8, 15, 30]
+    membership_prefetch_max_users: int = 1000
+    # Recently seen users, used to answer the verify button during a database outage.
+    known_users_cache_size: int = 100_000
+
+    # Analytics
+    event_batch_size: int = 500
+    event_flush_interval_sec: float = 1.0
+    event_max_pending: int = 50_000
+    events_retention_months: int = 6
+    events_partition_check_sec: int = 3600
+
+    # Anti-spam: default seconds between button presses, per-callback-prefix overrides as JSON
+    # (e.g. {"send:": 3, "pag:": 0.3}), and "local" or "postgres" to share limits across workers.
+    antispam_default_sec: float = 1
+    antispam_limits: dict[str, float] = {"send:": 3, "verify_join": 2, "pag:": 0.3}
+    antispam_backend: str = "local"
+    antispam_max_users: int = 100_000
+
+    # FSM storage: "memory" keeps admin flows in-process; "postgres" lets several workers share them.
+    fsm_storage: str = "memory"
+    fsm_ttl_sec: int = 86400
 
     # Deployment
     use_webhook: bool = False
     base_webhook_url: str = ""
     web_server_host: str = "0.0.0.0"
     web_server_port: int = 8080
+    # Updates are acknowledged at once and handled by this many workers from a bounded queue.
+    webhook_workers: int = 16
+    webhook_queue_size: int = 1000
+
+    # Metrics at /metrics, and in webhook mode /healthz, served on this internal host and port
+    # in both modes; never on the public webhook server.
+    metrics_enabled: bool = True
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 9090
+
+    # Update capture for scripts/replay_updates.py. Empty path disables it.
+    record_updates_path: str = ""
+    record_max_mb: int = 100
+    record_backups: int = 5
+    record_sample_rate: float = 1.0
+    # Key for the id pseudonyms; defaults to one derived from the bot token.
+    record_salt: str = ""
 
     @field_validator("admin_ids", mode="before")
     @classmethod
@@ -63,6 +153,11 @@ class Settings(BaseSettings):
         """Constructs the full webhook URL."""
         return f"{self.base_webhook_url.rstrip('/')}{self.webhook_path}"
 
+    @property
+    def webhook_secret(self) -> str:
+        """Secret Telegram sends with every webhook request, derived from the bot token."""
+        return hashlib.sha256(self.bot_token.get_secret_value().encode()).hexdigest()[:32]
+
     @property
     def is_dev(self) -> bool:
         return os.getenv("ENV") == "dev"
@@ -1,78 +1,305 @@
 # app/db.py
 import asyncio
 import logging
+from abc import ABC, abstractmethod
+import time
+from collections.abc import AsyncIterator, Callable, Iterable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Any
 
 import asyncpg
 
-from .models import CREATE_EVENTS_TABLE, CREATE_SLUGS_TABLE, CREATE_USERS_TABLE
+from . import metrics
+from .migrations import apply_migrations
 
 log = logging.getLogger(__name__)
 
+# Errors that mean the database can't be reached, as opposed to a bad or slow query.
+# A statement timeout is the query's problem and must not open the circuit.
+UNAVAILABLE_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.TooManyConnectionsError,
+)
 
-def _prepare_query(query: str, params: tuple) -> str:
-    """Replaces '?' placeholders with '$1', '$2', etc. for asyncpg."""
-    for i in range(len(params)):
-        query = query.replace('?', f'${i + 1}', 1)
-    return query
 
+class DatabaseUnavailableError(ConnectionError):
+    """Raised instead of querying while the circuit breaker is open, or when a query fails for lack of a database."""
 
-class Database:
+
+class CircuitBreaker:
+    """
+    Stops calls to a database that keeps failing.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    fail fast with DatabaseUnavailableError. Every `reset_timeout` seconds one
+    call is let through as a probe; its success closes the circuit again.
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 5.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.is_open = False
+        self._next_probe_at = 0.0
+
+    def check(self) -> None:
+        if not self.is_open:
+            return
+        now = time.monotonic()
+        if now < self._next_probe_at:
+            raise DatabaseUnavailableError("Database circuit is open.")
+        # Let this call through as the probe; the others keep failing fast until it reports back.
+        self._next_probe_at = now + self.reset_timeout
+
+    def record_success(self) -> None:
+        if self.is_open:
+            log.warning("Database is reachable again, closing the circuit.")
+        self.is_open = False
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if not self.is_open and self.failures >= self.failure_threshold:
+            log.error("Database failed %d times in a row, opening the circuit for %.0f s.", self.failures, self.reset_timeout)
+            self.is_open = True
+            self._next_probe_at = time.monotonic() + self.reset_timeout
+
+
+@lru_cache(maxsize=1024)
+def _prepare_query(query: str, param_count: int) -> str:
+    """
+    Replaces the first `param_count` '?' placeholders with '$1', '$2', etc. for asyncpg.
+
+    Queries are string constants, so each one is translated once and then served from the cache.
+    """
+    parts = query.split("?", param_count)
+    if len(parts) == 1:
+        return query
+    return "".join(f"{part}${i}" for i, part in enumerate(parts[:-1], start=1)) + parts[-1]
+
+
+class _Queries(ABC):
+    """
+    Query methods built on `_run`, which subclasses implement to run one call on a connection.
+
+    `fetchone`/`fetchall` return dicts. `fetchrow`/`fetch`/`fetchval` return
+    asyncpg records or a single value as they come, which is cheaper on hot
+    paths and for large result sets.
+    """
+    @abstractmethod
+    async def _run(self, method: str, query: str, args: tuple) -> Any:
+        ...
+
+    async def execute(self, query: str, params: tuple = ()) -> None:
+        await self._run("execute", _prepare_query(query, len(params)), params)
+
+    async def executemany(self, query: str, params_seq: Iterable[tuple]) -> None:
+        """Runs one statement for many parameter tuples in a single round trip."""
+        params_seq = list(params_seq)
+        if params_seq:
+            await self._run("executemany", _prepare_query(query, len(params_seq[0])), (params_seq,))
+
+    async def fetchrow(self, query: str, params: tuple = ()) -> asyncpg.Record | None:
+        return await self._run("fetchrow", _prepare_query(query, len(params)), params)
+
+    async def fetch(self, query: str, params: tuple = ()) -> list[asyncpg.Record]:
+        return await self._run("fetch", _prepare_query(query, len(params)), params)
+
+    async def fetchval(self, query: str, params: tuple = ()) -> Any:
+        return await self._run("fetchval", _prepare_query(query, len(params)), params)
+
+    async def fetchone(self, query: str, params: tuple = ()) -> dict[str, Any] | None:
+        row = await self.fetchrow(query, params)
+        return dict(row) if row else None
+
+    async def fetchall(self, query: str, params: tuple = ()) -> list[dict[str, Any]]:
+        return [dict(row) for row in await self.fetch(query, params)]
+
+
+# Frames from these modules are passed over when attributing a query to its caller.
+_INTERNAL_MODULES = (__name__, "contextlib")
+
+
+async def _timed(connection: asyncpg.Connection, method: str, query: str, args: tuple, slow_query_sec: float) -> Any:
+    site = metrics.call_site(skip=_INTERNAL_MODULES)
+    started = time.perf_counter()
+    result = await getattr(connection, method)(query, *args)
+    elapsed = time.perf_counter() - started
+    metrics.DB_QUERY_LATENCY.observe(elapsed, site)
+    if slow_query_sec and elapsed >= slow_query_sec:
+        log.warning("Slow query (%.0f ms) from %s: %s", elapsed * 1000, site, " ".join(query.split()))
+    return result
+
+
+@dataclass(frozen=True)
+class PoolSettings:
+    min_size: int = 2
+    max_size: int = 10
+    # Idle connections are closed after this many seconds; 0 keeps them forever.
+    max_inactive_connection_lifetime: float = 300.0
+    # Client-side limit per call, in seconds. None waits forever.
+    command_timeout: float | None = None
+    # Server-side statement_timeout for every session in the pool; 0 means no limit.
+    statement_timeout_ms: int = 0
+
+
+class Database(_Queries):
     """Manages the connection to and operations on the PostgreSQL database."""
 
-    def __init__(self, dsn: str):
+    def __init__(self, dsn: str, auto_migrate: bool = True, statement_cache_size: int = 256,
+                 pool: PoolSettings = PoolSettings(), background_pool: PoolSettings | None = None,
+                 slow_query_ms: float = 0, slow_acquire_ms: float = 0, name: str = "main",
+                 breaker: CircuitBreaker | None = None):
         self.dsn = dsn
+        self.auto_migrate = auto_migrate
+        # Prepared statements kept per connection. Set to 0 behind pgbouncer in transaction mode.
+        self.statement_cache_size = statement_cache_size
+        self.pool_settings = pool
+        self.background_pool_settings = background_pool
+        self.slow_query_sec = slow_query_ms / 1000
+        self.slow_acquire_sec = slow_acquire_ms / 1000
+        self.name = name
+        # Shared with the background pool: both talk to the same server.
+        self.breaker = breaker or CircuitBreaker()
+        # Admin, analytics and broadcast work runs here so it can't starve user-facing handlers.
+        # Without a separate background pool it is this same object.
+        self.background: Database = self
         self._pool: asyncpg.Pool | None = None
+        self._listeners: list[asyncpg.Connection] = []
 
     async def connect(self) -> None:
+        settings = self.pool_settings
+        server_settings = {"application_name": f"telegram-join-unlock:{self.name}"}
+        if settings.statement_timeout_ms:
+            server_settings["statement_timeout"] = str(settings.statement_timeout_ms)
         try:
-            self._pool = await asyncpg.create_pool(dsn=self.dsn, timeout=10)
-            async with self._pool.acquire() as connection:
-                await self._create_tables(connection)
-            log.info("Successfully connected to PostgreSQL and created tables.")
+            self._pool = await asyncpg.create_pool(
+                dsn=self.dsn, timeout=10, statement_cache_size=self.statement_cache_size,
+                min_size=settings.min_size, max_size=settings.max_size,
+                max_inactive_connection_lifetime=settings.max_inactive_connection_lifetime,
+                command_timeout=settings.command_timeout, server_settings=server_settings,
+            )
+            if self.auto_migrate:
+                async with self._pool.acquire() as connection:
+                    # Index builds can legitimately outlast the pool's statement timeout.
+                    await connection.execute("SET statement_timeout = 0")
+                    await apply_migrations(connection)
+            prefix = "db_pool" if self.name == "main" else f"db_{self.name}_pool"
+            metrics.gauge(f"{prefix}_size", f"Open connections in the {self.name} pool.", self._pool.get_size)
+            metrics.gauge(f"{prefix}_idle", f"Idle connections in the {self.name} pool.", self._pool.get_idle_size)
+            metrics.gauge("db_circuit_open", "1 while database calls are failing fast.", lambda: int(self.breaker.is_open))
+            if self.background_pool_settings:
+                self.background = Database(
+                    self.dsn, auto_migrate=False, statement_cache_size=self.statement_cache_size,
+                    pool=self.background_pool_settings, slow_query_ms=self.slow_query_sec * 1000,
+                    slow_acquire_ms=self.slow_acquire_sec * 1000, name="background", breaker=self.breaker,
+                )
+                await self.background.connect()
+            log.info("Successfully connected to PostgreSQL (%s pool, %d-%d connections).",
+                     self.name, settings.min_size, settings.max_size)
         except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
             log.error("Database connection failed. Is the Docker container running? Error: %s", e)
             raise
 
-    async def _create_tables(self, connection: asyncpg.Connection) -> None:
-        await connection.execute(CREATE_USERS_TABLE)
-        await connection.execute(CREATE_SLUGS_TABLE)
-        await connection.execute(CREATE_EVENTS_TABLE)
-        log.info("Tables checked/created successfully.")
-
-    async def execute(self, query: str, params: tuple = ()) -> None:
+    @asynccontextmanager
+    async def _acquire(self) -> AsyncIterator[asyncpg.Connection]:
         if not self._pool: raise ConnectionError("Database pool is not initialized.")
-        prepared_query = _prepare_query(query, params)
+        started = time.perf_counter()
+        async with self._pool.acquire() as connection:
+            wait = time.perf_counter() - started
+            metrics.DB_POOL_WAIT.observe(wait, self.name)
+            if self.slow_acquire_sec and wait >= self.slow_acquire_sec:
+                log.warning("Waited %.0f ms for a %s pool connection at %s.",
+                            wait * 1000, self.name, metrics.call_site(skip=_INTERNAL_MODULES))
+            yield connection
+
+    @asynccontextmanager
+    async def _guard(self) -> AsyncIterator[None]:
+        """Fails fast while the circuit is open and turns connectivity errors into DatabaseUnavailableError."""
+        self.breaker.check()
         try:
-            async with self._pool.acquire() as connection:
-                await connection.execute(prepared_query, *params)
+            yield
+        except UNAVAILABLE_ERRORS as e:
+            self.breaker.record_failure()
+            raise DatabaseUnavailableError(f"Database unavailable: {type(e).__name__}: {e}") from e
+        except asyncpg.PostgresError:
+            # The server answered; the query itself was at fault.
+            self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+
+    async def _run(self, method: str, query: str, args: tuple) -> Any:
+        try:
+            async with self._guard(), self._acquire() as connection:
+                return await _timed(connection, method, query, args, self.slow_query_sec)
+        except DatabaseUnavailableError as e:
+            # Calls rejected by an open circuit are expected and would only flood the log.
+            if e.__cause__ is not None:
+                log.error("Query failed (%s): %s\nQuery: %s", method, e, query)
+            raise
         except asyncpg.PostgresError as e:
-            log.error("Failed to execute query: %s\nQuery: %s", e, prepared_query)
+            log.error("Query failed (%s): %s\nQuery: %s", method, e, query)
             raise
 
     async def fetchone(self, query: str, params: tuple = ()) -> dict[str, Any] | None:
-        if not self._pool: raise ConnectionError("Database pool is not initialized.")
-        prepared_query = _prepare_query(query, params)
+        """Like `_Queries.fetchone`, but a failed query is logged and reads as no row."""
         try:
-            async with self._pool.acquire() as connection:
-                row = await connection.fetchrow(prepared_query, *params)
-                return dict(row) if row else None
-        except asyncpg.PostgresError as e:
-            log.error("Failed to fetch one row: %s\nQuery: %s", e, prepared_query)
+            return await super().fetchone(query, params)
+        except asyncpg.PostgresError:
             return None
 
     async def fetchall(self, query: str, params: tuple = ()) -> list[dict[str, Any]]:
-        if not self._pool: raise ConnectionError("Database pool is not initialized.")
-        prepared_query = _prepare_query(query, params)
+        """Like `_Queries.fetchall`, but a failed query is logged and reads as no rows."""
         try:
-            async with self._pool.acquire() as connection:
-                rows = await connection.fetch(prepared_query, *params)
-                return [dict(row) for row in rows]
-        except asyncpg.PostgresError as e:
-            log.error("Failed to fetch all rows: %s\nQuery: %s", e, prepared_query)
+            return await super().fetchall(query, params)
+        except asyncpg.PostgresError:
             return []
 
+    async def copy_records(self, table: str, records: list[tuple], columns: list[str]) -> None:
+        """Bulk-loads rows with COPY, which is far cheaper than one INSERT per row."""
+        try:
+            async with self._guard(), self._acquire() as connection:
+                await connection.copy_records_to_table(table, records=records, columns=columns)
+        except DatabaseUnavailableError as e:
+            if e.__cause__ is not None:
+                log.error("Failed to copy %d records into %s: %s", len(records), table, e)
+            raise
+        except asyncpg.PostgresError as e:
+            log.error("Failed to copy %d records into %s: %s", len(records), table, e)
+            raise
+
+    async def copy_from_query(self, query: str, params: tuple, output: Any, **copy_options: Any) -> str:
+        """Streams the result of a query to `output` with COPY ... TO STDOUT, without buffering rows in memory."""
+        prepared_query = _prepare_query(query, len(params))
+        try:
+            async with self._guard(), self._acquire() as connection:
+                return await connection.copy_from_query(prepared_query, *params, output=output, **copy_options)
+        except asyncpg.PostgresError as e:
+            log.error("Failed to copy query results: %s\nQuery: %s", e, prepared_query)
+            raise
+
+    async def listen(self, channel: str, callback: Callable[..., Any]) -> asyncpg.Connection:
+        """Opens a dedicated connection subscribed to a NOTIFY channel."""
+        connection = await asyncpg.connect(dsn=self.dsn, timeout=10)
+        await connection.add_listener(channel, callback)
+        self._listeners = [c for c in self._listeners if not c.is_closed()]
+        self._listeners.append(connection)
+        log.info("Listening for notifications on channel '%s'.", channel)
+        return connection
+
     async def disconnect(self) -> None:
+        for connection in self._listeners:
+            if not connection.is_closed():
+                await connection.close()
+        self._listeners = []
+        if self.background is not self:
+            await self.background.disconnect()
+            self.background = self
         if self._pool:
             await self._pool.close()
             self._pool = None
@@ -1,5 +1,4 @@
 # app/handlers/admin.py
-import asyncio
 import logging
 
 from aiogram import Bot, F, Router, types
@@ -9,11 +8,11 @@ from aiogram.types import Message
 
 from app.config import Settings, load_config
 from app.db import Database
-from app.keyboards import (PaginatorCallback, SlugCallback, get_admin_panel_keyboard, get_broadcast_confirm_keyboard,
-                           get_cancel_fsm_keyboard, get_single_slug_keyboard, get_slug_delete_confirm_keyboard,
+from app.keyboards import (BroadcastCallback, PaginatorCallback, SlugCallback, get_admin_panel_keyboard,
+                           get_broadcast_confirm_keyboard, get_broadcast_control_keyboard, get_cancel_fsm_keyboard, get_single_slug_keyboard, get_slug_delete_confirm_keyboard,
                            get_slug_management_keyboard)
 from app.locales import *
-from app.services import analytics, broadcast, slugs
+from app.services import analytics, broadcast, invite_links, membership, slugs
 from app.states import AdminStates
 
 log = logging.getLogger(__name__)
@@ -115,8 +114,7 @@ async def add_slug_file(message: Message, state: FSMContext, db: Database):
     data = await state.get_data()
     slug_name, slug_label = data['slug_name'], data['slug_label']
     file_id = message.document.file_id
-    query = "INSERT INTO slugs (slug, label, file_id, active) VALUES (?, ?, ?, 1)"
-    await db.execute(query, (slug_name, slug_label, file_id))
+    await slugs.create_slug(db, slug_name, slug_label, file_id)
     await state.clear()
     await message.answer(f"✅ Success! Slug `<code>{slug_name}</code>` has been created.")
     all_slugs = await slugs.get_all_slugs(db)
@@ -131,8 +129,9 @@ async def delete_slug_confirm(query: types.CallbackQuery, callback_data: SlugCal
     await query.message.edit_text(f"Are you sure you want to delete `<code>{callback_data.slug_id}</code>`?", reply_markup=get_slug_delete_confirm_keyboard(callback_data.slug_id))
 
 @router.callback_query(SlugCallback.filter(F.action == "confirm_delete"))
-async def delete_slug_execute(query: types.CallbackQuery, callback_data: SlugCallback, db: Database):
-    await db.execute("DELETE FROM slugs WHERE slug = ?", (callback_data.slug_id,))
+async def delete_slug_execute(query: types.CallbackQuery, callback_data: SlugCallback, bot: Bot, db: Database,
+                              config: Settings):
+    await invite_links.delete_slug(bot, db, config.verify_chat_id, callback_data.slug_id)
     await query.answer("Slug deleted successfully!", show_alert=True)
     all_slugs = await slugs.get_all_slugs(db)
     await query.message.edit_text(MSG_SLUG_MANAGEMENT_TITLE, reply_markup=get_slug_management_keyboard(all_slugs))
@@ -144,25 +143,62 @@ async def broadcast_start(query: types.CallbackQuery, state: FSMContext):
 
 @router.message(AdminStates.broadcast_confirm)
 async def broadcast_content_received(message: Message, state: FSMContext):
-    await state.update_data(broadcast_message=message)
+    # Only a reference is kept; the job sends the original with copyMessage.
+    await state.update_data(broadcast_chat_id=message.chat.id, broadcast_message_id=message.message_id)
     await message.copy_to(chat_id=message.chat.id)
     await message.answer(MSG_FSM_BROADCAST_CONFIRM, reply_markup=get_broadcast_confirm_keyboard())
 
 @router.callback_query(F.data == "broadcast_send")
-async def broadcast_send(query: types.CallbackQuery, state: FSMContext, bot: Bot, db: Database, config: Settings):
+async def broadcast_send(query: types.CallbackQuery, state: FSMContext, db: Database):
     data = await state.get_data()
-    broadcast_message = data.get("broadcast_message")
-    if not broadcast_message:
+    message_id = data.get("broadcast_message_id")
+    if not message_id:
         await state.clear()
         await query.message.edit_text("Error: Broadcast message not found.", reply_markup=get_admin_panel_keyboard())
         return
     await state.clear()
-    all_chat_ids = await broadcast.get_all_chat_ids(db)
-    if not all_chat_ids:
+    user_count = await broadcast.count_recipients(db)
+    if not user_count:
         await query.message.edit_text(MSG_BROADCAST_NO_USERS, reply_markup=get_admin_panel_keyboard())
         return
-    await query.message.edit_text(MSG_BROADCAST_STARTED.format(user_count=len(all_chat_ids)))
-    asyncio.create_task(broadcast.send_broadcast(bot=bot, db=db, from_chat_id=query.message.chat.id, message=broadcast_message, rate_limit_sec=config.rate_limit_broadcast_per_sec))
+    job_id = await broadcast.create_job(db, query.message.chat.id, data["broadcast_chat_id"], message_id, user_count)
+    await query.message.edit_text(
+        MSG_BROADCAST_STARTED.format(user_count=user_count),
+        reply_markup=get_broadcast_control_keyboard(job_id, broadcast.RUNNING),
+    )
+    if broadcast.runner:
+        await broadcast.runner.start_job(job_id)
+
+async def show_broadcast_job(query: types.CallbackQuery, job: dict):
+    text = MSG_BROADCAST_JOB_STATUS.format(
+        job_id=job['id'], state=job['state'], sent=job['sent'], failed=job['failed'], total=job['total']
+    )
+    await query.message.edit_text(text, reply_markup=get_broadcast_control_keyboard(job['id'], job['state']))
+
+@router.callback_query(BroadcastCallback.filter(F.action == "status"))
+async def broadcast_status(query: types.CallbackQuery, callback_data: BroadcastCallback, db: Database):
+    job = await broadcast.get_job(db, callback_data.job_id)
+    if not job:
+        await query.answer(MSG_BROADCAST_JOB_NOT_FOUND, show_alert=True); return
+    await show_broadcast_job(query, job)
+    await query.answer()
+
+@router.callback_query(BroadcastCallback.filter(F.action.in_({"pause", "resume", "cancel"})))
+async def broadcast_control(query: types.CallbackQuery, callback_data: BroadcastCallback, db: Database):
+    transitions = {
+        "pause": (broadcast.PAUSED, (broadcast.RUNNING,)),
+        "resume": (broadcast.RUNNING, (broadcast.PAUSED,)),
+        "cancel": (broadcast.CANCELLED, (broadcast.RUNNING, broadcast.PAUSED)),
+    }
+    new_state, from_states = transitions[callback_data.action]
+    job = await broadcast.set_job_state(db, callback_data.job_id, new_state, from_states)
+    if not job:
+        await query.answer(MSG_BROADCAST_JOB_UNCHANGED, show_alert=True); return
+    if new_state == broadcast.RUNNING and broadcast.runner:
+        await broadcast.runner.start_job(job['id'])
+    log.info("Admin %d set broadcast job %d to '%s'.", query.from_user.id, job['id'], new_state)
+    await show_broadcast_job(query, job)
+    await query.answer()
 
 @router.message(Command("stats"))
 async def stats_handler(message: types.Message, db: Database):
@@ -170,7 +206,9 @@ async def stats_handler(message: types.Message, db: Database):
     text = f"{MSG_STATS_HEADER}\n\n"
     text += f"👤 Total Users: {stats_data['total_users']}\n"
     text += f"✅ Verified Users: {stats_data['joined_users']}\n"
-    text += f"🏃 30-Day Active: {stats_data['active_30d']}\n\n"
+    text += f"🏃 30-Day Active: {stats_data['active_30d']}\n"
+    cache_stats = membership.cache.stats()
+    text += f"🗄 Membership Cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses ({cache_stats['hit_rate']:.1f}%)\n\n"
     text += "--- Per-Slug Stats ---\n"
     if not stats_data['per_slug']: text += "No slug activity yet."
     else:
@@ -0,0 +1,52 @@
+# app/handlers/join_requests.py
+import logging
+
+from aiogram import Bot, Router, types
+from aiogram.exceptions import TelegramAPIError
+
+from app.config import Settings
+from app.db import Database
+from app.handlers.members import is_verify_chat
+from app.locales import MSG_JOIN_APPROVED, MSG_OFFER_UNAVAILABLE
+from app.services import analytics, membership, slugs, users
+
+log = logging.getLogger(__name__)
+router = Router()
+
+
+@router.chat_join_request()
+async def join_request_handler(event: types.ChatJoinRequest, bot: Bot, db: Database, config: Settings):
+    """
+    Approves requests made through a slug's invite link and sends that slug's file straight away.
+    Requests through other links are left for the chat admins.
+    """
+    if not is_verify_chat(event.chat, config.verify_chat_id) or not event.invite_link or not event.invite_link.name:
+        return
+    slug = await slugs.get_slug_for_invite_link(db, event.invite_link.name)
+    if slug is None:
+        return
+
+    user_id = event.from_user.id
+    try:
+        await event.approve()
+    except TelegramAPIError as e:
+        log.error("Could not approve join request of user %d for slug %s: %s", user_id, slug, e)
+        return
+    membership.cache.set(config.verify_chat_id, user_id, True)
+    await users.record_join(db, user_id, event.user_chat_id, slug)
+    await analytics.log_event(db, user_id, "verify_ok", slug=slug)
+
+    slug_data = await slugs.get_slug_data(db, slug)
+    if not slug_data or slug_data["file_id"] == "MISSING":
+        await bot.send_message(event.user_chat_id, MSG_OFFER_UNAVAILABLE)
+        return
+    try:
+        await bot.send_document(
+            chat_id=event.user_chat_id,
+            document=slug_data["file_id"],
+            caption=f"{MSG_JOIN_APPROVED}\n\n{slug_data['label']}",
+        )
+        log.info("Approved join request of user %d and sent file for slug '%s'.", user_id, slug)
+        await analytics.log_event(db, user_id, "file_sent", slug=slug)
+    except TelegramAPIError as e:
+        log.error("Failed to send document for slug %s to user %d after join request: %s", slug, user_id, e)
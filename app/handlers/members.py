@@ -0,0 +1,27 @@
+# app/handlers/members.py
+import logging
+
+from aiogram import Router, types
+
+from app.config import Settings
+from app.services import membership
+
+log = logging.getLogger(__name__)
+router = Router()
+
+
+def is_verify_chat(chat: types.Chat, verify_chat_id: int | str) -> bool:
+    if isinstance(verify_chat_id, str) and verify_chat_id.startswith("@"):
+        return chat.username is not None and chat.username.lower() == verify_chat_id[1:].lower()
+    return str(chat.id) == str(verify_chat_id)
+
+
+@router.chat_member()
+async def chat_member_handler(event: types.ChatMemberUpdated, config: Settings):
+    """Keeps the membership cache current. Only delivered while the bot is an admin in the chat."""
+    if not is_verify_chat(event.chat, config.verify_chat_id):
+        return
+    user_id = event.new_chat_member.user.id
+    is_member = event.new_chat_member.status in membership.ALLOWED_STATUSES
+    membership.cache.set(config.verify_chat_id, user_id, is_member)
+    log.info("Membership of user %d in chat %s changed to '%s'.", user_id, event.chat.id, event.new_chat_member.status)
@@ -1,7 +1,7 @@
 # app/handlers/start.py
 import logging
 
-from aiogram import F, Router, types
+from aiogram import Bot, F, Router, types
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.markdown import hbold
@@ -9,8 +9,8 @@ from aiogram.utils.markdown import hbold
 from app.config import Settings
 from app.db import Database
 from app.keyboards import get_pre_verify_keyboard
-from app.locales import MSG_START_NO_PAYLOAD, MSG_START_PRE_VERIFY_WITH_SLUG
-from app.services import analytics, slugs
+from app.locales import MSG_START_JOIN_REQUEST_WITH_SLUG, MSG_START_NO_PAYLOAD, MSG_START_PRE_VERIFY_WITH_SLUG
+from app.services import analytics, invite_links, membership, slugs, users
 
 log = logging.getLogger(__name__)
 router = Router()
@@ -19,6 +19,7 @@ router = Router()
 @router.message(CommandStart())
 async def cmd_start(
     message: types.Message,
+    bot: Bot,
     db: Database,
     config: Settings,
     state: FSMContext,
@@ -27,32 +28,35 @@ async def cmd_start(
     chat_id = message.chat.id
     payload = (message.text.split(" ", 1)[1] if len(message.text.split()) > 1 else None)
 
-    user_query = """
-    INSERT INTO users (user_id, chat_id, selected_slug) VALUES (?, ?, ?)
-    ON CONFLICT(user_id) DO UPDATE SET
-        selected_slug = excluded.selected_slug,
-        updated_at = CURRENT_TIMESTAMP;
-    """
-    await db.execute(user_query, (user.id, chat_id, payload))
+    # Validate against the in-memory slug catalog before writing anything.
+    slug_data = None
+    if payload and slugs.is_valid_slug(payload):
+        slug_data = await slugs.get_slug_data(db, payload)
+    await users.record_start(db, user.id, chat_id, payload if slug_data else None)
 
-    if not payload or not slugs.is_valid_slug(payload):
-        await message.answer(MSG_START_NO_PAYLOAD)
-        log.warning("User %d started without a valid payload.", user.id)
-        return
-
-    slug_data = await slugs.get_slug_data(db, payload)
     if not slug_data:
         await message.answer(MSG_START_NO_PAYLOAD)
-        log.warning("User %d started with an invalid or inactive slug: %s", user.id, payload)
+        log.warning("User %d started without a valid payload (payload: %s).", user.id, payload)
         return
 
     await analytics.log_event(db, user.id, "start", slug=payload)
     
-    welcome_text = MSG_START_PRE_VERIFY_WITH_SLUG.format(
+    template, invite_url = MSG_START_PRE_VERIFY_WITH_SLUG, config.invite_url
+    if config.unlock_mode == "join_request":
+        # Falls back to the shared link and the verify button if the slug's link can't be created.
+        slug_link = await invite_links.get_invite_link(bot, db, config.verify_chat_id, slug_data)
+        if slug_link:
+            template, invite_url = MSG_START_JOIN_REQUEST_WITH_SLUG, slug_link
+
+    welcome_text = template.format(
         user_name=hbold(user.first_name),
         slug_label=slug_data['label']
     )
     
-    keyboard = get_pre_verify_keyboard(config.invite_url)
+    keyboard = get_pre_verify_keyboard(invite_url)
     await message.answer(welcome_text, reply_markup=keyboard)
+    if template is MSG_START_PRE_VERIFY_WITH_SLUG:
+        # Most users press the verify button within seconds; have the answer cached by then.
+        # Join requests need no probe: approving one records the membership.
+        membership.prefetcher.schedule(bot, config.verify_chat_id, user.id)
     log.info("User %d started with slug '%s'. Sent verification prompt.", user.id, payload)
\ No newline at end of file
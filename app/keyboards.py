@@ -14,6 +14,10 @@ class SlugCallback(CallbackData, prefix="slug"):
     action: str
     slug_id: str
 
+class BroadcastCallback(CallbackData, prefix="bc"):
+    action: str
+    job_id: int
+
 # --- Admin Panel Keyboards ---
 def get_admin_panel_keyboard() -> InlineKeyboardMarkup:
     buttons = [
@@ -65,6 +69,21 @@ def get_broadcast_confirm_keyboard() -> InlineKeyboardMarkup:
     ]]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+def get_broadcast_control_keyboard(job_id: int, state: str) -> InlineKeyboardMarkup:
+    buttons = []
+    if state == "running":
+        buttons.append(InlineKeyboardButton(text="⏸ Pause", callback_data=BroadcastCallback(action="pause", job_id=job_id).pack()))
+    elif state == "paused":
+        buttons.append(InlineKeyboardButton(text="▶️ Resume", callback_data=BroadcastCallback(action="resume", job_id=job_id).pack()))
+    if state in ("running", "paused"):
+        buttons.append(InlineKeyboardButton(text="⏹ Stop", callback_data=BroadcastCallback(action="cancel", job_id=job_id).pack()))
+    rows = [
+        buttons,
+        [InlineKeyboardButton(text="🔄 Refresh", callback_data=BroadcastCallback(action="status", job_id=job_id).pack())],
+        [InlineKeyboardButton(text="⬅️ Back to Admin Panel", callback_data="admin_panel_main")],
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[row for row in rows if row])
+
 # --- FSM & Generic Keyboards ---
 def get_cancel_fsm_keyboard() -> InlineKeyboardMarkup:
     buttons = [[InlineKeyboardButton(text=BTN_CANCEL, callback_data="fsm_cancel")]]
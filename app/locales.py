@@ -6,6 +6,13 @@ Assalamu alaikum, {user_name}!
 
 Sie sind wegen <b>"{slug_label}"</b> hier. Um es freizuschalten, treten Sie bitte zuerst der Gruppe bei und klicken Sie auf die Schaltfläche "✅ Ich bin beigetreten".
 """
+MSG_START_JOIN_REQUEST_WITH_SLUG = """ 
+Assalamu alaikum, {user_name}!
+
+Sie sind wegen <b>"{slug_label}"</b> hier. Treten Sie der Gruppe über die Schaltfläche unten bei, und Ihr Material wird Ihnen sofort hier zugeschickt. Wenn Sie bereits Mitglied sind, klicken Sie auf "✅ Ich bin beigetreten".
+"""
+MSG_JOIN_APPROVED = "Willkommen in der Gruppe! Hier ist Ihr ausgewähltes Material."
+MSG_OFFER_UNAVAILABLE = "Das angeforderte Angebot ist leider nicht mehr verfügbar."
 MSG_START_NO_PAYLOAD = "Entschuldigung, der verwendete Link ist falsch oder abgelaufen. Bitte überprüfen Sie den Link erneut an der Stelle, an der Sie ihn erhalten haben."
 MSG_VERIFY_FAIL = "Sie sind der Gruppe noch nicht beigetreten. Bitte treten Sie bei und versuchen Sie es erneut."
 MSG_VERIFIED_SUCCESS = "Glückwunsch! Ihr ausgewähltes Material ist bereit."
@@ -52,6 +59,16 @@ MSG_FSM_BROADCAST_CONTENT = "Send the message you want to broadcast to all users
 MSG_FSM_BROADCAST_CONFIRM = "This is a preview of your broadcast message. Are you sure you want to send this to all users?"
 MSG_BROADCAST_STARTED = "✅ Broadcast started for {user_count} users. You will receive a summary message when it is complete."
 MSG_BROADCAST_NO_USERS = "❌ There are no users to broadcast to."
+MSG_BROADCAST_JOB_STATUS = """
+📢 <b>Broadcast #{job_id}</b>
+
+• <b>State:</b> {state}
+• <b>Sent:</b> {sent}
+• <b>Failed:</b> {failed}
+• <b>Total:</b> {total}
+"""
+MSG_BROADCAST_JOB_NOT_FOUND = "Broadcast not found."
+MSG_BROADCAST_JOB_UNCHANGED = "This broadcast can no longer be changed."
 MSG_ADD_SLUG_FAIL = "❌ A slug with the name `<code>{slug}</code>` already exists."
 MSG_STATS_HEADER = "📊 Bot Statistics"
 
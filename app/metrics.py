@@ -0,0 +1,174 @@
+# app/metrics.py
+"""
+A minimal Prometheus-style metrics registry.
+
+Collectors are plain dicts keyed by label values, so recording a sample is a
+dict lookup and an addition; that keeps them cheap enough to leave on in
+production. Nothing is formatted until /metrics is scraped.
+"""
+import bisect
+import sys
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Any
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values: Any, amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def totals(self) -> dict[tuple, float]:
+        return dict(self._values)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for values, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {value}")
+        return lines
+
+
+class Gauge:
+    """A gauge whose value is read from a callback at scrape time."""
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float] | None = None):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def render(self) -> list[str]:
+        if self.callback is None:
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {self.callback()}"]
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = buckets
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values: Any) -> None:
+        entry = self._values.get(label_values)
+        if entry is None:
+            entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def totals(self) -> dict[tuple, tuple[int, float]]:
+        """(count, sum) per label set, for callers that want numbers rather than text."""
+        return {values: (sum(counts), total) for values, (counts, total) in self._values.items()}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._collectors: dict[str, Counter | Gauge | Histogram] = {}
+
+    def register(self, collector):
+        self._collectors[collector.name] = collector
+        return collector
+
+    def render(self) -> str:
+        lines = []
+        for collector in self._collectors.values():
+            lines.extend(collector.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.register(Histogram(
+    "bot_handler_duration_seconds", "Time spent in update handlers.", ["router", "handler"]))
+WEBHOOK_QUEUE_WAIT = REGISTRY.register(Histogram(
+    "webhook_queue_wait_seconds", "Time acknowledged webhook updates waited for a worker.", ["shard"]))
+BOT_API_LATENCY = REGISTRY.register(Histogram(
+    "bot_api_request_duration_seconds", "Bot API request latency.", ["method"]))
+BOT_API_ERRORS = REGISTRY.register(Counter(
+    "bot_api_errors_total", "Failed Bot API requests.", ["method", "error"]))
+BOT_API_PHASE = REGISTRY.register(Histogram(
+    "bot_api_phase_duration_seconds", "Bot API request phases: waiting for a pooled connection, connecting, "
+    "and time to first byte.", ["method", "phase"]))
+BOT_API_CONNECTIONS = REGISTRY.register(Counter(
+    "bot_api_connections_total", "Connections used for Bot API requests, new or reused from the pool.", ["result"]))
+DB_QUERY_LATENCY = REGISTRY.register(Histogram(
+    "db_query_duration_seconds", "Database query latency, excluding the wait for a connection.", ["site"]))
+DB_POOL_WAIT = REGISTRY.register(Histogram(
+    "db_pool_acquire_duration_seconds", "Time spent waiting for a pool connection.", ["pool"]))
+OUTBOUND_WAIT = REGISTRY.register(Histogram(
+    "bot_api_queue_wait_seconds", "Time Bot API requests waited for the outbound scheduler.", ["lane"]))
+OUTBOUND_PAUSES = REGISTRY.register(Counter(
+    "bot_api_flood_pauses_total", "Times all outbound requests were paused after a RetryAfter."))
+MEMBERSHIP_PREFETCH = REGISTRY.register(Counter(
+    "membership_prefetch_total", "Speculative membership probes by result.", ["result"]))
+BROADCAST_MESSAGES = REGISTRY.register(Counter(
+    "broadcast_messages_total", "Broadcast deliveries by result.", ["result"]))
+
+
+def gauge(name: str, documentation: str, callback: Callable[[], float]) -> Gauge:
+    """Registers (or re-points) a gauge read at scrape time."""
+    return REGISTRY.register(Gauge(name, documentation, callback))
+
+
+def call_site(depth: int = 2, skip: tuple[str, ...] = ()) -> str:
+    """
+    `module.function` of the caller `depth` frames up, passing over frames from the modules in `skip`.
+    Cheap enough to run per query.
+    """
+    frame = sys._getframe(depth)
+    while frame.f_back and frame.f_globals.get("__name__") in skip:
+        frame = frame.f_back
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int, serve_metrics: bool = True,
+                               health: Callable[[web.Request], Awaitable[web.StreamResponse]] | None = None) -> web.AppRunner:
+    """
+    Serves /metrics, and /healthz when `health` is given, on an internal port.
+    They are kept off the public webhook server, which has to be reachable by Telegram.
+    """
+    app = web.Application()
+    if serve_metrics:
+        app.router.add_get("/metrics", handle_metrics)
+    if health:
+        app.router.add_get("/healthz", health)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
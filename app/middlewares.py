@@ -1,18 +1,33 @@
+import logging
 import time
 from collections.abc import Awaitable, Callable
 from typing import Any
 
-from aiogram import BaseMiddleware
-from aiogram.types import CallbackQuery
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.types import CallbackQuery, TelegramObject, Update
+
+from app import metrics
+from app.db import Database
+from app.ratelimit import LocalRateLimiter, PostgresRateLimiter, RateLimitRules
+from app.recorder import UpdateRecorder
+
+log = logging.getLogger(__name__)
 
 
 class AntiSpamMiddleware(BaseMiddleware):
     """
     A middleware to prevent users from spamming callback buttons.
+
+    Each callback prefix can have its own limit. The bounded local limiter
+    rejects most repeats without any I/O; when a shared limiter is configured
+    it is consulted next, so a press can't slip through on another worker.
     """
-    def __init__(self, limit_sec: int = 1):
-        self.limit = limit_sec
-        self.last_requests: dict[int, float] = {}
+    def __init__(self, rules: RateLimitRules, local: LocalRateLimiter, shared: PostgresRateLimiter | None = None):
+        self.rules = rules
+        self.local = local
+        self.shared = shared
 
     async def __call__(
         self,
@@ -20,12 +35,85 @@ class AntiSpamMiddleware(BaseMiddleware):
         event: CallbackQuery,
         data: dict[str, Any],
     ) -> Any:
-        user_id = event.from_user.id
-        current_time = time.monotonic()
+        rule, limit = self.rules.match(event.data)
+        if limit <= 0:
+            return await handler(event, data)
+
+        key = f"{event.from_user.id}:{rule}"
+        allowed = self.local.hit(key, limit)
+        if allowed and self.shared:
+            allowed = await self.shared.hit(key, limit)
 
-        if user_id in self.last_requests and current_time - self.last_requests[user_id] < self.limit:
+        if not allowed:
             await event.answer("Please do not press so often.", show_alert=False)
             return
 
-        self.last_requests[user_id] = current_time
-        return await handler(event, data)
\ No newline at end of file
+        return await handler(event, data)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Inner middleware that records how long each handler takes, labelled by router module and function."""
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        callback = data["handler"].callback
+        router = callback.__module__.rpartition(".")[2]
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.HANDLER_LATENCY.observe(time.perf_counter() - started, router, callback.__name__)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware that records Bot API latency per method and counts failures by error type."""
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            metrics.BOT_API_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            metrics.BOT_API_LATENCY.observe(time.perf_counter() - started, name)
+
+
+class UpdateRecorderMiddleware(BaseMiddleware):
+    """Outer update middleware that captures every incoming update for later replay."""
+    def __init__(self, recorder: UpdateRecorder):
+        self.recorder = recorder
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        try:
+            self.recorder.record(event)
+        except Exception as e:
+            log.error("Failed to record update %d: %s", event.update_id, e)
+        return await handler(event, data)
+
+
+class BackgroundDatabaseMiddleware(BaseMiddleware):
+    """Inner middleware that hands a router's handlers the background pool instead of the main one."""
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        db: Database | None = data.get("db")
+        if db is not None:
+            data["db"] = db.background
+        return await handler(event, data)
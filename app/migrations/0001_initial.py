@@ -0,0 +1,135 @@
+# app/migrations/0001_initial.py
+# The schema as it was before migrations existed. Every statement is idempotent,
+# so this is a no-op on databases created by the old create-on-boot code.
+# The SQL is written out here, not imported, so this migration never changes once applied.
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id BIGINT PRIMARY KEY,
+        chat_id BIGINT NOT NULL,
+        selected_slug TEXT,
+        joined_ok INTEGER DEFAULT 0,
+        created_at TIMESTAMPTZ DEFAULT NOW(),
+        updated_at TIMESTAMPTZ DEFAULT NOW()
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS slugs (
+        slug TEXT PRIMARY KEY,
+        label TEXT NOT NULL,
+        file_id TEXT NOT NULL,
+        active INTEGER DEFAULT 1,
+        created_at TIMESTAMPTZ DEFAULT NOW()
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS events (
+        id SERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        type TEXT NOT NULL,
+        slug TEXT,
+        ts TIMESTAMPTZ DEFAULT NOW()
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS broadcast_jobs (
+        id SERIAL PRIMARY KEY,
+        admin_chat_id BIGINT NOT NULL,
+        from_chat_id BIGINT NOT NULL,
+        message_id BIGINT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'running',
+        cursor_user_id BIGINT NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        locked_by TEXT,
+        locked_until TIMESTAMPTZ,
+        created_at TIMESTAMPTZ DEFAULT NOW(),
+        updated_at TIMESTAMPTZ DEFAULT NOW()
+    );
+    """,
+    # Funnel rollups. A statement-level trigger folds every batch of inserted events
+    # into per-slug/per-day and per-slug totals, so the stats screens never scan `events`.
+    # The trigger and the one-off backfill run in the same transaction, and CREATE TRIGGER
+    # blocks concurrent inserts until it commits, so no event is counted twice or missed.
+    """
+    CREATE TABLE IF NOT EXISTS slug_daily_stats (
+        slug TEXT NOT NULL,
+        day DATE NOT NULL,
+        starts BIGINT NOT NULL DEFAULT 0,
+        verify_ok BIGINT NOT NULL DEFAULT 0,
+        verify_fail BIGINT NOT NULL DEFAULT 0,
+        file_sent BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (slug, day)
+    );
+
+    CREATE TABLE IF NOT EXISTS slug_stats (
+        slug TEXT PRIMARY KEY,
+        starts BIGINT NOT NULL DEFAULT 0,
+        verify_ok BIGINT NOT NULL DEFAULT 0,
+        verify_fail BIGINT NOT NULL DEFAULT 0,
+        file_sent BIGINT NOT NULL DEFAULT 0
+    );
+
+    CREATE OR REPLACE FUNCTION rollup_events() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO slug_daily_stats AS d (slug, day, starts, verify_ok, verify_fail, file_sent)
+        SELECT slug, (ts AT TIME ZONE 'UTC')::date,
+               COUNT(*) FILTER (WHERE type = 'start'),
+               COUNT(*) FILTER (WHERE type = 'verify_ok'),
+               COUNT(*) FILTER (WHERE type = 'verify_fail'),
+               COUNT(*) FILTER (WHERE type = 'file_sent')
+        FROM new_events
+        WHERE slug IS NOT NULL AND type IN ('start', 'verify_ok', 'verify_fail', 'file_sent')
+        GROUP BY 1, 2
+        ON CONFLICT (slug, day) DO UPDATE SET
+            starts = d.starts + excluded.starts,
+            verify_ok = d.verify_ok + excluded.verify_ok,
+            verify_fail = d.verify_fail + excluded.verify_fail,
+            file_sent = d.file_sent + excluded.file_sent;
+
+        INSERT INTO slug_stats AS s (slug, starts, verify_ok, verify_fail, file_sent)
+        SELECT slug,
+               COUNT(*) FILTER (WHERE type = 'start'),
+               COUNT(*) FILTER (WHERE type = 'verify_ok'),
+               COUNT(*) FILTER (WHERE type = 'verify_fail'),
+               COUNT(*) FILTER (WHERE type = 'file_sent')
+        FROM new_events
+        WHERE slug IS NOT NULL AND type IN ('start', 'verify_ok', 'verify_fail', 'file_sent')
+        GROUP BY 1
+        ON CONFLICT (slug) DO UPDATE SET
+            starts = s.starts + excluded.starts,
+            verify_ok = s.verify_ok + excluded.verify_ok,
+            verify_fail = s.verify_fail + excluded.verify_fail,
+            file_sent = s.file_sent + excluded.file_sent;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'events_rollup') THEN
+            CREATE TRIGGER events_rollup AFTER INSERT ON events
+                REFERENCING NEW TABLE AS new_events
+                FOR EACH STATEMENT EXECUTE FUNCTION rollup_events();
+
+            INSERT INTO slug_daily_stats (slug, day, starts, verify_ok, verify_fail, file_sent)
+            SELECT slug, (ts AT TIME ZONE 'UTC')::date,
+                   COUNT(*) FILTER (WHERE type = 'start'),
+                   COUNT(*) FILTER (WHERE type = 'verify_ok'),
+                   COUNT(*) FILTER (WHERE type = 'verify_fail'),
+                   COUNT(*) FILTER (WHERE type = 'file_sent')
+            FROM events
+            WHERE slug IS NOT NULL AND type IN ('start', 'verify_ok', 'verify_fail', 'file_sent')
+            GROUP BY 1, 2
+            ON CONFLICT DO NOTHING;
+
+            INSERT INTO slug_stats (slug, starts, verify_ok, verify_fail, file_sent)
+            SELECT slug, SUM(starts), SUM(verify_ok), SUM(verify_fail), SUM(file_sent)
+            FROM slug_daily_stats GROUP BY slug
+            ON CONFLICT DO NOTHING;
+        END IF;
+    END $$;
+    """,
+]
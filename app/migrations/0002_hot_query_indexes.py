@@ -0,0 +1,15 @@
+# app/migrations/0002_hot_query_indexes.py
+# Indexes for the analytics, export and broadcast query paths, built without locking the tables.
+from app.migrations import create_index_concurrently
+
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    # Per-slug funnel queries and ad-hoc event lookups.
+    *create_index_concurrently("idx_events_slug_type", "events (slug, type)"),
+    # Time-window queries (30-day actives, export --since/--until); user_id makes
+    # COUNT(DISTINCT user_id) an index-only scan.
+    *create_index_concurrently("idx_events_ts_user", "events (ts, user_id)"),
+    # Verified-user counts.
+    *create_index_concurrently("idx_users_joined_ok", "users (joined_ok)"),
+]
@@ -0,0 +1,83 @@
+# app/migrations/0003_partition_events.py
+# Turns `events` into a table range-partitioned by month on `ts`, so old months can be
+# archived and dropped (scripts/archive_events.py) and time-window queries only touch
+# recent partitions.
+#
+# Runs at bot startup, so nothing here scales with the table: the old table is renamed
+# to `events_legacy` and a new, empty partitioned `events` takes its place. Existing rows
+# are moved over in batches by `scripts/migrate.py --move-legacy-events`, which startup
+# never runs. On a new database the empty legacy table is simply dropped.
+
+STATEMENTS = [
+    "ALTER TABLE events RENAME TO events_legacy",
+    # Frees the names for the parent's indexes; the moving script still uses the ts index.
+    "ALTER INDEX IF EXISTS idx_events_slug_type RENAME TO idx_events_legacy_slug_type",
+    "ALTER INDEX IF EXISTS idx_events_ts_user RENAME TO idx_events_legacy_ts_user",
+    """
+    CREATE TABLE events (
+        id BIGINT NOT NULL DEFAULT nextval('events_id_seq'),
+        user_id BIGINT NOT NULL,
+        type TEXT NOT NULL,
+        slug TEXT,
+        ts TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, ts)
+    ) PARTITION BY RANGE (ts)
+    """,
+    "ALTER SEQUENCE events_id_seq AS BIGINT OWNED BY events.id",
+    # Catches rows outside every monthly partition so an insert never fails.
+    "CREATE TABLE events_default PARTITION OF events DEFAULT",
+    """
+    CREATE OR REPLACE FUNCTION create_events_partitions(from_month DATE, months_ahead INTEGER) RETURNS INTEGER AS $$
+    DECLARE
+        month_start DATE := date_trunc('month', from_month)::date;
+        last_month DATE := (date_trunc('month', NOW()) + make_interval(months => months_ahead))::date;
+        partition_name TEXT;
+        created INTEGER := 0;
+    BEGIN
+        WHILE month_start <= last_month LOOP
+            partition_name := format('events_p%s', to_char(month_start, 'YYYY_MM'));
+            IF to_regclass(partition_name) IS NULL THEN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF events FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, month_start::timestamptz, (month_start + INTERVAL '1 month')::timestamptz
+                );
+                created := created + 1;
+            END IF;
+            month_start := (month_start + INTERVAL '1 month')::date;
+        END LOOP;
+        RETURN created;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    SELECT create_events_partitions(
+        COALESCE((SELECT MIN(ts) FROM events_legacy), NOW())::date, 3
+    )
+    """,
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM events_legacy) THEN
+            DROP TABLE events_legacy;
+        END IF;
+    END $$
+    """,
+    """
+    CREATE TRIGGER events_rollup AFTER INSERT ON events
+        REFERENCING NEW TABLE AS new_events
+        FOR EACH STATEMENT EXECUTE FUNCTION rollup_events()
+    """,
+    # Created on the parent, so every partition gets them. The partitions are all empty at this
+    # point, so these take no time; later partitions get them as they are created or attached.
+    "CREATE INDEX idx_events_slug_type ON events (slug, type)",
+    "CREATE INDEX idx_events_ts_user ON events (ts, user_id)",
+    # Counts of every event type per day, filled in for partitions before they are dropped.
+    """
+    CREATE TABLE IF NOT EXISTS event_daily_counts (
+        day DATE NOT NULL,
+        type TEXT NOT NULL,
+        count BIGINT NOT NULL,
+        PRIMARY KEY (day, type)
+    )
+    """,
+]
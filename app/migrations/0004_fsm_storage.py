@@ -0,0 +1,14 @@
+# app/migrations/0004_fsm_storage.py
+# Backing table for app.storage.PostgresStorage: one row per FSM key holding both state and data.
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS fsm_storage (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data JSONB NOT NULL DEFAULT '{}',
+        version INTEGER NOT NULL DEFAULT 1,
+        expires_at TIMESTAMPTZ NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_fsm_storage_expires_at ON fsm_storage (expires_at)",
+]
@@ -0,0 +1,11 @@
+# app/migrations/0005_rate_limits.py
+# Shared state for app.ratelimit.PostgresRateLimiter. UNLOGGED: it is throwaway
+# data, so skipping the WAL is worth losing it on a crash.
+STATEMENTS = [
+    """
+    CREATE UNLOGGED TABLE IF NOT EXISTS rate_limits (
+        key TEXT PRIMARY KEY,
+        last_at TIMESTAMPTZ NOT NULL
+    )
+    """,
+]
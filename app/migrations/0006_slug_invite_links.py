@@ -0,0 +1,11 @@
+# app/migrations/0006_slug_invite_links.py
+# Per-slug join-request invite links for UNLOCK_MODE=join_request. The link name is
+# how an incoming chat_join_request is mapped back to its slug.
+STATEMENTS = [
+    """
+    ALTER TABLE slugs
+        ADD COLUMN IF NOT EXISTS invite_link TEXT,
+        ADD COLUMN IF NOT EXISTS invite_link_name TEXT
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_slugs_invite_link_name ON slugs (invite_link_name)",
+]
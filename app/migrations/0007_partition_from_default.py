@@ -0,0 +1,39 @@
+# app/migrations/0007_partition_from_default.py
+# create_events_partitions now runs on a timer in every worker. A month that is
+# missing its partition collects rows in events_default, and attaching a
+# partition over rows already in the default fails. So the partition is built
+# as a plain table, the month's rows are moved into it, and then it is attached.
+STATEMENTS = [
+    """
+    CREATE OR REPLACE FUNCTION create_events_partitions(from_month DATE, months_ahead INTEGER) RETURNS INTEGER AS $$
+    DECLARE
+        month_start DATE := date_trunc('month', from_month)::date;
+        last_month DATE := (date_trunc('month', NOW()) + make_interval(months => months_ahead))::date;
+        partition_name TEXT;
+        created INTEGER := 0;
+    BEGIN
+        -- Serialises workers so two of them never build the same partition.
+        PERFORM pg_advisory_xact_lock(hashtext('create_events_partitions'));
+        WHILE month_start <= last_month LOOP
+            partition_name := format('events_p%s', to_char(month_start, 'YYYY_MM'));
+            IF to_regclass(partition_name) IS NULL THEN
+                EXECUTE format('CREATE TABLE %I (LIKE events INCLUDING DEFAULTS)', partition_name);
+                -- Not inserted through `events`, so the rollup trigger doesn't count these rows twice.
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM events_default WHERE ts >= %L AND ts < %L RETURNING *) '
+                    'INSERT INTO %I SELECT * FROM moved',
+                    month_start::timestamptz, (month_start + INTERVAL '1 month')::timestamptz, partition_name
+                );
+                EXECUTE format(
+                    'ALTER TABLE events ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, month_start::timestamptz, (month_start + INTERVAL '1 month')::timestamptz
+                );
+                created := created + 1;
+            END IF;
+            month_start := (month_start + INTERVAL '1 month')::date;
+        END LOOP;
+        RETURN created;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+]
@@ -0,0 +1,130 @@
+# app/migrations/0008_incremental_totals.py
+# Keeps the /stats totals current with triggers, so they are read from a few small
+# rows instead of counting `users` and 30 days of `events` on demand.
+#
+# User counts are spread over USER_TOTAL_SHARDS rows, picked by backend pid, so
+# concurrent sign-ups don't all queue on one row lock. Activity is tracked as
+# each user's last active day plus the number of users per last active day, so
+# "active in the last 30 days" is a sum over at most 30 rows.
+#
+# Both tables are locked for the backfill, so no write is missed or counted twice.
+USER_TOTAL_SHARDS = 16
+
+STATEMENTS = [
+    "LOCK TABLE users, events IN SHARE MODE",
+    # Left behind by builds that refreshed the totals on a timer.
+    "DROP TABLE IF EXISTS stats_totals",
+    """
+    CREATE TABLE user_totals (
+        shard INTEGER PRIMARY KEY,
+        total_users BIGINT NOT NULL DEFAULT 0,
+        joined_users BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    f"INSERT INTO user_totals (shard) SELECT generate_series(0, {USER_TOTAL_SHARDS - 1})",
+    """
+    UPDATE user_totals SET
+        total_users = (SELECT COUNT(*) FROM users),
+        joined_users = (SELECT COUNT(*) FROM users WHERE joined_ok = 1)
+    WHERE shard = 0
+    """,
+    f"""
+    CREATE FUNCTION count_users() RETURNS trigger AS $$
+    DECLARE
+        total_delta BIGINT := 0;
+        joined_delta BIGINT := 0;
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            SELECT COUNT(*), COUNT(*) FILTER (WHERE joined_ok = 1) INTO total_delta, joined_delta FROM new_users;
+        ELSIF TG_OP = 'UPDATE' THEN
+            joined_delta := (SELECT COUNT(*) FROM new_users WHERE joined_ok = 1)
+                          - (SELECT COUNT(*) FROM old_users WHERE joined_ok = 1);
+        ELSE
+            SELECT -COUNT(*), -COUNT(*) FILTER (WHERE joined_ok = 1) INTO total_delta, joined_delta FROM old_users;
+        END IF;
+        IF total_delta <> 0 OR joined_delta <> 0 THEN
+            UPDATE user_totals SET total_users = total_users + total_delta, joined_users = joined_users + joined_delta
+            WHERE shard = pg_backend_pid() % {USER_TOTAL_SHARDS};
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    # Transition tables need one trigger per event.
+    """
+    CREATE TRIGGER users_count_insert AFTER INSERT ON users
+        REFERENCING NEW TABLE AS new_users
+        FOR EACH STATEMENT EXECUTE FUNCTION count_users()
+    """,
+    """
+    CREATE TRIGGER users_count_update AFTER UPDATE ON users
+        REFERENCING OLD TABLE AS old_users NEW TABLE AS new_users
+        FOR EACH STATEMENT EXECUTE FUNCTION count_users()
+    """,
+    """
+    CREATE TRIGGER users_count_delete AFTER DELETE ON users
+        REFERENCING OLD TABLE AS old_users
+        FOR EACH STATEMENT EXECUTE FUNCTION count_users()
+    """,
+    """
+    CREATE TABLE user_last_active (
+        user_id BIGINT PRIMARY KEY,
+        day DATE NOT NULL,
+        -- The day before the last move, so the trigger can take the user off that day's count.
+        prev_day DATE
+    )
+    """,
+    """
+    CREATE TABLE active_users_by_day (
+        day DATE PRIMARY KEY,
+        users BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    # Users last seen before the window can be left out: taking them off an old day changes nothing.
+    # Rows still waiting in events_legacy count too; moving them later bypasses the trigger.
+    """
+    DO $$
+    DECLARE
+        source TEXT := 'SELECT user_id, ts FROM events';
+    BEGIN
+        IF to_regclass('events_legacy') IS NOT NULL THEN
+            source := source || ' UNION ALL SELECT user_id, ts FROM events_legacy';
+        END IF;
+        EXECUTE format(
+            'INSERT INTO user_last_active (user_id, day) '
+            'SELECT user_id, MAX((ts AT TIME ZONE %L)::date) FROM (%s) e '
+            'WHERE ts >= NOW() - INTERVAL %L GROUP BY user_id',
+            'UTC', source, '31 days'
+        );
+    END $$
+    """,
+    "INSERT INTO active_users_by_day (day, users) SELECT day, COUNT(*) FROM user_last_active GROUP BY day",
+    """
+    CREATE FUNCTION track_activity() RETURNS trigger AS $$
+    BEGIN
+        WITH latest AS (
+            SELECT user_id, MAX((ts AT TIME ZONE 'UTC')::date) AS day FROM new_events GROUP BY user_id
+        ), moved AS (
+            INSERT INTO user_last_active AS u (user_id, day)
+            SELECT user_id, day FROM latest
+            ON CONFLICT (user_id) DO UPDATE SET prev_day = u.day, day = excluded.day
+            WHERE u.day < excluded.day
+            RETURNING day, prev_day
+        ), deltas AS (
+            SELECT day, 1 AS n FROM moved
+            UNION ALL
+            SELECT prev_day, -1 FROM moved WHERE prev_day IS NOT NULL
+        )
+        INSERT INTO active_users_by_day AS a (day, users)
+        SELECT day, SUM(n) FROM deltas GROUP BY day
+        ON CONFLICT (day) DO UPDATE SET users = a.users + excluded.users;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER events_activity AFTER INSERT ON events
+        REFERENCING NEW TABLE AS new_events
+        FOR EACH STATEMENT EXECUTE FUNCTION track_activity()
+    """,
+]
@@ -0,0 +1,107 @@
+# app/migrations/__init__.py
+"""
+A small, ordered schema migration runner.
+
+Each migration is a module in this package named `NNNN_description.py` that defines
+`STATEMENTS`, a list of SQL strings, and optionally `TRANSACTIONAL = False`.
+Transactional migrations run in a single transaction together with their
+schema_version row. Non-transactional ones (needed for CREATE INDEX CONCURRENTLY)
+run statement by statement and must therefore be safe to re-run.
+"""
+import asyncio
+import importlib
+import logging
+import pkgutil
+import re
+from dataclasses import dataclass
+
+import asyncpg
+
+log = logging.getLogger(__name__)
+
+# Arbitrary key for the advisory lock that serialises migrations across workers.
+MIGRATION_LOCK_ID = 0x6D696772
+MIGRATION_LOCK_POLL_SEC = 0.5
+
+CREATE_SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMPTZ DEFAULT NOW()
+);
+"""
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    statements: list[str]
+    transactional: bool = True
+
+
+def load_migrations() -> list[Migration]:
+    """Discovers the migration modules in this package, ordered by version."""
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        match = re.fullmatch(r"(\d{4})_(\w+)", module_info.name)
+        if not match:
+            continue
+        module = importlib.import_module(f"{__name__}.{module_info.name}")
+        migrations.append(Migration(
+            version=int(match.group(1)),
+            name=match.group(2),
+            statements=list(module.STATEMENTS),
+            transactional=getattr(module, "TRANSACTIONAL", True),
+        ))
+    return sorted(migrations, key=lambda m: m.version)
+
+
+async def get_applied_versions(connection: asyncpg.Connection) -> set[int]:
+    await connection.execute(CREATE_SCHEMA_VERSION_TABLE)
+    rows = await connection.fetch("SELECT version FROM schema_version")
+    return {row["version"] for row in rows}
+
+
+async def apply_migrations(connection: asyncpg.Connection) -> list[Migration]:
+    """Applies every pending migration and returns the ones that were applied."""
+    # Poll instead of blocking in pg_advisory_lock: a waiting statement is an open
+    # transaction, and CREATE INDEX CONCURRENTLY in the lock holder would wait for it.
+    while not await connection.fetchval("SELECT pg_try_advisory_lock($1)", MIGRATION_LOCK_ID):
+        await asyncio.sleep(MIGRATION_LOCK_POLL_SEC)
+    try:
+        applied = await get_applied_versions(connection)
+        pending = [m for m in load_migrations() if m.version not in applied]
+        for migration in pending:
+            log.info("Applying migration %04d_%s...", migration.version, migration.name)
+            if migration.transactional:
+                async with connection.transaction():
+                    for statement in migration.statements:
+                        await connection.execute(statement)
+                    await _record(connection, migration)
+            else:
+                for statement in migration.statements:
+                    await connection.execute(statement)
+                await _record(connection, migration)
+        if pending:
+            log.info("Applied %d migration(s).", len(pending))
+        return pending
+    finally:
+        await connection.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+
+async def _record(connection: asyncpg.Connection, migration: Migration) -> None:
+    await connection.execute(
+        "INSERT INTO schema_version (version, name) VALUES ($1, $2)", migration.version, migration.name
+    )
+
+
+def create_index_concurrently(name: str, definition: str) -> list[str]:
+    """
+    Builds an index without blocking writes. A failed concurrent build leaves an
+    INVALID index behind, so any leftover is dropped before building again.
+    """
+    return [
+        f"DROP INDEX CONCURRENTLY IF EXISTS {name}",
+        f"CREATE INDEX CONCURRENTLY {name} ON {definition}",
+    ]
@@ -0,0 +1,191 @@
+# app/outbound.py
+"""
+A scheduler for everything the bot sends to Telegram.
+
+Telegram limits a bot to roughly 30 messages per second overall and about one
+per second in any single chat, and a 429 applies to the whole bot. Every
+message-sending request therefore waits here for its chat's bucket and then for
+a global token, which goes to interactive requests before bulk ones. Other
+requests (getChatMember, answerCallbackQuery, ...) only wait out a RetryAfter.
+
+The lane is taken from a context variable, so work like broadcasts marks itself
+with `bulk_lane()` once and everything it sends is scheduled behind users.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager, suppress
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+
+from app import metrics
+
+log = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+_lane: contextvars.ContextVar[str] = contextvars.ContextVar("outbound_lane", default=INTERACTIVE)
+
+# Requests that post into a chat and count against the message limits.
+RATE_LIMITED_PREFIXES = ("send", "copy", "forward", "edit")
+# Per-chat buckets are dropped once this many chats are tracked; only full (idle) ones are dropped.
+MAX_TRACKED_CHATS = 50_000
+
+
+@contextmanager
+def bulk_lane() -> Iterator[None]:
+    """Schedules requests made in this context, and in tasks started from it, behind interactive ones."""
+    token = _lane.set(BULK)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def _is_rate_limited(method: TelegramMethod) -> bool:
+    return method.__api_method__.startswith(RATE_LIMITED_PREFIXES) and getattr(method, "chat_id", None) is not None
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Session middleware that paces message-sending requests.
+
+    Global tokens are issued evenly at `global_per_sec` and handed out by a single
+    dispatcher task: interactive waiters first, bulk ones only when no
+    interactive request is waiting. Each chat has its own bucket of
+    `per_chat_burst` messages refilled at `per_chat_per_sec`.
+
+    A RetryAfter pauses every lane for the requested time. The failed request is
+    retried once after the pause when the pause is at most `max_retry_wait`
+    seconds; otherwise the error reaches the caller.
+    """
+    def __init__(self, global_per_sec: float = 30, per_chat_per_sec: float = 1.0, per_chat_burst: int = 3,
+                 max_retry_wait: float = 10):
+        self.global_per_sec = global_per_sec
+        self.per_chat_per_sec = per_chat_per_sec
+        self.per_chat_burst = per_chat_burst
+        self.max_retry_wait = max_retry_wait
+        # No burst allowance: Telegram counts sends over a sliding second, so tokens are spread evenly.
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: dict[str, deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._chats: dict[int | str, list[float]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        for lane in LANES:
+            metrics.gauge(f"bot_api_queue_{lane}", f"Requests waiting in the {lane} lane.",
+                          lambda lane=lane: len(self._waiters[lane]))
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Response:
+        lane = _lane.get()
+        limited = _is_rate_limited(method)
+        retried = False
+        while True:
+            started = time.monotonic()
+            if limited:
+                await self._wait_for_chat(method.chat_id)
+                await self._wait_for_token(lane)
+            else:
+                await self._wait_for_pause()
+            metrics.OUTBOUND_WAIT.observe(time.monotonic() - started, lane)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.pause(e.retry_after)
+                if retried or e.retry_after > self.max_retry_wait:
+                    raise
+                log.warning("Retrying %s after flood control (%ds).", method.__api_method__, e.retry_after)
+                retried = True
+
+    def pause(self, seconds: float) -> None:
+        """Holds back every lane for `seconds`, e.g. after a 429."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # Start from an empty bucket after the pause so we don't burst straight into another 429.
+        self._tokens = 0
+        self._updated = self._paused_until
+        metrics.OUTBOUND_PAUSES.inc()
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _wait_for_pause(self) -> None:
+        while (delay := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    async def _wait_for_chat(self, chat_id: int | str) -> None:
+        while True:
+            now = time.monotonic()
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                if len(self._chats) >= MAX_TRACKED_CHATS:
+                    self._prune(now)
+                bucket = self._chats[chat_id] = [float(self.per_chat_burst), now]
+            bucket[0] = min(self.per_chat_burst, bucket[0] + (now - bucket[1]) * self.per_chat_per_sec)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return
+            await asyncio.sleep((1 - bucket[0]) / self.per_chat_per_sec)
+
+    def _prune(self, now: float) -> None:
+        refill_sec = self.per_chat_burst / self.per_chat_per_sec
+        self._chats = {chat_id: bucket for chat_id, bucket in self._chats.items() if now - bucket[1] < refill_sec}
+
+    async def _wait_for_token(self, lane: str) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch())
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(waiter)
+        self._wakeup.set()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The token was granted just as the caller gave up; hand it back.
+                self._tokens = min(1.0, self._tokens + 1)
+            else:
+                with suppress(ValueError):
+                    self._waiters[lane].remove(waiter)
+            raise
+
+    def _next_waiter(self) -> asyncio.Future | None:
+        for lane in LANES:
+            waiters = self._waiters[lane]
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    return waiter
+        return None
+
+    async def _dispatch(self) -> None:
+        while True:
+            if not any(self._waiters.values()):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._wait_for_pause()
+            now = time.monotonic()
+            self._tokens = min(1.0, self._tokens + max(0.0, now - self._updated) * self.global_per_sec)
+            self._updated = now
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.global_per_sec)
+                continue
+            waiter = self._next_waiter()
+            if waiter is not None:
+                self._tokens -= 1
+                waiter.set_result(None)
@@ -0,0 +1,110 @@
+# app/ratelimit.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from app.db import Database
+
+log = logging.getLogger(__name__)
+
+
+class LocalRateLimiter:
+    """
+    An in-process limiter with bounded memory.
+
+    Keys live in an LRU ordered by last hit. Stale keys (older than the longest
+    limit) are evicted from the cold end on every hit, and the LRU never holds
+    more than `max_size` keys, so memory stays flat however many users show up.
+    """
+    def __init__(self, max_size: int = 100_000, max_limit_sec: float = 60):
+        self.max_size = max_size
+        self.max_limit_sec = max_limit_sec
+        self._last: OrderedDict[str, float] = OrderedDict()
+
+    def hit(self, key: str, limit_sec: float) -> bool:
+        """Records a hit and returns whether it is allowed."""
+        now = time.monotonic()
+        last = self._last.get(key)
+        if last is not None and now - last < limit_sec:
+            return False
+        self._last[key] = now
+        self._last.move_to_end(key)
+        while self._last:
+            oldest_key, oldest = next(iter(self._last.items()))
+            if len(self._last) <= self.max_size and now - oldest < self.max_limit_sec:
+                break
+            del self._last[oldest_key]
+        return True
+
+    def __len__(self) -> int:
+        return len(self._last)
+
+
+class PostgresRateLimiter:
+    """
+    A limiter shared by all workers through the unlogged `rate_limits` table.
+
+    A hit is one atomic upsert that only moves `last_at` forward if the previous
+    hit is older than the limit, so two workers can't both let the same press through.
+    """
+    def __init__(self, db: Database, max_limit_sec: float = 60, purge_interval: float = 300):
+        self.db = db
+        self.max_limit_sec = max_limit_sec
+        self.purge_interval = purge_interval
+        self._task: asyncio.Task | None = None
+
+    async def hit(self, key: str, limit_sec: float) -> bool:
+        query = """
+        INSERT INTO rate_limits (key, last_at) VALUES (?, clock_timestamp())
+        ON CONFLICT (key) DO UPDATE SET last_at = excluded.last_at
+        WHERE rate_limits.last_at < excluded.last_at - make_interval(secs => ?)
+        RETURNING 1 AS allowed
+        """
+        try:
+            return await self.db.fetchrow(query, (key, float(limit_sec))) is not None
+        except Exception as e:
+            # Never lock users out because the limiter's backend is unavailable.
+            log.error("Shared rate limiter failed, allowing request: %s", e)
+            return True
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._purge_loop())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _purge_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            try:
+                await self.db.execute(
+                    "DELETE FROM rate_limits WHERE last_at < NOW() - make_interval(secs => ?)", (float(self.max_limit_sec),)
+                )
+            except Exception as e:
+                log.error("Failed to purge rate limit rows: %s", e)
+
+
+class RateLimitRules:
+    """Maps callback data to a limit by its longest matching prefix."""
+    def __init__(self, default_sec: float, by_prefix: dict[str, float]):
+        self.default_sec = default_sec
+        # Longest prefixes first, so "send:" wins over "s".
+        self.by_prefix = sorted(by_prefix.items(), key=lambda item: len(item[0]), reverse=True)
+
+    @property
+    def max_sec(self) -> float:
+        return max([self.default_sec, *(limit for _, limit in self.by_prefix)])
+
+    def match(self, data: str | None) -> tuple[str, float]:
+        """Returns the rule name (used in the key) and its limit."""
+        for prefix, limit in self.by_prefix:
+            if data and data.startswith(prefix):
+                return prefix, limit
+        return "*", self.default_sec
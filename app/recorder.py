@@ -0,0 +1,90 @@
+# app/recorder.py
+"""
+Capture of incoming updates to rotating JSONL files, for replay with scripts/replay_updates.py.
+
+Every line is `{"ts": <unix time>, "update": <update JSON>}`. Updates are
+anonymized before they are written: user and chat ids are replaced by stable
+keyed pseudonyms, names and usernames are redacted, and so is free text typed
+by users. Commands, callback data and the bot's own messages are kept,
+since handlers branch on them.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import random
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Any
+
+from aiogram.types import Update
+
+log = logging.getLogger(__name__)
+
+PERSONAL_FIELDS = {"first_name", "last_name", "username", "phone_number", "bio", "vcard", "title"}
+TEXT_FIELDS = {"text", "caption"}
+# Integer fields holding a user or chat id, besides entities' own `id`: user_id, user_chat_id, migrate_to_chat_id, ...
+ID_FIELD_SUFFIXES = ("user_id", "chat_id")
+REDACTED = "redacted"
+
+
+class Anonymizer:
+    """Rewrites update JSON in place of personal data; the same id always maps to the same pseudonym."""
+    def __init__(self, salt: str):
+        self._key = salt.encode()
+
+    def pseudonym(self, value: int) -> int:
+        digest = hmac.new(self._key, str(abs(value)).encode(), hashlib.sha256).digest()
+        # 48 bits keeps pseudonyms inside the range Telegram ids use; the sign tells groups from users.
+        pseudonym = int.from_bytes(digest[:6], "big") or 1
+        return -pseudonym if value < 0 else pseudonym
+
+    def anonymize(self, value: Any, from_bot: bool = False) -> Any:
+        if isinstance(value, list):
+            return [self.anonymize(item, from_bot) for item in value]
+        if not isinstance(value, dict):
+            return value
+        # Users carry `is_bot` and chats carry `type`; other objects' `id` fields are not personal.
+        is_entity = "id" in value and ("is_bot" in value or "type" in value)
+        sender = value.get("from")
+        if isinstance(sender, dict):
+            from_bot = bool(sender.get("is_bot"))
+        result = {}
+        for key, item in value.items():
+            if key in PERSONAL_FIELDS and isinstance(item, str):
+                # Replaced rather than dropped, since some of these fields are required by the models.
+                result[key] = REDACTED
+            elif isinstance(item, int) and ((key == "id" and is_entity) or key.endswith(ID_FIELD_SUFFIXES)):
+                result[key] = self.pseudonym(item)
+            elif key in TEXT_FIELDS and isinstance(item, str) and not from_bot and not item.startswith("/"):
+                result[key] = REDACTED
+            else:
+                result[key] = self.anonymize(item, from_bot)
+        return result
+
+
+class UpdateRecorder:
+    """Appends anonymized updates to `path`, rotating it at `max_bytes` and keeping `backups` old files."""
+    def __init__(self, path: str, salt: str, max_bytes: int = 100 * 1024 * 1024, backups: int = 5,
+                 sample_rate: float = 1.0):
+        self.anonymizer = Anonymizer(salt)
+        self.sample_rate = sample_rate
+        self.recorded = 0
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        # A private logger gives us the stdlib's rotation without any of it reaching the app logs.
+        self._logger = logging.Logger(f"{__name__}.updates", level=logging.INFO)
+        self._logger.addHandler(handler)
+
+    def record(self, update: Update) -> None:
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        payload = update.model_dump(mode="json", exclude_none=True, by_alias=True)
+        line = json.dumps({"ts": time.time(), "update": self.anonymizer.anonymize(payload)},
+                          ensure_ascii=False, separators=(",", ":"))
+        self._logger.info(line)
+        self.recorded += 1
+
+    def close(self) -> None:
+        for handler in self._logger.handlers:
+            handler.close()
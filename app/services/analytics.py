@@ -1,13 +1,138 @@
 # app/services/analytics.py
+import asyncio
 import logging
+from datetime import datetime, timezone
 
-from app.db import Database
+from app import metrics
+from app.db import Database, DatabaseUnavailableError
+from app.services.spool import spool
 
 log = logging.getLogger(__name__)
 
+EVENT_COLUMNS = ["user_id", "type", "slug", "ts"]
+# Monthly `events` partitions are created this many months ahead of time.
+PARTITION_MONTHS_AHEAD = 3
+
+
+class EventSink:
+    """
+    Buffers events in memory and writes them in batches with COPY.
+
+    A batch is flushed when `batch_size` events are buffered or every
+    `flush_interval` seconds, whichever comes first, and once more on shutdown.
+
+    Backpressure: the buffer never grows past `max_pending`. Analytics must not
+    slow down the funnel, so once it is full new events are dropped and
+    counted in `dropped` instead of making handlers wait.
+    """
+    def __init__(self, db: Database, batch_size: int = 500, flush_interval: float = 1.0, max_pending: int = 50_000):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._buffer: list[tuple] = []
+        self._batch_ready = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+        metrics.gauge("event_sink_pending", "Analytics events waiting to be written.", lambda: len(self._buffer))
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            # Let the loop finish a flush that is already writing instead of cancelling it midway.
+            self._stopping = True
+            self._batch_ready.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        await self.flush()
+        if self.dropped:
+            log.warning("Event sink dropped %d events because the buffer was full.", self.dropped)
+
+    def put(self, user_id: int, event_type: str, slug: str | None) -> None:
+        if len(self._buffer) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._buffer.append((user_id, event_type, slug, datetime.now(timezone.utc)))
+        if len(self._buffer) >= self.batch_size:
+            self._batch_ready.set()
+
+    async def flush(self) -> None:
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        try:
+            await self.db.copy_records("events", batch, EVENT_COLUMNS)
+            log.debug("Flushed %d events.", len(batch))
+        except asyncio.CancelledError:
+            # Whether the COPY got through is unknown; keeping the batch risks duplicates rather than a loss.
+            self._buffer = batch + self._buffer
+            raise
+        except DatabaseUnavailableError as e:
+            if not spool.enabled:
+                self._keep(batch, e)
+                return
+            # Nothing to gain from holding them in memory until the database is back.
+            for user_id, event_type, slug, ts in batch:
+                spool.write("event", user_id=user_id, type=event_type, slug=slug, ts=ts.isoformat())
+            log.warning("Database unavailable, spooled %d events.", len(batch))
+        except Exception as e:
+            self._keep(batch, e)
+
+    def _keep(self, batch: list[tuple], error: Exception) -> None:
+        log.error("Failed to flush %d events, will retry: %s", len(batch), error)
+        # Keep the failed batch for the next flush, within the same bound as new events.
+        keep = batch[:max(self.max_pending - len(self._buffer), 0)]
+        self.dropped += len(batch) - len(keep)
+        self._buffer = keep + self._buffer
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            await self.flush()
+
+
+async def _replay_events(db: Database, records: list[dict]) -> None:
+    rows = [(r["user_id"], r["type"], r["slug"], datetime.fromisoformat(r["ts"])) for r in records]
+    await db.copy_records("events", rows, EVENT_COLUMNS)
+
+
+spool.register("event", _replay_events)
+
+sink: EventSink | None = None
+
+
+def start_sink(db: Database, batch_size: int, flush_interval: float, max_pending: int) -> EventSink:
+    global sink
+    sink = EventSink(db, batch_size=batch_size, flush_interval=flush_interval, max_pending=max_pending)
+    sink.start()
+    return sink
+
+
+async def stop_sink() -> None:
+    global sink
+    if sink:
+        await sink.stop()
+        sink = None
+
 
 async def log_event(db: Database, user_id: int, event_type: str, slug: str | None = None):
-    """Logs a user event to the database."""
+    """Logs a user event. Returns immediately when the event sink is running."""
+    if sink and sink.running:
+        sink.put(user_id, event_type, slug)
+        log.debug("Queued event '%s' for user %d (slug: %s)", event_type, user_id, slug)
+        return
     query = "INSERT INTO events (user_id, type, slug) VALUES (?, ?, ?)"
     try:
         await db.execute(query, (user_id, event_type, slug))
@@ -16,46 +141,72 @@ async def log_event(db: Database, user_id: int, event_type: str, slug: str | Non
         log.error("Failed to log event for user %d: %s", user_id, e)
 
 
-async def get_stats(db: Database) -> dict:
-    """Retrieves various statistics from the database."""
-    total_users_q = "SELECT COUNT(*) as count FROM users"
-    joined_users_q = "SELECT COUNT(*) as count FROM users WHERE joined_ok = 1"
-    
-    # THE FIX IS HERE: Using PostgreSQL's interval syntax
-    active_30d_q = "SELECT COUNT(DISTINCT user_id) as count FROM events WHERE ts >= NOW() - INTERVAL '30 days'"
+async def ensure_event_partitions(db: Database, months_ahead: int = PARTITION_MONTHS_AHEAD) -> None:
+    """Creates the monthly `events` partitions for the current month and the next few."""
+    await db.execute("SELECT create_events_partitions(CURRENT_DATE, ?)", (months_ahead,))
+
+
+async def _maintain_partitions(db: Database, interval_sec: float) -> None:
+    while True:
+        await asyncio.sleep(interval_sec)
+        try:
+            await ensure_event_partitions(db)
+        except Exception as e:
+            log.error("Failed to create event partitions, will retry: %s", e)
+
+
+_partition_task: asyncio.Task | None = None
+
 
-    total_users = (await db.fetchone(total_users_q) or {}).get("count", 0)
-    joined_users = (await db.fetchone(joined_users_q) or {}).get("count", 0)
-    active_30d = (await db.fetchone(active_30d_q) or {}).get("count", 0)
+def start_partition_timer(db: Database, interval_sec: float) -> None:
+    """Keeps creating partitions ahead of time, so a long-running worker never outlives the last one."""
+    global _partition_task
+    _partition_task = asyncio.create_task(_maintain_partitions(db, interval_sec))
+
+
+async def stop_partition_timer() -> None:
+    global _partition_task
+    if _partition_task:
+        _partition_task.cancel()
+        try:
+            await _partition_task
+        except asyncio.CancelledError:
+            pass
+        _partition_task = None
+
+
+async def get_stats(db: Database) -> dict:
+    """Retrieves various statistics from the rollup tables."""
+    # Kept current by triggers on `users` and `events` (migration 0008); each sum reads at most a few dozen rows.
+    totals_q = """
+    SELECT
+        (SELECT COALESCE(SUM(total_users), 0)::bigint FROM user_totals) AS total_users,
+        (SELECT COALESCE(SUM(joined_users), 0)::bigint FROM user_totals) AS joined_users,
+        (SELECT COALESCE(SUM(users), 0)::bigint FROM active_users_by_day
+         WHERE day > (NOW() AT TIME ZONE 'UTC')::date - 30) AS active_30d
+    """
+    totals = await db.fetchone(totals_q) or {}
 
     per_slug_stats_q = """
     SELECT
         s.slug, s.label,
-        COALESCE(starts.count, 0) as starts,
-        COALESCE(verifies.count, 0) as verifies,
-        COALESCE(sends.count, 0) as sends
+        COALESCE(r.starts, 0) as starts,
+        COALESCE(r.verify_ok, 0) as verifies,
+        COALESCE(r.file_sent, 0) as sends
     FROM slugs s
-    LEFT JOIN (SELECT slug, COUNT(*) as count FROM events WHERE type = 'start' GROUP BY slug) starts ON s.slug = starts.slug
-    LEFT JOIN (SELECT slug, COUNT(*) as count FROM events WHERE type = 'verify_ok' GROUP BY slug) verifies ON s.slug = verifies.slug
-    LEFT JOIN (SELECT slug, COUNT(*) as count FROM events WHERE type = 'file_sent' GROUP BY slug) sends ON s.slug = sends.slug
+    LEFT JOIN slug_stats r ON s.slug = r.slug
     """
     per_slug_stats = await db.fetchall(per_slug_stats_q)
 
     return {
-        "total_users": total_users,
-        "joined_users": joined_users,
-        "active_30d": active_30d,
+        "total_users": totals.get("total_users", 0),
+        "joined_users": totals.get("joined_users", 0),
+        "active_30d": totals.get("active_30d", 0),
         "per_slug": per_slug_stats
     }
 
 async def get_slug_performance(db: Database, slug_id: str) -> dict:
-    """Retrieves performance statistics for a single slug."""
-    starts_q = "SELECT COUNT(*) as count FROM events WHERE type = 'start' AND slug = ?"
-    verifies_q = "SELECT COUNT(*) as count FROM events WHERE type = 'verify_ok' AND slug = ?"
-    sends_q = "SELECT COUNT(*) as count FROM events WHERE type = 'file_sent' AND slug = ?"
-
-    starts = (await db.fetchone(starts_q, (slug_id,)) or {}).get("count", 0)
-    verifies = (await db.fetchone(verifies_q, (slug_id,)) or {}).get("count", 0)
-    sends = (await db.fetchone(sends_q, (slug_id,)) or {}).get("count", 0)
-
-    return {"starts": starts, "verifies": verifies, "sends": sends}
\ No newline at end of file
+    """Retrieves performance statistics for a single slug from the rollup table."""
+    query = "SELECT starts, verify_ok, file_sent FROM slug_stats WHERE slug = ?"
+    row = await db.fetchone(query, (slug_id,)) or {}
+    return {"starts": row.get("starts", 0), "verifies": row.get("verify_ok", 0), "sends": row.get("file_sent", 0)}
@@ -1,66 +1,355 @@
 import asyncio
 import logging
+import os
+import random
+import socket
+import time
+from collections import deque
+from typing import Any
 
 from aiogram import Bot
-from aiogram.exceptions import TelegramAPIError
-from aiogram.types import Message
+from aiogram.exceptions import (TelegramAPIError, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter,
+                                TelegramServerError)
 
+from app import metrics
 from app.db import Database
+from app.outbound import bulk_lane
 from app.services.analytics import log_event
 
 log = logging.getLogger(__name__)
 
+# Transient errors are retried with exponential backoff and full jitter, starting from this delay.
+RETRY_BASE_DELAY = 0.5
 
-async def get_all_chat_ids(db: Database) -> list[int]:
-    """Fetches all user chat_ids from the database."""
-    query = "SELECT chat_id FROM users"
-    rows = await db.fetchall(query)
-    return [row["chat_id"] for row in rows]
+# Job states
+RUNNING = "running"
+PAUSED = "paused"
+CANCELLED = "cancelled"
+DONE = "done"
 
+# Progress is written back this often; it also renews the job's lease.
+CHECKPOINT_INTERVAL = 2.0
+# A job whose lease has expired is assumed orphaned and may be claimed by any worker.
+JOB_LEASE_SEC = 60
+JOB_LEASE = f"INTERVAL '{JOB_LEASE_SEC} seconds'"
+# Senders stop if the lease couldn't be renewed for this long, well before another worker may claim the job.
+LEASE_RENEW_DEADLINE = JOB_LEASE_SEC - 5 * CHECKPOINT_INTERVAL
 
-async def send_broadcast(
-    bot: Bot,
-    db: Database,
-    from_chat_id: int,
-    message: Message,
-    rate_limit_sec: int
-):
-    """Sends a broadcast message to all users."""
-    chat_ids = await get_all_chat_ids(db)
-    user_count = len(chat_ids)
-    log.info("Starting broadcast to %d users.", user_count)
+# Recipients are read in keyset pages of this size, with at most two pages buffered ahead of the senders.
+RECIPIENT_PAGE_SIZE = 1000
+# Below this many estimated rows an exact COUNT(*) is cheap enough.
+EXACT_COUNT_THRESHOLD = 100_000
 
-    sleep_interval = 1 / rate_limit_sec
-    success_count = 0
-    fail_count = 0
 
-    for chat_id in chat_ids:
+class TokenBucket:
+    """
+    A token bucket shared by all broadcast senders.
+
+    `pause` stops every sender at once, which is how a RetryAfter from Telegram
+    is honoured globally instead of per sender.
+    """
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + max(0.0, now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # Start from an empty bucket after the pause so we don't burst straight into another 429.
+        self._tokens = 0
+        self._updated = self._paused_until
+
+
+async def count_recipients(db: Database) -> int:
+    """Counts broadcast recipients, using the planner's estimate once the table is large."""
+    row = await db.fetchone("SELECT reltuples::bigint AS estimate FROM pg_class WHERE oid = 'users'::regclass")
+    estimate = row["estimate"] if row else -1
+    if estimate >= EXACT_COUNT_THRESHOLD:
+        return estimate
+    return (await db.fetchone("SELECT COUNT(*) AS count FROM users") or {}).get("count", 0)
+
+
+async def iter_recipients(db: Database, after_user_id: int, page_size: int = RECIPIENT_PAGE_SIZE):
+    """Yields (user_id, chat_id) in user_id order, one keyset-paginated page at a time."""
+    query = "SELECT user_id, chat_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?"
+    while True:
+        rows = await db.fetch(query, (after_user_id, page_size))
+        for row in rows:
+            yield row["user_id"], row["chat_id"]
+        if len(rows) < page_size:
+            return
+        after_user_id = rows[-1]["user_id"]
+
+
+async def _send_with_retry(bot: Bot, bucket: TokenBucket, chat_id: int, job: dict[str, Any], max_retries: int) -> bool:
+    """Sends to one chat. Returns True on success, False on a permanent failure."""
+    attempt = 0
+    while True:
+        await bucket.acquire()
         try:
-            if message.text:
-                await bot.send_message(chat_id, message.text, entities=message.entities)
-            elif message.photo:
-                await bot.send_photo(chat_id, message.photo[-1].file_id, caption=message.caption, caption_entities=message.caption_entities)
-            elif message.video:
-                await bot.send_video(chat_id, message.video.file_id, caption=message.caption, caption_entities=message.caption_entities)
-            elif message.document:
-                await bot.send_document(chat_id, message.document.file_id, caption=message.caption, caption_entities=message.caption_entities)
-
-            # Log broadcast success for the target user, not the admin who triggered it
-            await log_event(db, user_id=0, event_type="broadcast_sent", slug=f"target_chat:{chat_id}")
-            success_count += 1
-            log.debug("Broadcast message sent to chat_id: %d", chat_id)
+            await bot.copy_message(chat_id, from_chat_id=job["from_chat_id"], message_id=job["message_id"])
+            return True
+        except TelegramRetryAfter as e:
+            # Flood control applies to the whole bot, so every sender backs off, not just this one.
+            log.warning("Flood control hit while broadcasting, pausing all senders for %ds.", e.retry_after)
+            bucket.pause(e.retry_after)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            attempt += 1
+            if attempt > max_retries:
+                log.error("Giving up on %d after %d attempts: %s", chat_id, attempt, e)
+                return False
+            await asyncio.sleep(random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt))
+        except TelegramForbiddenError:
+            log.warning("User %d blocked the bot. Skipping.", chat_id)
+            return False
         except TelegramAPIError as e:
-            if e.message == "Forbidden: bot was blocked by the user":
-                log.warning("User %d blocked the bot. Skipping.", chat_id)
-            else:
-                log.error("Failed to send message to %d: %s", chat_id, e)
-            fail_count += 1
+            log.error("Failed to send message to %d: %s", chat_id, e)
+            return False
         except Exception as e:
             log.error("An unexpected error occurred sending to %d: %s", chat_id, e)
-            fail_count += 1
-        
-        await asyncio.sleep(sleep_interval)
-    
-    summary = f"📢 Broadcast finished.\n\n✅ Sent: {success_count}\n❌ Failed: {fail_count}"
-    await bot.send_message(from_chat_id, summary)
-    log.info("Broadcast finished. Sent: %d, Failed: %d", success_count, fail_count)
\ No newline at end of file
+            return False
+
+
+async def create_job(db: Database, admin_chat_id: int, from_chat_id: int, message_id: int, total: int) -> int:
+    """Stores a new broadcast job. The message is referenced, not copied, and sent with copyMessage."""
+    query = """
+    INSERT INTO broadcast_jobs (admin_chat_id, from_chat_id, message_id, total, state)
+    VALUES (?, ?, ?, ?, 'running') RETURNING id
+    """
+    row = await db.fetchone(query, (admin_chat_id, from_chat_id, message_id, total))
+    if not row:
+        raise RuntimeError("Failed to create broadcast job.")
+    return row["id"]
+
+
+async def get_job(db: Database, job_id: int) -> dict[str, Any] | None:
+    return await db.fetchone("SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,))
+
+
+async def set_job_state(db: Database, job_id: int, new_state: str, from_states: tuple[str, ...]) -> dict[str, Any] | None:
+    """Moves a job to `new_state` if it is currently in one of `from_states`. Returns the updated job."""
+    query = """
+    UPDATE broadcast_jobs SET state = ?, updated_at = NOW()
+    WHERE id = ? AND state = ANY(?::text[]) RETURNING *
+    """
+    return await db.fetchone(query, (new_state, job_id, list(from_states)))
+
+
+class BroadcastRunner:
+    """
+    Runs persisted broadcast jobs.
+
+    A worker only runs a job while it holds its lease. Progress is checkpointed
+    every CHECKPOINT_INTERVAL seconds: the cursor is the highest user_id below
+    which every recipient has been handled, so a resumed job never re-sends to
+    them. A hard crash can re-send to at most the `concurrency` recipients that
+    were in flight. Pause and cancel are read from the database at each
+    checkpoint, so they work no matter which worker runs the job.
+    """
+    def __init__(self, bot: Bot, db: Database, rate_limit_sec: int, concurrency: int, max_retries: int, poll_interval: float = 10):
+        self.bot = bot
+        self.db = db
+        self.rate_limit_sec = rate_limit_sec
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._jobs: dict[int, asyncio.Task] = {}
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self) -> None:
+        tasks = [t for t in (self._task, *self._jobs.values()) if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._jobs.clear()
+
+    async def start_job(self, job_id: int) -> bool:
+        """Claims a running job and starts sending on this worker."""
+        if job_id in self._jobs:
+            return True
+        query = f"""
+        UPDATE broadcast_jobs SET locked_by = ?, locked_until = NOW() + {JOB_LEASE}
+        WHERE id = ? AND state = 'running' AND (locked_until IS NULL OR locked_until < NOW() OR locked_by = ?)
+        RETURNING id
+        """
+        if not await self.db.fetchone(query, (self.worker_id, job_id, self.worker_id)):
+            return False
+        self._jobs[job_id] = asyncio.create_task(self._run(job_id))
+        return True
+
+    async def _poll(self) -> None:
+        """Picks up running jobs that nobody holds, e.g. after a restart."""
+        query = "SELECT id FROM broadcast_jobs WHERE state = 'running' AND (locked_until IS NULL OR locked_until < NOW()) ORDER BY id"
+        while True:
+            try:
+                for row in await self.db.fetchall(query):
+                    if await self.start_job(row["id"]):
+                        log.info("Resuming broadcast job %d from its last checkpoint.", row["id"])
+            except Exception as e:
+                log.error("Failed to poll for broadcast jobs: %s", e)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _checkpoint(self, job_id: int, progress: dict[str, int], release: bool = False) -> str | None:
+        lease = "NULL" if release else f"NOW() + {JOB_LEASE}"
+        query = f"""
+        UPDATE broadcast_jobs SET cursor_user_id = ?, sent = ?, failed = ?, locked_until = {lease}, updated_at = NOW()
+        WHERE id = ? AND locked_by = ? RETURNING state
+        """
+        # Raises on a failed query, so a lost lease (None) isn't confused with a database error.
+        row = await self.db.fetchrow(query, (progress["cursor"], progress["sent"], progress["failed"], job_id, self.worker_id))
+        return row["state"] if row else None
+
+    async def _run(self, job_id: int) -> None:
+        progress: dict[str, int] = {}
+        try:
+            job = await get_job(self.db, job_id)
+            progress = {"cursor": job["cursor_user_id"], "sent": job["sent"], "failed": job["failed"]}
+            # Everything this job sends queues behind replies to users.
+            with bulk_lane():
+                await self._send_all(job, progress)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back so the next start resumes it straight away.
+            if progress:
+                await self._checkpoint(job_id, progress, release=True)
+            raise
+        except Exception as e:
+            # Not marked done: with the lease released the next poll resumes it from the last checkpoint.
+            log.error("Broadcast job %d stopped on an error, it will be resumed: %s", job_id, e)
+            if progress:
+                try:
+                    await self._checkpoint(job_id, progress, release=True)
+                except Exception as e:
+                    log.error("Failed to release broadcast job %d, it resumes once its lease expires: %s", job_id, e)
+        finally:
+            self._jobs.pop(job_id, None)
+
+    async def _send_all(self, job: dict[str, Any], progress: dict[str, int]) -> None:
+        job_id = job["id"]
+        log.info("Broadcast job %d: resuming after user %d, %d senders at %d msg/s.",
+                 job_id, job["cursor_user_id"], self.concurrency, self.rate_limit_sec)
+
+        bucket = TokenBucket(self.rate_limit_sec)
+        queue: asyncio.Queue[tuple[int, int] | None] = asyncio.Queue(maxsize=RECIPIENT_PAGE_SIZE * 2)
+        in_flight: deque[list] = deque()
+        stopped = asyncio.Event()
+        exhausted = asyncio.Event()
+        sent_before = progress["sent"]
+
+        async def producer() -> None:
+            try:
+                async for recipient in iter_recipients(self.db, job["cursor_user_id"]):
+                    if stopped.is_set():
+                        return
+                    await queue.put(recipient)
+                exhausted.set()
+            finally:
+                # Wake every sender, also when reading recipients failed. Not when cancelled:
+                # the senders are cancelled too and nothing would drain a full queue.
+                if not asyncio.current_task().cancelling():
+                    for _ in range(self.concurrency):
+                        await queue.put(None)
+
+        async def sender() -> None:
+            while (recipient := await queue.get()) is not None:
+                if stopped.is_set():
+                    # Keep draining so the producer never blocks on a full queue.
+                    continue
+                user_id, chat_id = recipient
+                entry = [user_id, False]
+                in_flight.append(entry)
+                if await _send_with_retry(self.bot, bucket, chat_id, job, self.max_retries):
+                    # Log broadcast success for the target user, not the admin who triggered it
+                    await log_event(self.db, user_id=0, event_type="broadcast_sent", slug=f"target_chat:{chat_id}")
+                    progress["sent"] += 1
+                    metrics.BROADCAST_MESSAGES.inc("sent")
+                else:
+                    progress["failed"] += 1
+                    metrics.BROADCAST_MESSAGES.inc("failed")
+                entry[1] = True
+                while in_flight and in_flight[0][1]:
+                    progress["cursor"] = in_flight.popleft()[0]
+
+        async def checkpointer() -> None:
+            renewed = time.monotonic()
+            while True:
+                await asyncio.sleep(CHECKPOINT_INTERVAL)
+                try:
+                    state = await self._checkpoint(job_id, progress)
+                except Exception as e:
+                    if time.monotonic() - renewed < LEASE_RENEW_DEADLINE:
+                        log.warning("Broadcast job %d: checkpoint failed, will retry: %s", job_id, e)
+                        continue
+                    log.error("Broadcast job %d: lease not renewed for %.0fs, stopping: %s",
+                              job_id, time.monotonic() - renewed, e)
+                    stopped.set()
+                    return
+                if state != RUNNING:
+                    stopped.set()
+                    return
+                renewed = time.monotonic()
+
+        started = time.monotonic()
+        watcher = asyncio.create_task(checkpointer())
+        try:
+            # The producer is awaited with the senders so a failed recipient query surfaces here.
+            results = await asyncio.gather(producer(), *(sender() for _ in range(self.concurrency)),
+                                           return_exceptions=True)
+        finally:
+            watcher.cancel()
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        elapsed = time.monotonic() - started
+        rate = (progress["sent"] - sent_before) / elapsed if elapsed > 0 else 0
+
+        state = await self._checkpoint(job_id, progress, release=True)
+        # Everything may have been queued while the senders were stopped, so that alone doesn't make it done.
+        if state == RUNNING and exhausted.is_set() and not stopped.is_set():
+            await set_job_state(self.db, job_id, DONE, (RUNNING,))
+            state = DONE
+        log.info("Broadcast job %d stopped in state '%s'. Sent: %d, Failed: %d, %.1f msg/s",
+                 job_id, state, progress["sent"], progress["failed"], rate)
+        if state in (DONE, CANCELLED):
+            summary = (f"📢 Broadcast #{job_id} {'finished' if state == DONE else 'cancelled'}.\n\n"
+                       f"✅ Sent: {progress['sent']}\n❌ Failed: {progress['failed']}\n"
+                       f"⏱ Took {elapsed:.0f}s ({rate:.1f} msg/s)")
+            await self.bot.send_message(job["admin_chat_id"], summary)
+
+
+runner: BroadcastRunner | None = None
+
+
+def start_runner(bot: Bot, db: Database, rate_limit_sec: int, concurrency: int, max_retries: int) -> BroadcastRunner:
+    global runner
+    runner = BroadcastRunner(bot, db, rate_limit_sec, concurrency, max_retries)
+    runner.start()
+    return runner
+
+
+async def stop_runner() -> None:
+    global runner
+    if runner:
+        await runner.stop()
+        runner = None
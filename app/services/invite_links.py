@@ -0,0 +1,103 @@
+# app/services/invite_links.py
+"""
+Per-slug invite links for UNLOCK_MODE=join_request.
+
+Each slug gets its own link to the verification chat, created with
+`creates_join_request=True` and named after the slug. Joining through it sends
+the bot a chat_join_request carrying the link name, which identifies the slug
+without a /start round trip or a membership check.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Any
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+from app.db import Database
+from app.services import slugs
+
+log = logging.getLogger(__name__)
+
+# Telegram caps invite link names at 32 characters; slugs may be up to 50.
+MAX_LINK_NAME_LENGTH = 32
+# After a failed createChatInviteLink the slug falls back to the shared link for this long
+# instead of calling Telegram again on every /start.
+CREATE_FAILURE_BACKOFF_SEC = 60
+
+_locks: dict[str, asyncio.Lock] = {}
+_failed_until: dict[str, float] = {}
+
+
+def link_name(slug: str) -> str:
+    if len(slug) <= MAX_LINK_NAME_LENGTH:
+        return slug
+    digest = hashlib.sha1(slug.encode()).hexdigest()[:8]
+    return f"{slug[:MAX_LINK_NAME_LENGTH - 9]}_{digest}"
+
+
+async def get_invite_link(bot: Bot, db: Database, chat_id: int | str, slug_data: dict[str, Any]) -> str | None:
+    """
+    Returns the slug's join-request link, creating it on first use.
+    Returns None if Telegram refuses, e.g. when the bot may not invite users to the chat.
+    """
+    if slug_data.get("invite_link"):
+        return slug_data["invite_link"]
+    slug = slug_data["slug"]
+    if _failed_until.get(slug, 0) > time.monotonic():
+        return None
+    # One creation per slug in this worker; other workers are reconciled by set_invite_link.
+    async with _locks.setdefault(slug, asyncio.Lock()):
+        current = await slugs.get_slug_data(db, slug)
+        if current and current.get("invite_link"):
+            return current["invite_link"]
+        if _failed_until.get(slug, 0) > time.monotonic():
+            return None
+        try:
+            created = await bot.create_chat_invite_link(chat_id=chat_id, name=link_name(slug), creates_join_request=True)
+        except TelegramAPIError as e:
+            backoff = max(CREATE_FAILURE_BACKOFF_SEC, e.retry_after if isinstance(e, TelegramRetryAfter) else 0)
+            _failed_until[slug] = time.monotonic() + backoff
+            log.error("Could not create a join-request link for slug '%s', retrying in %ds: %s", slug, backoff, e)
+            return None
+        _failed_until.pop(slug, None)
+        stored = await slugs.set_invite_link(db, slug, created.invite_link, link_name(slug))
+        if stored != created.invite_link:
+            # Another worker got there first, or the slug was deleted meanwhile.
+            await revoke_invite_link(bot, chat_id, created.invite_link)
+        else:
+            log.info("Created join-request link for slug '%s'.", slug)
+        return stored
+
+
+async def revoke_invite_link(bot: Bot, chat_id: int | str, invite_link: str) -> bool:
+    """Revokes a link so nobody can still join through it. Failures are logged, not raised."""
+    try:
+        await bot.revoke_chat_invite_link(chat_id=chat_id, invite_link=invite_link)
+        return True
+    except TelegramAPIError as e:
+        log.warning("Could not revoke invite link %s: %s", invite_link, e)
+        return False
+
+
+async def delete_slug(bot: Bot, db: Database, chat_id: int | str, slug: str) -> None:
+    """Deletes a slug and revokes its join-request link."""
+    invite_link = await slugs.delete_slug(db, slug)
+    _failed_until.pop(slug, None)
+    if invite_link:
+        await revoke_invite_link(bot, chat_id, invite_link)
+
+
+async def revoke_all(bot: Bot, db: Database, chat_id: int | str) -> int:
+    """
+    Revokes and forgets every stored join-request link, for when UNLOCK_MODE is no longer join_request.
+    Workers starting together race on the same rows; only one of them gets the links.
+    """
+    revoked = 0
+    for invite_link in await slugs.clear_invite_links(db):
+        revoked += await revoke_invite_link(bot, chat_id, invite_link)
+    if revoked:
+        log.warning("Revoked %d join-request links since UNLOCK_MODE is no longer join_request.", revoked)
+    return revoked
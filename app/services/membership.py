@@ -1,23 +1,172 @@
+import asyncio
 import logging
+import time
 
 from aiogram import Bot
 from aiogram.exceptions import TelegramAPIError
 
+from app import metrics
+
 log = logging.getLogger(__name__)
 
 ALLOWED_STATUSES = ["member", "administrator", "creator"]
 
 
+class MembershipCache:
+    """
+    A bounded TTL cache of membership results keyed by (chat_id, user_id).
+
+    Positive and negative results expire separately. When the bot is an admin
+    in the verification chat, `chat_member` updates overwrite entries as soon as
+    a user joins, leaves or is kicked.
+    """
+    def __init__(self, positive_ttl: float = 300, negative_ttl: float = 5, max_size: int = 100_000, strict: bool = False):
+        self.configure(positive_ttl, negative_ttl, max_size, strict)
+        self._entries: dict[tuple[str, int], tuple[bool, float]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, positive_ttl: float, negative_ttl: float, max_size: int, strict: bool) -> None:
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.strict = strict
+
+    def get(self, chat_id: int | str, user_id: int) -> bool | None:
+        if self.strict:
+            return None
+        result = self.peek(chat_id, user_id)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def peek(self, chat_id: int | str, user_id: int) -> bool | None:
+        """Like `get`, without counting towards the hit rate."""
+        entry = self._entries.get((str(chat_id), user_id))
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def set(self, chat_id: int | str, user_id: int, is_member: bool) -> None:
+        ttl = self.positive_ttl if is_member else self.negative_ttl
+        key = (str(chat_id), user_id)
+        # Re-inserting keeps the dict ordered by last write, so the first key is the oldest.
+        self._entries.pop(key, None)
+        self._entries[key] = (is_member, time.monotonic() + ttl)
+        while len(self._entries) > self.max_size:
+            del self._entries[next(iter(self._entries))]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total * 100) if total > 0 else 0,
+        }
+
+
+cache = MembershipCache()
+
+
+class MembershipPrefetcher:
+    """
+    Probes membership in the background after /start, so the verify button finds a cached answer.
+
+    Each user is probed `delays` seconds after /start until one probe finds them
+    in the chat. Only positive results are cached: a user seen outside the chat
+    may join a second later, so verify still asks Telegram for them.
+
+    Probes are speculative and never wait for budget: one that finds no token in
+    the `rate` per second bucket is skipped, and at most `max_users` users are
+    tracked at a time.
+    """
+    def __init__(self, rate: float = 5, delays: tuple[float, ...] = (3, 8, 15, 30), max_users: int = 1000):
+        self.configure(rate, delays, max_users)
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        metrics.gauge("membership_prefetch_pending", "Users with a membership prefetch scheduled.", lambda: len(self._tasks))
+
+    def configure(self, rate: float, delays: tuple[float, ...], max_users: int) -> None:
+        self.rate = rate
+        self.delays = tuple(sorted(delays))
+        self.max_users = max_users
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 and bool(self.delays) and not cache.strict
+
+    def schedule(self, bot: Bot, chat_id: int | str, user_id: int) -> None:
+        if not self.enabled or user_id in self._tasks:
+            return
+        if len(self._tasks) >= self.max_users:
+            metrics.MEMBERSHIP_PREFETCH.inc("dropped")
+            return
+        task = asyncio.create_task(self._probe(bot, chat_id, user_id))
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(user_id, None))
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _take_token(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(max(self.rate, 1.0), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def _probe(self, bot: Bot, chat_id: int | str, user_id: int) -> None:
+        started = time.monotonic()
+        for delay in self.delays:
+            await asyncio.sleep(max(0.0, started + delay - time.monotonic()))
+            if cache.peek(chat_id, user_id):
+                # Already known, from a verify or a chat_member update.
+                return
+            if not self._take_token():
+                metrics.MEMBERSHIP_PREFETCH.inc("skipped")
+                continue
+            try:
+                member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+            except Exception as e:
+                metrics.MEMBERSHIP_PREFETCH.inc("error")
+                log.debug("Membership prefetch for user %d failed: %s", user_id, e)
+                continue
+            if member.status in ALLOWED_STATUSES:
+                cache.set(chat_id, user_id, True)
+                metrics.MEMBERSHIP_PREFETCH.inc("member")
+                return
+            metrics.MEMBERSHIP_PREFETCH.inc("not_member")
+
+
+prefetcher = MembershipPrefetcher()
+
+
 async def check_membership(bot: Bot, user_id: int, chat_id: int | str) -> bool:
-    """Checks if a user is a member of the specified chat."""
+    """Checks if a user is a member of the specified chat, using the cache unless in strict mode."""
+    cached = cache.get(chat_id, user_id)
+    if cached is not None:
+        log.debug("Membership cache hit for user %d in chat %s: %s", user_id, chat_id, cached)
+        return cached
+
     try:
         member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
         is_member = member.status in ALLOWED_STATUSES
         log.info("Checked user %d membership in chat %s: status is '%s', result: %s", user_id, chat_id, member.status, is_member)
+        cache.set(chat_id, user_id, is_member)
         return is_member
     except TelegramAPIError as e:
         log.error("Could not check membership for user %d in chat %s: %s", user_id, chat_id, e)
         return False
     except Exception as e:
-        log.error("Unexpected error checking membership for user %d: %s", user_id, chat_id, e)
-        return False
\ No newline at end of file
+        log.error("Unexpected error checking membership for user %d in chat %s: %s", user_id, chat_id, e)
+        return False
@@ -1,8 +1,101 @@
+import asyncio
+import logging
 import re
 from typing import Any
 
 from app.db import Database
 
+log = logging.getLogger(__name__)
+
+# NOTIFY channel used to tell every worker that the slugs table has changed.
+SLUGS_CHANNEL = "slugs_changed"
+
+
+class SlugCatalog:
+    """
+    An in-memory copy of the slugs table.
+
+    Every worker LISTENs on SLUGS_CHANNEL and reloads the table when a write is
+    announced. A periodic full refresh covers missed notifications, e.g. while
+    the listener connection was being re-established.
+    """
+    def __init__(self):
+        self._slugs: list[dict[str, Any]] = []
+        self._by_slug: dict[str, dict[str, Any]] = {}
+        self._by_link_name: dict[str, str] = {}
+        self._ready = False
+        self._changed = asyncio.Event()
+        self._listener = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    async def start(self, db: Database, refresh_sec: int) -> None:
+        await self._ensure_listener(db)
+        self._changed.clear()
+        await self.refresh(db)
+        self._task = asyncio.create_task(self._run(db, refresh_sec))
+        log.info("Slug catalog loaded with %d slugs.", len(self._slugs))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._ready = False
+
+    async def refresh(self, db: Database) -> None:
+        """Reloads the whole table; it only holds a few hundred rows. On failure the last snapshot is kept."""
+        # fetch raises where fetchall would read a failed query as an empty table.
+        rows = [dict(row) for row in await db.fetch("SELECT * FROM slugs ORDER BY created_at DESC")]
+        self._slugs = rows
+        self._by_slug = {row["slug"]: row for row in rows}
+        self._by_link_name = {row["invite_link_name"]: row["slug"] for row in rows if row.get("invite_link_name")}
+        self._ready = True
+
+    def get(self, slug: str) -> dict[str, Any] | None:
+        row = self._by_slug.get(slug)
+        if not row or row["active"] != 1:
+            return None
+        return dict(row)
+
+    def slug_for_link(self, link_name: str) -> str | None:
+        return self._by_link_name.get(link_name)
+
+    def all(self) -> list[dict[str, Any]]:
+        return [{"slug": row["slug"], "label": row["label"], "file_id": row["file_id"]} for row in self._slugs]
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        log.debug("Received slug change notification for '%s'.", payload)
+        self._changed.set()
+
+    async def _ensure_listener(self, db: Database) -> None:
+        if self._listener is None or self._listener.is_closed():
+            self._listener = await db.listen(SLUGS_CHANNEL, self._on_notify)
+            # Anything written while we were not listening has to be picked up.
+            self._changed.set()
+
+    async def _run(self, db: Database, refresh_sec: int) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=refresh_sec)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+            try:
+                await self._ensure_listener(db)
+                await self.refresh(db)
+            except Exception as e:
+                log.error("Failed to refresh slug catalog: %s", e)
+
+
+catalog = SlugCatalog()
+
 
 def is_valid_slug(slug: str) -> bool:
     """Validates slug format."""
@@ -10,12 +103,91 @@ def is_valid_slug(slug: str) -> bool:
 
 
 async def get_slug_data(db: Database, slug: str) -> dict[str, Any] | None:
-    """Fetches slug data from the database."""
+    """Fetches slug data, from the in-memory catalog when it is loaded."""
+    if catalog.ready:
+        return catalog.get(slug)
     query = "SELECT * FROM slugs WHERE slug = ? AND active = 1"
     return await db.fetchone(query, (slug,))
 
 
+async def get_slug_for_invite_link(db: Database, link_name: str) -> str | None:
+    """Maps the name of a join-request invite link back to its slug, active or not."""
+    if catalog.ready:
+        return catalog.slug_for_link(link_name)
+    return await db.fetchval("SELECT slug FROM slugs WHERE invite_link_name = ?", (link_name,))
+
+
 async def get_all_slugs(db: Database) -> list[dict[str, Any]]:
-    """Fetches all slugs from the database."""
+    """Fetches all slugs, from the in-memory catalog when it is loaded."""
+    if catalog.ready:
+        return catalog.all()
     query = "SELECT slug, label, file_id FROM slugs ORDER BY created_at DESC"
-    return await db.fetchall(query)
\ No newline at end of file
+    return await db.fetchall(query)
+
+
+async def _notify_changed(db: Database, slug: str = "*") -> None:
+    """
+    Announces a write to every worker and refreshes the local catalog right away.
+    The payload is the changed slug, or "*" when several changed.
+    """
+    await db.execute("SELECT pg_notify(?, ?)", (SLUGS_CHANNEL, slug))
+    if catalog.ready:
+        await catalog.refresh(db)
+
+
+async def create_slug(db: Database, slug: str, label: str, file_id: str) -> None:
+    """Inserts a new active slug."""
+    query = "INSERT INTO slugs (slug, label, file_id, active) VALUES (?, ?, ?, 1)"
+    await db.execute(query, (slug, label, file_id))
+    await _notify_changed(db, slug)
+
+
+async def upsert_slug(db: Database, slug: str, label: str, file_id: str) -> None:
+    """Inserts a slug or updates the label and file of an existing one."""
+    query = """
+    INSERT INTO slugs (slug, label, file_id, active) VALUES (?, ?, ?, 1)
+    ON CONFLICT(slug) DO UPDATE SET
+        label = excluded.label,
+        file_id = excluded.file_id;
+    """
+    await db.execute(query, (slug, label, file_id))
+    await _notify_changed(db, slug)
+
+
+async def delete_slug(db: Database, slug: str) -> str | None:
+    """Deletes a slug. Returns its join-request invite link, if it had one, so the caller can revoke it."""
+    invite_link = await db.fetchval("DELETE FROM slugs WHERE slug = ? RETURNING invite_link", (slug,))
+    await _notify_changed(db, slug)
+    return invite_link
+
+
+async def set_invite_link(db: Database, slug: str, invite_link: str, link_name: str) -> str | None:
+    """
+    Stores the slug's join-request invite link unless it already has one.
+    Returns the link now stored, or None when the slug no longer exists.
+    """
+    stored = await db.fetchval(
+        """
+        UPDATE slugs SET invite_link = COALESCE(invite_link, ?), invite_link_name = COALESCE(invite_link_name, ?)
+        WHERE slug = ? RETURNING invite_link
+        """,
+        (invite_link, link_name, slug),
+    )
+    if stored == invite_link:
+        await _notify_changed(db, slug)
+    return stored
+
+
+async def clear_invite_links(db: Database) -> list[str]:
+    """Forgets every slug's join-request invite link and returns the links, so the caller can revoke them."""
+    rows = await db.fetch(
+        """
+        WITH old AS (SELECT slug, invite_link FROM slugs WHERE invite_link IS NOT NULL FOR UPDATE)
+        UPDATE slugs SET invite_link = NULL, invite_link_name = NULL
+        FROM old WHERE slugs.slug = old.slug RETURNING old.slug, old.invite_link
+        """
+    )
+    if rows:
+        # One notification covers all of them: every listener reloads the whole table anyway.
+        await _notify_changed(db)
+    return [row["invite_link"] for row in rows]
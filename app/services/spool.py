@@ -0,0 +1,185 @@
+# app/services/spool.py
+"""
+Append-only local files for writes made while the database is unavailable.
+
+Services write a record per kind ("start", "verify", "event", ...) and register
+a replayer for that kind. Once the database answers again, the spool is
+replayed in bulk, kind by kind in registration order, and then removed.
+
+Every process spools to its own file in the spool directory and holds an
+exclusive lock on a matching `.lock` file while it runs. A lock that can be
+taken belongs to a process that has exited, and its leftover files are replayed
+by whichever process takes it first.
+"""
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import socket
+from collections import defaultdict
+from collections.abc import Awaitable, Callable
+from contextlib import suppress
+from typing import Any
+
+from app.db import Database, DatabaseUnavailableError
+
+log = logging.getLogger(__name__)
+
+Replayer = Callable[[Database, list[dict[str, Any]]], Awaitable[None]]
+
+
+def _line(kind: str, fields: dict[str, Any]) -> str:
+    return json.dumps({"kind": kind, **fields}, separators=(",", ":"), default=str) + "\n"
+
+
+def _lock(path: str, block: bool = True):
+    """Opens `path` and takes an exclusive lock on it. Returns None if another process holds it."""
+    f = open(path, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX if block else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
+class WriteSpool:
+    def __init__(self):
+        self.directory: str | None = None
+        self.path: str | None = None
+        self.written = 0
+        self._replayers: dict[str, Replayer] = {}
+        self._file = None
+        self._lock_file = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def _replay_path(self) -> str:
+        return f"{self.path}.replay"
+
+    def register(self, kind: str, replayer: Replayer) -> None:
+        """`replayer(db, records)` applies every spooled record of `kind` in one go, or raises."""
+        self._replayers[kind] = replayer
+
+    def start(self, db: Database, directory: str, interval: float = 5.0) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, f"spool-{socket.gethostname()}-{os.getpid()}.jsonl")
+        # Held until stop() or exit; it tells other processes these files are still in use.
+        self._lock_file = _lock(f"{self.path}.lock")
+        self._task = asyncio.create_task(self._run(db, interval))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._close_file()
+        if self._lock_file is not None:
+            if not self.pending:
+                for path in (self.path, self._replay_path, self._lock_file.name):
+                    with suppress(FileNotFoundError):
+                        os.remove(path)
+            # Anything still pending is picked up by the next process to start.
+            self._lock_file.close()
+            self._lock_file = None
+        self.path = None
+        self.directory = None
+
+    def write(self, kind: str, **fields: Any) -> None:
+        if not self.enabled:
+            raise RuntimeError("The write spool is not enabled.")
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(_line(kind, fields))
+        # Flushed per record so a crash during the outage loses at most the line being written.
+        self._file.flush()
+        self.written += 1
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def pending(self) -> bool:
+        return self.enabled and any(os.path.exists(p) and os.path.getsize(p) > 0 for p in (self.path, self._replay_path))
+
+    async def replay(self, db: Database) -> int:
+        """Applies everything spooled so far, then files left by exited processes. New writes go to a fresh file meanwhile."""
+        if not os.path.exists(self._replay_path) and os.path.exists(self.path):
+            self._close_file()
+            os.replace(self.path, self._replay_path)
+        count = await self._replay_file(db, self._replay_path)
+
+        for lock_path in glob.glob(os.path.join(self.directory, "spool-*.jsonl.lock")):
+            if lock_path == self._lock_file.name or not (lock_file := _lock(lock_path, block=False)):
+                continue
+            try:
+                path = lock_path.removesuffix(".lock")
+                # The .replay file holds the older writes.
+                for leftover in (f"{path}.replay", path):
+                    count += await self._replay_file(db, leftover)
+                with suppress(FileNotFoundError):
+                    os.remove(lock_path)
+            finally:
+                lock_file.close()
+        if count:
+            log.warning("Replayed %d spooled writes.", count)
+        return count
+
+    async def _replay_file(self, db: Database, path: str) -> int:
+        if not os.path.exists(path):
+            return 0
+        by_kind: dict[str, list[dict[str, Any]]] = defaultdict(list)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    by_kind[record.pop("kind")].append(record)
+
+        # Each kind is dropped from the file once applied, so a failure only retries what is left.
+        count = 0
+        for kind, replayer in self._replayers.items():
+            records = by_kind.pop(kind, None)
+            if not records:
+                continue
+            await replayer(db, records)
+            count += len(records)
+            self._rewrite(path, by_kind)
+        if by_kind:
+            log.error("No replayer for spooled kinds %s, dropping %d records.",
+                      sorted(by_kind), sum(len(records) for records in by_kind.values()))
+        os.remove(path)
+        return count
+
+    def _rewrite(self, path: str, by_kind: dict[str, list[dict[str, Any]]]) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for kind, records in by_kind.items():
+                for record in records:
+                    f.write(_line(kind, record))
+        os.replace(tmp_path, path)
+
+    async def _run(self, db: Database, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # While the circuit is open this fails fast, except for the breaker's periodic probe.
+                await self.replay(db)
+            except DatabaseUnavailableError:
+                continue
+            except Exception as e:
+                log.error("Failed to replay the write spool, will retry: %s", e)
+
+
+spool = WriteSpool()
@@ -0,0 +1,139 @@
+# app/services/users.py
+import logging
+from collections import OrderedDict
+from typing import Any
+
+from app.db import Database, DatabaseUnavailableError
+from app.services.spool import spool
+
+log = logging.getLogger(__name__)
+
+# Read before the membership check, so unknown users and gone offers don't cost a Bot API call.
+VERIFY_QUERY = "SELECT selected_slug, joined_ok FROM users WHERE user_id = ?"
+
+# Registers a /start. New users are inserted; existing ones only get a write when
+# they arrive with a different valid slug, so repeat taps of the same deep link and
+# invalid payloads don't touch the row. A NULL slug never overwrites a valid one.
+START_QUERY = """
+WITH input (user_id, chat_id, slug) AS (
+    VALUES (?::bigint, ?::bigint, ?::text)
+), updated AS (
+    UPDATE users u SET selected_slug = i.slug, updated_at = NOW()
+    FROM input i
+    WHERE u.user_id = i.user_id AND i.slug IS NOT NULL AND u.selected_slug IS DISTINCT FROM i.slug
+    RETURNING u.user_id
+)
+INSERT INTO users (user_id, chat_id, selected_slug)
+SELECT user_id, chat_id, slug FROM input
+WHERE NOT EXISTS (SELECT 1 FROM users WHERE users.user_id = input.user_id)
+ON CONFLICT (user_id) DO NOTHING
+"""
+
+# Marks a verified member as joined; rows already marked aren't written. Also replays
+# spooled verifications: users spooled by a /start in the same outage are replayed first.
+MARK_JOINED_QUERY = "UPDATE users SET joined_ok = 1 WHERE user_id = ? AND joined_ok = 0 AND selected_slug IS NOT NULL"
+
+# Registers a user admitted through a slug's join-request link: selects that slug and
+# marks them joined. Rows that already say so are left alone.
+JOIN_QUERY = """
+INSERT INTO users (user_id, chat_id, selected_slug, joined_ok) VALUES (?, ?, ?, 1)
+ON CONFLICT (user_id) DO UPDATE SET selected_slug = excluded.selected_slug, joined_ok = 1, updated_at = NOW()
+WHERE users.selected_slug IS DISTINCT FROM excluded.selected_slug OR users.joined_ok = 0
+"""
+
+
+class KnownUsers:
+    """
+    A bounded LRU of user_id -> selected slug for the users seen recently.
+
+    Only consulted while the database is unavailable, so that users who pressed
+    /start shortly before (or during) an outage can still verify.
+    """
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self._slugs: OrderedDict[int, str | None] = OrderedDict()
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._slugs
+
+    def get(self, user_id: int) -> str | None:
+        self._slugs.move_to_end(user_id)
+        return self._slugs[user_id]
+
+    def set(self, user_id: int, slug: str | None) -> None:
+        self._slugs[user_id] = slug
+        self._slugs.move_to_end(user_id)
+        if len(self._slugs) > self.max_size:
+            self._slugs.popitem(last=False)
+
+
+known_users = KnownUsers()
+
+
+async def record_start(db: Database, user_id: int, chat_id: int, slug: str | None) -> None:
+    """
+    Registers the user and selects `slug`, which must already be validated, or None for no offer.
+    While the database is unavailable the write is spooled instead.
+    """
+    try:
+        await db.execute(START_QUERY, (user_id, chat_id, slug))
+    except DatabaseUnavailableError:
+        if not spool.enabled:
+            raise
+        spool.write("start", user_id=user_id, chat_id=chat_id, slug=slug)
+    if slug is not None or user_id not in known_users:
+        known_users.set(user_id, slug)
+
+
+async def get_verify_target(db: Database, user_id: int) -> dict[str, Any] | None:
+    """
+    Returns the user's `selected_slug` and `joined_ok`, or None for unknown users.
+    While the database is unavailable the answer comes from the users seen recently.
+    """
+    try:
+        user_data = await db.fetchone(VERIFY_QUERY, (user_id,))
+    except DatabaseUnavailableError:
+        if not spool.enabled or user_id not in known_users:
+            raise
+        return {"selected_slug": known_users.get(user_id), "joined_ok": 0}
+    if user_data:
+        known_users.set(user_id, user_data["selected_slug"])
+    return user_data
+
+
+async def mark_joined(db: Database, user_id: int) -> None:
+    """Records a verified membership. Spooled while the database is unavailable."""
+    try:
+        await db.execute(MARK_JOINED_QUERY, (user_id,))
+    except DatabaseUnavailableError:
+        if not spool.enabled:
+            raise
+        spool.write("verify", user_id=user_id)
+
+
+async def record_join(db: Database, user_id: int, chat_id: int, slug: str) -> None:
+    """Records that the user joined through `slug`'s invite link. Spooled while the database is unavailable."""
+    try:
+        await db.execute(JOIN_QUERY, (user_id, chat_id, slug))
+    except DatabaseUnavailableError:
+        if not spool.enabled:
+            raise
+        spool.write("join", user_id=user_id, chat_id=chat_id, slug=slug)
+    known_users.set(user_id, slug)
+
+
+async def _replay_starts(db: Database, records: list[dict[str, Any]]) -> None:
+    await db.executemany(START_QUERY, [(r["user_id"], r["chat_id"], r["slug"]) for r in records])
+
+
+async def _replay_verifies(db: Database, records: list[dict[str, Any]]) -> None:
+    await db.executemany(MARK_JOINED_QUERY, [(r["user_id"],) for r in records])
+
+
+async def _replay_joins(db: Database, records: list[dict[str, Any]]) -> None:
+    await db.executemany(JOIN_QUERY, [(r["user_id"], r["chat_id"], r["slug"]) for r in records])
+
+
+spool.register("start", _replay_starts)
+spool.register("verify", _replay_verifies)
+spool.register("join", _replay_joins)
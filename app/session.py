@@ -0,0 +1,123 @@
+# app/session.py
+"""
+The aiohttp session the bot talks to the Bot API through.
+
+aiogram's default session uses aiohttp's connector defaults: a 15 s keep-alive,
+a 10 s DNS cache and one timeout for every method. This one takes those from
+Settings, can use orjson, and traces each request so the time spent waiting for
+a pooled connection, connecting and waiting for the first byte is recorded per
+Bot API method.
+"""
+import time
+from types import SimpleNamespace
+from typing import Any
+
+from aiogram import Bot
+from aiogram.__meta__ import __version__
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiohttp import (ClientSession, TraceConfig, TraceConnectionCreateEndParams, TraceRequestEndParams,
+                     TraceRequestStartParams)
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+
+from app import metrics
+
+
+def _method_name(url) -> str:
+    # Bot API URLs end in /bot<token>/<method>.
+    return url.path.rsplit("/", 1)[-1]
+
+
+async def _on_request_start(session: ClientSession, ctx: SimpleNamespace, params: TraceRequestStartParams) -> None:
+    ctx.started = time.perf_counter()
+    ctx.method = _method_name(params.url)
+
+
+async def _on_queued_start(session: ClientSession, ctx: SimpleNamespace, params: Any) -> None:
+    ctx.queued = time.perf_counter()
+
+
+async def _on_queued_end(session: ClientSession, ctx: SimpleNamespace, params: Any) -> None:
+    metrics.BOT_API_PHASE.observe(time.perf_counter() - ctx.queued, ctx.method, "queue")
+
+
+async def _on_connection_create_start(session: ClientSession, ctx: SimpleNamespace, params: Any) -> None:
+    ctx.connecting = time.perf_counter()
+
+
+async def _on_connection_create_end(session: ClientSession, ctx: SimpleNamespace,
+                                    params: TraceConnectionCreateEndParams) -> None:
+    metrics.BOT_API_PHASE.observe(time.perf_counter() - ctx.connecting, ctx.method, "connect")
+    metrics.BOT_API_CONNECTIONS.inc("new")
+
+
+async def _on_connection_reuse(session: ClientSession, ctx: SimpleNamespace, params: Any) -> None:
+    metrics.BOT_API_CONNECTIONS.inc("reused")
+
+
+async def _on_request_end(session: ClientSession, ctx: SimpleNamespace, params: TraceRequestEndParams) -> None:
+    # Fires once the response headers are in, so this is the time to first byte.
+    metrics.BOT_API_PHASE.observe(time.perf_counter() - ctx.started, ctx.method, "ttfb")
+
+
+def _trace_config() -> TraceConfig:
+    trace = TraceConfig()
+    trace.on_request_start.append(_on_request_start)
+    trace.on_connection_queued_start.append(_on_queued_start)
+    trace.on_connection_queued_end.append(_on_queued_end)
+    trace.on_connection_create_start.append(_on_connection_create_start)
+    trace.on_connection_create_end.append(_on_connection_create_end)
+    trace.on_connection_reuseconn.append(_on_connection_reuse)
+    trace.on_request_end.append(_on_request_end)
+    return trace
+
+
+class BotApiSession(AiohttpSession):
+    """
+    AiohttpSession with a configurable connection pool, per-method timeouts and request tracing.
+
+    `method_timeouts` maps Bot API method names (e.g. "getChatMember") to seconds
+    and applies when the caller doesn't pass a timeout of its own; long polling
+    always passes one.
+    """
+    def __init__(self, limit: int = 100, limit_per_host: int = 0, keepalive_timeout: float = 60,
+                 dns_cache_ttl: int = 300, method_timeouts: dict[str, float] | None = None,
+                 use_orjson: bool = False, trace: bool = True, **kwargs: Any):
+        if use_orjson:
+            try:
+                import orjson
+            except ImportError as exc:
+                raise RuntimeError("BOT_API_ORJSON needs the orjson package: pip install orjson") from exc
+            kwargs.setdefault("json_loads", orjson.loads)
+            kwargs.setdefault("json_dumps", lambda value: orjson.dumps(value).decode())
+        super().__init__(**kwargs)
+        self._connector_init.update(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            ttl_dns_cache=dns_cache_ttl,
+        )
+        self.method_timeouts = method_timeouts or {}
+        self._trace_configs = [_trace_config()] if trace else []
+
+    async def create_session(self) -> ClientSession:
+        # Same as AiohttpSession.create_session, plus the trace config.
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{__version__}"},
+                trace_configs=self._trace_configs,
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[TelegramType], timeout: int | None = None) -> TelegramType:
+        if timeout is None:
+            timeout = self.method_timeouts.get(method.__api_method__)
+        return await super().make_request(bot, method, timeout=timeout)
@@ -0,0 +1,144 @@
+# app/storage.py
+import asyncio
+import json
+import logging
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from app.db import Database, DatabaseUnavailableError
+
+log = logging.getLogger(__name__)
+
+
+class StorageConflictError(Exception):
+    """Raised when optimistic updates keep losing to concurrent writers."""
+
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM storage on the shared asyncpg pool, so any worker can continue a flow.
+
+    Each key is one row with its state, its data as compact JSON and a version.
+    `update_data` is a compare-and-swap on that version, so concurrent updates
+    from two workers can't silently overwrite each other. Every write pushes
+    `expires_at` forward; abandoned flows expire after `ttl_sec` and are purged
+    in the background.
+    """
+    def __init__(self, db: Database, ttl_sec: int = 86400, purge_interval: float = 600, max_retries: int = 5):
+        self.db = db
+        self.ttl_sec = int(ttl_sec)
+        self.purge_interval = purge_interval
+        self.max_retries = max_retries
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+        if key.thread_id:
+            parts.append(str(key.thread_id))
+        if key.business_connection_id:
+            parts.append(str(key.business_connection_id))
+        parts.append(key.destiny)
+        return ":".join(parts)
+
+    @staticmethod
+    def _dump(data: dict[str, Any]) -> str:
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+    def _expiry(self) -> str:
+        return f"NOW() + INTERVAL '{self.ttl_sec} seconds'"
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._purge_loop())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        query = f"""
+        INSERT INTO fsm_storage (key, state, expires_at) VALUES (?, ?, {self._expiry()})
+        ON CONFLICT (key) DO UPDATE SET
+            state = excluded.state,
+            data = CASE WHEN fsm_storage.expires_at > NOW() THEN fsm_storage.data ELSE '{{}}' END,
+            version = fsm_storage.version + 1,
+            expires_at = excluded.expires_at
+        """
+        await self.db.execute(query, (self._key(key), value))
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        # Read for every update; during an outage users are treated as outside any flow
+        # so that the funnel handlers still run.
+        try:
+            return await self.db.fetchval(
+                "SELECT state FROM fsm_storage WHERE key = ? AND expires_at > NOW()", (self._key(key),)
+            )
+        except DatabaseUnavailableError:
+            return None
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        query = f"""
+        INSERT INTO fsm_storage (key, data, expires_at) VALUES (?, ?::jsonb, {self._expiry()})
+        ON CONFLICT (key) DO UPDATE SET
+            state = CASE WHEN fsm_storage.expires_at > NOW() THEN fsm_storage.state END,
+            data = excluded.data,
+            version = fsm_storage.version + 1,
+            expires_at = excluded.expires_at
+        """
+        await self.db.execute(query, (self._key(key), self._dump(data)))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        try:
+            data = await self.db.fetchval(
+                "SELECT data FROM fsm_storage WHERE key = ? AND expires_at > NOW()", (self._key(key),)
+            )
+        except DatabaseUnavailableError:
+            return {}
+        return json.loads(data) if data else {}
+
+    async def update_data(self, key: StorageKey, data: dict[str, Any]) -> dict[str, Any]:
+        storage_key = self._key(key)
+        for _ in range(self.max_retries):
+            row = await self.db.fetchone(
+                "SELECT data, version FROM fsm_storage WHERE key = ? AND expires_at > NOW()", (storage_key,)
+            )
+            current = json.loads(row["data"]) if row else {}
+            current.update(data)
+            if row:
+                query = f"""
+                UPDATE fsm_storage SET data = ?::jsonb, version = version + 1, expires_at = {self._expiry()}
+                WHERE key = ? AND version = ? RETURNING version
+                """
+                params = (self._dump(current), storage_key, row["version"])
+            else:
+                # Missing or expired: only take the slot if nobody revived it in the meantime.
+                query = f"""
+                INSERT INTO fsm_storage (key, data, expires_at) VALUES (?, ?::jsonb, {self._expiry()})
+                ON CONFLICT (key) DO UPDATE SET
+                    state = NULL, data = excluded.data, version = fsm_storage.version + 1, expires_at = excluded.expires_at
+                WHERE fsm_storage.expires_at <= NOW()
+                RETURNING version
+                """
+                params = (storage_key, self._dump(current))
+            if await self.db.fetchone(query, params):
+                return current.copy()
+        raise StorageConflictError(f"Could not update FSM data for {storage_key} after {self.max_retries} attempts.")
+
+    async def purge_expired(self) -> None:
+        await self.db.execute("DELETE FROM fsm_storage WHERE expires_at <= NOW()")
+
+    async def _purge_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            try:
+                await self.purge_expired()
+            except Exception as e:
+                log.error("Failed to purge expired FSM rows: %s", e)
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
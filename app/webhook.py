@@ -0,0 +1,129 @@
+# app/webhook.py
+import asyncio
+import hmac
+import logging
+import time
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from app import metrics
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def get_update_user_id(update: Update) -> int | None:
+    """The id of the user an update belongs to, if it has one."""
+    event = update.event
+    user = getattr(event, "from_user", None)
+    return user.id if user else None
+
+
+class QueuedRequestHandler:
+    """
+    Webhook endpoint that acknowledges updates immediately and processes them later.
+
+    Telegram gets its 200 as soon as the secret is checked and the update is
+    queued, so slow handlers never hold the connection open or cause
+    redeliveries. Updates are sharded over the workers by user id: each user's
+    updates are handled in order by the same worker, while different users run
+    in parallel. When the shard is full the request is refused with 503, so
+    Telegram retries later instead of us buffering without bound.
+    """
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str, workers: int = 16,
+                 queue_size: int = 1000, **kwargs: Any):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.secret_token = secret_token
+        self.workers = max(1, workers)
+        self.kwargs = kwargs
+        shard_size = max(1, queue_size // self.workers)
+        self._queues: list[asyncio.Queue[tuple[Update, float]]] = [
+            asyncio.Queue(maxsize=shard_size) for _ in range(self.workers)
+        ]
+        self._tasks: list[asyncio.Task] = []
+        self.received = 0
+        self.rejected = 0
+        self.processed = 0
+        self.max_wait = 0.0
+        self._total_wait = 0.0
+
+    def register(self, app: web.Application, path: str) -> None:
+        # handle_health is served on the internal metrics server, not next to the webhook.
+        app.router.add_post(path, self.handle)
+        app.on_startup.append(self._on_startup)
+        app.on_shutdown.append(self._on_shutdown)
+
+    async def _on_startup(self, app: web.Application) -> None:
+        self.start()
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        await self.stop()
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker(shard)) for shard in range(len(self._queues))]
+        metrics.gauge("webhook_queue_depth", "Updates acknowledged but not yet processed.", lambda: self.depth)
+
+    async def stop(self, drain_timeout: float = 10) -> None:
+        """Gives queued updates a chance to finish, then stops the workers."""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            log.warning("Stopping with %d updates still queued.", self.depth)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret_token):
+            return web.Response(status=401)
+        update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        user_id = get_update_user_id(update)
+        shard = (user_id if user_id is not None else update.update_id) % self.workers
+        try:
+            self._queues[shard].put_nowait((update, time.monotonic()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            log.warning("Update queue shard %d is full, asking Telegram to redeliver update %d.", shard, update.update_id)
+            return web.Response(status=503)
+        self.received += 1
+        return web.Response()
+
+    async def _worker(self, shard: int) -> None:
+        queue = self._queues[shard]
+        while True:
+            update, queued_at = await queue.get()
+            wait = time.monotonic() - queued_at
+            metrics.WEBHOOK_QUEUE_WAIT.observe(wait, shard)
+            self._total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            try:
+                await self.dispatcher.feed_update(self.bot, update, **self.kwargs)
+            except Exception as e:
+                log.error("Failed to process update %d: %s", update.update_id, e)
+            finally:
+                self.processed += 1
+                queue.task_done()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", "ingest": self.stats()})
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "shard_depths": [queue.qsize() for queue in self._queues],
+            "received": self.received,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "avg_wait_ms": (self._total_wait / self.processed * 1000) if self.processed else 0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
@@ -0,0 +1,2 @@
+# bench/__init__.py
+"""Load-testing tools: a local stand-in for the Bot API and a synthetic update generator."""
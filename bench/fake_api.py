@@ -0,0 +1,181 @@
+# bench/fake_api.py
+"""
+A local stand-in for the Telegram Bot API.
+
+Implements the methods the user funnel calls, answering in the shape
+aiogram expects. Latency, server errors and 429s can be injected so the
+bot's behaviour under a slow or throttling Telegram can be measured
+without touching the real one.
+"""
+import asyncio
+import itertools
+import logging
+import random
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Any
+
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "Bench Bot", "username": "bench_bot"}
+
+
+@dataclass
+class FaultConfig:
+    latency_ms: float = 20          # mean added latency per request
+    jitter_ms: float = 10           # uniform +/- spread around the mean
+    failure_rate: float = 0.0       # share of requests answered with a 500
+    throttle_rate: float = 0.0      # share of requests answered with a 429
+    retry_after: int = 1            # retry_after sent with each 429
+    member_ratio: float = 0.8       # share of users getChatMember reports as members
+    send_limit_per_sec: float = 0   # answer sends beyond this many per second with a 429, like Telegram (0 = off)
+
+
+class FakeBotAPI:
+    """
+    aiohttp app serving `/bot<token>/<method>` like api.telegram.org.
+
+    Point a bot at it with `AiohttpSession(api=TelegramAPIServer.from_base(url))`.
+    Membership is decided once per user, so repeated checks agree with each other.
+    """
+    def __init__(self, faults: FaultConfig | None = None, seed: int | None = None):
+        self.faults = faults or FaultConfig()
+        self.random = random.Random(seed)
+        self.calls: Counter[str] = Counter()
+        self.injected: Counter[str] = Counter()
+        # Client (host, port) pairs seen, i.e. TCP connections the bot opened.
+        self.connections: set[tuple] = set()
+        self._members: dict[int, bool] = {}
+        self._message_ids = itertools.count(1)
+        self._recent_sends: deque[float] = deque()
+        self._methods = {
+            "getchatmember": self.get_chat_member,
+            "sendmessage": self.send_message,
+            "editmessagetext": self.edit_message_text,
+            "senddocument": self.send_document,
+            "copymessage": self.copy_message,
+            "createchatinvitelink": self.create_chat_invite_link,
+            "revokechatinvitelink": self.revoke_chat_invite_link,
+            "approvechatjoinrequest": self.approve_chat_join_request,
+            "answercallbackquery": self.answer_callback_query,
+            "setmycommands": self.set_my_commands,
+        }
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> web.AppRunner:
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        log.info("Fake Bot API listening on http://%s:%s", host, port)
+        return runner
+
+    async def handle(self, request: web.Request) -> web.Response:
+        name = request.match_info["method"]
+        self.calls[name] += 1
+        self.connections.add(request.transport.get_extra_info("peername") if request.transport else None)
+        params = dict(await request.post())
+
+        faults = self.faults
+        delay = faults.latency_ms + self.random.uniform(-faults.jitter_ms, faults.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        if faults.send_limit_per_sec and self._over_send_limit(name):
+            self.injected["429 limit"] += 1
+            return self._error(429, "Too Many Requests: retry after 1", parameters={"retry_after": 1})
+
+        roll = self.random.random()
+        if roll < faults.throttle_rate:
+            self.injected["429"] += 1
+            return self._error(429, f"Too Many Requests: retry after {faults.retry_after}",
+                               parameters={"retry_after": faults.retry_after})
+        if roll < faults.throttle_rate + faults.failure_rate:
+            self.injected["500"] += 1
+            return self._error(500, "Internal Server Error")
+
+        method = self._methods.get(name.lower())
+        if method is None:
+            return self._error(404, "Not Found: method not found")
+        return web.json_response({"ok": True, "result": method(params)})
+
+    def _over_send_limit(self, name: str) -> bool:
+        if not name.lower().startswith(("send", "copy", "forward", "edit")):
+            return False
+        now = time.monotonic()
+        while self._recent_sends and self._recent_sends[0] <= now - 1:
+            self._recent_sends.popleft()
+        if len(self._recent_sends) >= self.faults.send_limit_per_sec:
+            return True
+        self._recent_sends.append(now)
+        return False
+
+    @staticmethod
+    def _error(code: int, description: str, **extra: Any) -> web.Response:
+        return web.json_response({"ok": False, "error_code": code, "description": description, **extra}, status=code)
+
+    def _message(self, chat_id: Any, **fields: Any) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": BOT_USER,
+            **fields,
+        }
+
+    def get_chat_member(self, params: dict) -> dict:
+        user_id = int(params["user_id"])
+        if user_id not in self._members:
+            self._members[user_id] = self.random.random() < self.faults.member_ratio
+        user = {"id": user_id, "is_bot": False, "first_name": "User"}
+        if self._members[user_id]:
+            return {"status": "member", "user": user}
+        return {"status": "left", "user": user}
+
+    def send_message(self, params: dict) -> dict:
+        return self._message(params["chat_id"], text=params.get("text", ""))
+
+    def edit_message_text(self, params: dict) -> dict | bool:
+        if "inline_message_id" in params:
+            return True
+        return self._message(params["chat_id"], text=params.get("text", ""), edit_date=int(time.time()))
+
+    def send_document(self, params: dict) -> dict:
+        document = {"file_id": str(params.get("document", "")), "file_unique_id": "bench"}
+        return self._message(params["chat_id"], document=document, caption=params.get("caption"))
+
+    def copy_message(self, params: dict) -> dict:
+        return {"message_id": next(self._message_ids)}
+
+    def create_chat_invite_link(self, params: dict) -> dict:
+        return {
+            "invite_link": f"https://t.me/+bench{next(self._message_ids)}",
+            "creator": BOT_USER,
+            "creates_join_request": params.get("creates_join_request") == "true",
+            "is_primary": False,
+            "is_revoked": False,
+            "name": params.get("name"),
+        }
+
+    def revoke_chat_invite_link(self, params: dict) -> dict:
+        return {"invite_link": params["invite_link"], "creator": BOT_USER, "creates_join_request": True,
+                "is_primary": False, "is_revoked": True}
+
+    def approve_chat_join_request(self, params: dict) -> bool:
+        self._members[int(params["user_id"])] = True
+        return True
+
+    def answer_callback_query(self, params: dict) -> bool:
+        return True
+
+    def set_my_commands(self, params: dict) -> bool:
+        return True
+
+    def stats(self) -> dict:
+        return {"calls": dict(self.calls), "injected": dict(self.injected), "connections": len(self.connections)}
@@ -0,0 +1,82 @@
+# bench/harness.py
+"""The real dispatcher wired to the fake Bot API, shared by the benchmark and replay scripts."""
+from dataclasses import dataclass
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiohttp import web
+
+from app import metrics
+from app.config import Settings
+from app.db import Database
+from app.outbound import OutboundScheduler
+from app.ratelimit import RateLimitRules
+from app.storage import PostgresStorage
+from bench.fake_api import FakeBotAPI, FaultConfig
+from bench.updates import BENCH_USER_BASE
+from main import create_dispatcher, create_session, setup_session, start_services, stop_services
+
+
+@dataclass
+class Harness:
+    bot: Bot
+    dp: Dispatcher
+    api: FakeBotAPI
+    api_runner: web.AppRunner
+    scheduler: OutboundScheduler | None = None
+
+
+async def start_harness(config: Settings, db: Database, faults: FaultConfig, api_port: int = 8081,
+                        seed: int | None = None) -> Harness:
+    """Starts the fake Bot API, then the bot's services and dispatcher exactly as main.py does."""
+    api = FakeBotAPI(faults, seed=seed)
+    api_runner = await api.start(port=api_port)
+    session = create_session(config, api=TelegramAPIServer.from_base(f"http://127.0.0.1:{api_port}"))
+    bot = Bot(token=config.bot_token.get_secret_value(), session=session, default=DefaultBotProperties(parse_mode="HTML"))
+    scheduler = setup_session(bot, config)
+
+    if config.fsm_storage == "postgres":
+        storage = PostgresStorage(db, ttl_sec=config.fsm_ttl_sec)
+    else:
+        storage = MemoryStorage()
+    await start_services(bot, db, config)
+    dp = create_dispatcher(config, db, storage, RateLimitRules(config.antispam_default_sec, config.antispam_limits))
+    dp["bot"] = bot
+    return Harness(bot=bot, dp=dp, api=api, api_runner=api_runner, scheduler=scheduler)
+
+
+async def stop_harness(harness: Harness) -> None:
+    await stop_services()
+    if harness.scheduler:
+        await harness.scheduler.close()
+    await harness.bot.session.close()
+    await harness.api_runner.cleanup()
+
+
+def query_counts() -> dict[str, int]:
+    """Statements run so far, by call site."""
+    return {site: count for (site,), (count, _) in metrics.DB_QUERY_LATENCY.totals().items()}
+
+
+async def delete_bench_users(db: Database, count: int) -> None:
+    """
+    Removes the first `count` benchmark users with their events and their share of
+    the activity counts. Only that id range is touched.
+    """
+    first, last = BENCH_USER_BASE, BENCH_USER_BASE + count - 1
+    await db.execute("DELETE FROM events WHERE user_id BETWEEN ? AND ?", (first, last))
+    # Deleting events doesn't move anyone's last active day, so take the users off it here.
+    await db.execute(
+        """
+        WITH gone AS (
+            DELETE FROM user_last_active WHERE user_id BETWEEN ? AND ? RETURNING day
+        )
+        UPDATE active_users_by_day a SET users = a.users - g.users
+        FROM (SELECT day, COUNT(*) AS users FROM gone GROUP BY day) g
+        WHERE a.day = g.day
+        """,
+        (first, last),
+    )
+    await db.execute("DELETE FROM users WHERE user_id BETWEEN ? AND ?", (first, last))
@@ -0,0 +1,177 @@
+# bench/replay.py
+"""
+Replay of captured update streams (see app/recorder.py) through the dispatcher.
+
+Each user's updates are fed in their original order, while different users run
+concurrently, like the webhook workers do. At `speed` 1 the original gaps
+between updates are kept, at N they are divided by N, and at 0 updates are fed
+as fast as the bot takes them.
+"""
+import asyncio
+import json
+import statistics
+import time
+from collections import defaultdict
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject, Update
+
+from app.webhook import get_update_user_id
+
+
+def read_records(paths: Iterable[str]) -> list[dict]:
+    """Loads capture files, rotated ones included, as one stream ordered by capture time."""
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    records.sort(key=lambda record: record["ts"])
+    return records
+
+
+def replay_slugs(records: Iterable[dict]) -> set[str]:
+    """Slugs referenced by /start payloads and send: buttons, so a scratch database can be seeded with them."""
+    found = set()
+    for record in records:
+        update = record["update"]
+        text = update.get("message", {}).get("text", "")
+        if text.startswith("/start ") and len(text.split()) > 1:
+            found.add(text.split()[1])
+        data = update.get("callback_query", {}).get("data", "")
+        if data.startswith("send:"):
+            found.add(data.split(":", 1)[1])
+    return found
+
+
+class HandlerTimer(BaseMiddleware):
+    """Inner middleware that keeps every handler duration, for percentiles."""
+    def __init__(self):
+        self.durations: dict[str, list[float]] = defaultdict(list)
+
+    def install(self, dp: Dispatcher) -> None:
+        for name, observer in dp.observers.items():
+            if name != "update":
+                observer.middleware(self)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        callback = data["handler"].callback
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            name = f"{callback.__module__.rpartition('.')[2]}.{callback.__name__}"
+            self.durations[name].append(time.perf_counter() - started)
+
+
+@dataclass
+class ReplayResult:
+    latencies: list[float] = field(default_factory=list)
+    errors: dict[str, int] = field(default_factory=dict)
+    updates: int = 0
+    elapsed: float = 0.0
+
+
+async def replay(
+    feed: Callable[[Update], Awaitable[Any]],
+    bot: Any,
+    records: list[dict],
+    speed: float = 1.0,
+    concurrency: int = 100,
+) -> ReplayResult:
+    result = ReplayResult()
+    if not records:
+        return result
+    semaphore = asyncio.Semaphore(concurrency)
+    by_user: dict[Any, list[tuple[float, Update]]] = defaultdict(list)
+    for record in records:
+        update = Update.model_validate(record["update"], context={"bot": bot})
+        user_id = get_update_user_id(update)
+        by_user[user_id if user_id is not None else f"update:{update.update_id}"].append((record["ts"], update))
+
+    first_ts = records[0]["ts"]
+    started = time.perf_counter()
+
+    async def walk(updates: list[tuple[float, Update]]) -> None:
+        for ts, update in updates:
+            if speed > 0:
+                delay = started + (ts - first_ts) / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            async with semaphore:
+                fed_at = time.perf_counter()
+                try:
+                    await feed(update)
+                except Exception as e:
+                    name = type(e).__name__
+                    result.errors[name] = result.errors.get(name, 0) + 1
+                result.latencies.append(time.perf_counter() - fed_at)
+                result.updates += 1
+
+    await asyncio.gather(*(walk(updates) for updates in by_user.values()))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def _timings(values: list[float]) -> dict[str, float]:
+    if len(values) < 2:
+        value = values[0] * 1000 if values else 0.0
+        return {"count": len(values), "p50_ms": value, "p95_ms": value, "p99_ms": value}
+    q = statistics.quantiles(values, n=100)
+    return {"count": len(values), "p50_ms": q[49] * 1000, "p95_ms": q[94] * 1000, "p99_ms": q[98] * 1000}
+
+
+def summarize(label: str, result: ReplayResult, timer: HandlerTimer, api_calls: dict[str, int],
+              db_queries: int) -> dict:
+    """A JSON-friendly summary of one run; two of these can be compared with `compare`."""
+    return {
+        "label": label,
+        "updates": result.updates,
+        "elapsed_sec": result.elapsed,
+        "updates_per_sec": result.updates / result.elapsed if result.elapsed else 0.0,
+        "db_queries_per_update": db_queries / result.updates if result.updates else 0.0,
+        "update": _timings(result.latencies),
+        "handlers": {name: _timings(values) for name, values in sorted(timer.durations.items())},
+        "api_calls": dict(sorted(api_calls.items())),
+        "errors": result.errors,
+    }
+
+
+def _change(old: float, new: float) -> str:
+    if not old:
+        return "new" if new else ""
+    return f"{(new - old) / old:+.0%}"
+
+
+def compare(old: dict, new: dict) -> list[str]:
+    """Lines describing how `new` differs from `old`, handler by handler."""
+    lines = [f"{old['label']} -> {new['label']}", ""]
+    for name in ("updates_per_sec", "db_queries_per_update"):
+        lines.append(f"{name:<24} {old[name]:>10.2f} -> {new[name]:>10.2f}  {_change(old[name], new[name])}")
+    lines.append("")
+    lines.append(f"{'handler':<36} {'count':>13}  {'p50 ms':>21}  {'p95 ms':>21}  {'p99 ms':>21}")
+    empty = {"count": 0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    rows = [("(whole update)", old["update"], new["update"])]
+    for name in sorted(set(old["handlers"]) | set(new["handlers"])):
+        rows.append((name, old["handlers"].get(name, empty), new["handlers"].get(name, empty)))
+    for name, before, after in rows:
+        cells = [f"{before['count']:>6}->{after['count']:<6}"]
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            cells.append(f"{before[key]:>7.2f}->{after[key]:<7.2f}{_change(before[key], after[key]):>5}")
+        lines.append(f"{name:<36} " + "  ".join(cells))
+    for title, key in (("Bot API calls", "api_calls"), ("Errors", "errors")):
+        changed = {name: (old[key].get(name, 0), new[key].get(name, 0))
+                   for name in set(old[key]) | set(new[key]) if old[key].get(name, 0) != new[key].get(name, 0)}
+        if changed:
+            lines.append("")
+            lines.append(f"{title}:")
+            for name, (before, after) in sorted(changed.items()):
+                lines.append(f"    {name:<28} {before:>8} -> {after}")
+    return lines
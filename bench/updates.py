@@ -0,0 +1,157 @@
+# bench/updates.py
+"""
+Synthetic updates for the user funnel: /start <slug> -> verify_join -> send:<slug>,
+or /start <slug> -> a join request through the slug's invite link.
+
+Each simulated user walks the funnel in order, the way a real client would.
+Users arrive on an open-loop schedule, so a bot that falls behind shows it as
+growing latency instead of quietly slowing the generator down.
+"""
+import asyncio
+import itertools
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram.types import Update
+
+from app.services.invite_links import link_name
+from bench.fake_api import BOT_USER
+
+# Benchmark users take the ids from here up. Cleanup deletes only the range a run used,
+# so a real user with an id in this area is left alone.
+BENCH_USER_BASE = 9_000_000_000
+FUNNEL_STEPS = ("start", "verify", "send")
+JOIN_REQUEST_STEPS = ("start", "join")
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"Bench{user_id - BENCH_USER_BASE}", "language_code": "en"}
+
+
+class UpdateFactory:
+    """Builds raw update payloads; the ids are unique within one factory."""
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def start(self, user_id: int, slug: str) -> dict:
+        user = _user(user_id)
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+                "from": user,
+                "text": f"/start {slug}",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+            },
+        }
+
+    def callback(self, user_id: int, data: str, message_text: str = "") -> dict:
+        user = _user(user_id)
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": user,
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+                    "from": BOT_USER,
+                    "text": message_text,
+                },
+            },
+        }
+
+    def join_request(self, user_id: int, chat_id: int, link_name: str) -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "chat_join_request": {
+                "chat": {"id": chat_id, "type": "supergroup", "title": "Bench"},
+                "from": _user(user_id),
+                "user_chat_id": user_id,
+                "date": int(time.time()),
+                "invite_link": {
+                    "invite_link": "https://t.me/+bench...", "creator": BOT_USER, "creates_join_request": True,
+                    "is_primary": False, "is_revoked": False, "name": link_name,
+                },
+            },
+        }
+
+    def funnel(self, user_id: int, slug: str, join_request_chat_id: int | None = None) -> list[tuple[str, dict]]:
+        if join_request_chat_id is not None:
+            return [
+                ("start", self.start(user_id, slug)),
+                ("join", self.join_request(user_id, join_request_chat_id, link_name(slug))),
+            ]
+        return [
+            ("start", self.start(user_id, slug)),
+            ("verify", self.callback(user_id, "verify_join")),
+            ("send", self.callback(user_id, f"send:{slug}")),
+        ]
+
+
+@dataclass
+class LoadResult:
+    latencies: dict[str, list[float]] = field(default_factory=lambda: {step: [] for step in dict.fromkeys((*FUNNEL_STEPS, *JOIN_REQUEST_STEPS))})
+    errors: dict[str, int] = field(default_factory=dict)
+    updates: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.updates / self.elapsed if self.elapsed else 0.0
+
+
+async def generate_load(
+    feed: Callable[[Update], Awaitable[Any]],
+    bot: Any,
+    slugs: list[str],
+    users: int,
+    rate: float,
+    think_time: float = 0.0,
+    join_request_chat_id: int | None = None,
+) -> LoadResult:
+    """
+    Drives `users` funnels through `feed` at about `rate` updates per second.
+
+    `feed` is called with each parsed update, e.g. `partial(dp.feed_update, bot)`.
+    With `join_request_chat_id`, users join that chat through a join request instead of verifying.
+    """
+    factory = UpdateFactory()
+    result = LoadResult()
+    steps = FUNNEL_STEPS if join_request_chat_id is None else JOIN_REQUEST_STEPS
+    funnels_per_sec = rate / len(steps)
+
+    async def walk(index: int) -> None:
+        user_id = BENCH_USER_BASE + index
+        for step, payload in factory.funnel(user_id, slugs[index % len(slugs)], join_request_chat_id):
+            update = Update.model_validate(payload, context={"bot": bot})
+            started = time.perf_counter()
+            try:
+                await feed(update)
+            except Exception as e:
+                name = f"{step}:{type(e).__name__}"
+                result.errors[name] = result.errors.get(name, 0) + 1
+            result.latencies[step].append(time.perf_counter() - started)
+            result.updates += 1
+            if think_time:
+                await asyncio.sleep(think_time)
+
+    started = time.perf_counter()
+    tasks = []
+    for index in range(users):
+        # Sleep until this user's scheduled arrival rather than a fixed interval, so drift doesn't accumulate.
+        delay = started + index / funnels_per_sec - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(walk(index)))
+    await asyncio.gather(*tasks)
+    result.elapsed = time.perf_counter() - started
+    return result
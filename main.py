@@ -6,16 +6,26 @@ from aiohttp import web
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import BotCommand, BotCommandScopeChat, BotCommandScopeDefault
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiogram.webhook.aiohttp_server import setup_application
 
 from app.config import Settings, load_config
-from app.db import Database
-from app.handlers import admin, files, start, verify
+from app.db import CircuitBreaker, Database, PoolSettings
+from app.handlers import admin, files, join_requests, members, start, verify
 from app.locales import CMD_ADMIN, CMD_START, CMD_STATS
 from app.logging_conf import setup_logging
-from app.middlewares import AntiSpamMiddleware
+from app import metrics
+from app.middlewares import AntiSpamMiddleware, BackgroundDatabaseMiddleware, BotApiMetricsMiddleware, MetricsMiddleware, UpdateRecorderMiddleware
+from app.outbound import OutboundScheduler
+from app.ratelimit import LocalRateLimiter, PostgresRateLimiter, RateLimitRules
+from app.recorder import UpdateRecorder
+from app.services import analytics, broadcast, invite_links, membership, slugs, users
+from app.services.spool import spool
+from app.session import BotApiSession
+from app.storage import PostgresStorage
+from app.webhook import QueuedRequestHandler
 
 async def set_bot_commands(bot: Bot, config: Settings):
     user_commands = [BotCommand(command="start", description=CMD_START)]
@@ -30,13 +40,14 @@ async def set_bot_commands(bot: Bot, config: Settings):
     logging.info("Bot command menus have been set.")
 
 
-async def on_startup(bot: Bot, config: Settings):
+async def on_startup(bot: Bot, config: Settings, dispatcher: Dispatcher):
     """Function to be called on application startup (for webhook mode)."""
     await set_bot_commands(bot, config)
     await bot.set_webhook(
         url=config.webhook_url,
         drop_pending_updates=True,
-        secret_token=config.bot_token.get_secret_value()[:10] # Optional secret for more security
+        secret_token=config.webhook_secret,
+        allowed_updates=dispatcher.resolve_used_update_types(),
     )
     logging.info("Webhook set to %s", config.webhook_url)
 
@@ -47,31 +58,157 @@ async def on_shutdown(bot: Bot):
     logging.info("Webhook deleted.")
 
 
-async def main():
-    """Main function to start the bot."""
-    config = load_config()
-    setup_logging(config)
-    log = logging.getLogger(__name__)
-    log.info("Starting bot...")
+def create_database(config: Settings) -> Database:
+    pool = PoolSettings(
+        min_size=config.db_pool_min_size,
+        max_size=config.db_pool_max_size,
+        max_inactive_connection_lifetime=config.db_pool_max_inactive_lifetime_sec,
+        command_timeout=config.db_command_timeout_sec or None,
+        statement_timeout_ms=config.db_statement_timeout_ms,
+    )
+    background_pool = None
+    if config.db_background_pool_size > 0:
+        background_pool = PoolSettings(
+            min_size=1,
+            max_size=config.db_background_pool_size,
+            max_inactive_connection_lifetime=config.db_pool_max_inactive_lifetime_sec,
+            statement_timeout_ms=config.db_background_statement_timeout_ms,
+        )
+    return Database(
+        config.postgres_dsn, auto_migrate=config.auto_migrate, statement_cache_size=config.db_statement_cache_size,
+        pool=pool, background_pool=background_pool,
+        slow_query_ms=config.db_slow_query_ms, slow_acquire_ms=config.db_slow_acquire_ms,
+        breaker=CircuitBreaker(config.db_breaker_failures, config.db_breaker_reset_sec),
+    )
+
+
+def create_session(config: Settings, **kwargs) -> BotApiSession:
+    """The Bot API session with the pool, timeouts and tracing from `config`. Extra arguments go to AiohttpSession."""
+    return BotApiSession(
+        limit=config.bot_api_connection_limit, keepalive_timeout=config.bot_api_keepalive_sec,
+        dns_cache_ttl=config.bot_api_dns_cache_sec, method_timeouts=config.bot_api_method_timeouts,
+        use_orjson=config.bot_api_orjson, trace=config.metrics_enabled, timeout=config.bot_api_timeout_sec, **kwargs,
+    )
+
+
+def setup_session(bot: Bot, config: Settings) -> OutboundScheduler | None:
+    """Adds the request middlewares to the bot's session. Returns the outbound scheduler, if enabled."""
+    # Registered first so it wraps the metrics middleware, which then times only the request itself.
+    scheduler = None
+    if config.outbound_global_per_sec > 0:
+        scheduler = OutboundScheduler(config.outbound_global_per_sec, config.outbound_per_chat_per_sec,
+                                      config.outbound_per_chat_burst)
+        bot.session.middleware(scheduler)
+    if config.metrics_enabled:
+        bot.session.middleware(BotApiMetricsMiddleware())
+    return scheduler
+
+
+async def start_services(bot: Bot, db: Database, config: Settings):
+    """Starts the caches and background workers the handlers rely on."""
+    # Background work gets its own pool (see Database.background); the funnel keeps the main one.
+    await slugs.catalog.start(db.background, config.slug_cache_refresh_sec)
+    membership.cache.configure(
+        positive_ttl=config.membership_positive_ttl_sec,
+        negative_ttl=config.membership_negative_ttl_sec,
+        max_size=config.membership_cache_size,
+        strict=config.membership_strict,
+    )
+    membership.prefetcher.configure(
+        rate=config.membership_prefetch_per_sec,
+        delays=tuple(config.membership_prefetch_delays),
+        max_users=config.membership_prefetch_max_users,
+    )
+    users.known_users.max_size = config.known_users_cache_size
+    if config.unlock_mode != "join_request":
+        # Links handed out while UNLOCK_MODE was join_request would otherwise keep sending join requests.
+        await invite_links.revoke_all(bot, db.background, config.verify_chat_id)
+    if config.spool_dir:
+        spool.start(db.background, config.spool_dir, config.spool_replay_interval_sec)
+    await analytics.ensure_event_partitions(db)
+    analytics.start_partition_timer(db.background, config.events_partition_check_sec)
+    analytics.start_sink(db.background, config.event_batch_size, config.event_flush_interval_sec, config.event_max_pending)
+    broadcast.start_runner(bot, db.background, config.rate_limit_broadcast_per_sec, config.broadcast_concurrency, config.broadcast_max_retries)
 
-    storage = MemoryStorage()
-    bot = Bot(token=config.bot_token.get_secret_value(), default=DefaultBotProperties(parse_mode="HTML"))
+
+async def stop_services():
+    await broadcast.stop_runner()
+    await membership.prefetcher.stop()
+    await analytics.stop_sink()
+    await analytics.stop_partition_timer()
+    await spool.stop()
+    await slugs.catalog.stop()
+
+
+def create_dispatcher(config: Settings, db: Database, storage: BaseStorage, rules: RateLimitRules,
+                      shared_limiter: PostgresRateLimiter | None = None) -> Dispatcher:
+    """Builds the dispatcher with its middlewares and routers. Also used by the benchmarks in bench/."""
     dp = Dispatcher(storage=storage)
+    local_limiter = LocalRateLimiter(max_size=config.antispam_max_users, max_limit_sec=rules.max_sec)
+    dp.callback_query.middleware(AntiSpamMiddleware(rules, local_limiter, shared_limiter))
 
-    db = Database(config.postgres_dsn)
-    await db.connect()
+    if config.metrics_enabled:
+        # Inner middlewares on the dispatcher apply to the handlers of every included router.
+        handler_metrics = MetricsMiddleware()
+        for name, observer in dp.observers.items():
+            if name != "update":
+                observer.middleware(handler_metrics)
 
-    dp.callback_query.middleware(AntiSpamMiddleware())
-    
+    # Admin screens run stats queries; keep them off the pool the funnel uses.
+    for name, observer in admin.router.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(BackgroundDatabaseMiddleware())
     dp.include_router(admin.router)
     dp.include_router(start.router)
     dp.include_router(verify.router)
     dp.include_router(files.router)
-    
+    dp.include_router(members.router)
+    if config.unlock_mode == "join_request":
+        dp.include_router(join_requests.router)
+
     dp["db"] = db
     dp["config"] = config
+    return dp
+
+
+async def main():
+    """Main function to start the bot."""
+    config = load_config()
+    setup_logging(config)
+    log = logging.getLogger(__name__)
+    log.info("Starting bot...")
+
+    db = create_database(config)
+    await db.connect()
+
+    if config.fsm_storage == "postgres":
+        storage = PostgresStorage(db, ttl_sec=config.fsm_ttl_sec)
+        storage.start()
+    else:
+        storage = MemoryStorage()
+    bot = Bot(token=config.bot_token.get_secret_value(), session=create_session(config),
+              default=DefaultBotProperties(parse_mode="HTML"))
+    scheduler = setup_session(bot, config)
+    await start_services(bot, db, config)
+
+    rules = RateLimitRules(config.antispam_default_sec, config.antispam_limits)
+    shared_limiter = None
+    if config.antispam_backend == "postgres":
+        shared_limiter = PostgresRateLimiter(db, max_limit_sec=rules.max_sec)
+        shared_limiter.start()
+    dp = create_dispatcher(config, db, storage, rules, shared_limiter)
     dp["bot"] = bot
+    recorder = None
+    if config.record_updates_path:
+        recorder = UpdateRecorder(
+            config.record_updates_path, salt=config.record_salt or config.webhook_secret,
+            max_bytes=config.record_max_mb * 1024 * 1024, backups=config.record_backups,
+            sample_rate=config.record_sample_rate,
+        )
+        dp.update.outer_middleware(UpdateRecorderMiddleware(recorder))
+        log.info("Recording updates to %s", config.record_updates_path)
 
+    metrics_runner = None
     try:
         if config.use_webhook:
             # --- WEBHOOK MODE ---
@@ -81,8 +218,17 @@ async def main():
             dp.shutdown.register(on_shutdown)
             
             app = web.Application()
-            webhook_requests_handler = SimpleRequestHandler(dispatcher=dp, bot=bot)
+            webhook_requests_handler = QueuedRequestHandler(
+                dispatcher=dp, bot=bot, secret_token=config.webhook_secret,
+                workers=config.webhook_workers, queue_size=config.webhook_queue_size,
+            )
             webhook_requests_handler.register(app, path=config.webhook_path)
+            # /metrics and /healthz go on their own internal port, never on the public webhook server.
+            metrics_runner = await metrics.start_metrics_server(
+                config.metrics_host, config.metrics_port, serve_metrics=config.metrics_enabled,
+                health=webhook_requests_handler.handle_health,
+            )
+            log.info("Metrics and health served at http://%s:%s", config.metrics_host, config.metrics_port)
             
             setup_application(app, dp, bot=bot, config=config)
             
@@ -92,16 +238,32 @@ async def main():
             await site.start()
             
             log.info("Web server started at http://%s:%s", config.web_server_host, config.web_server_port)
-            await asyncio.Event().wait() # Keep the server running forever
+            try:
+                await asyncio.Event().wait() # Keep the server running forever
+            finally:
+                await runner.cleanup()
 
         else:
             # --- POLLING MODE ---
             log.info("Running in polling mode")
+            if config.metrics_enabled:
+                metrics_runner = await metrics.start_metrics_server(config.metrics_host, config.metrics_port)
+                log.info("Metrics served at http://%s:%s/metrics", config.metrics_host, config.metrics_port)
             await set_bot_commands(bot, config)
             await bot.delete_webhook(drop_pending_updates=True)
-            await dp.start_polling(bot)
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
 
     finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await stop_services()
+        if scheduler:
+            await scheduler.close()
+        if recorder:
+            recorder.close()
+        if shared_limiter:
+            await shared_limiter.close()
+        await storage.close()
         await db.disconnect()
         log.info("Bot stopped and database connection closed.")
 
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import gzip
+import os
+import re
+import sys
+from datetime import date
+
+import asyncpg
+from dotenv import load_dotenv
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.db import Database
+from app.config import load_config
+from app.services.analytics import ensure_event_partitions
+
+# Run daily from cron. Besides archiving, it keeps future monthly partitions in place.
+
+PARTITION_NAME = re.compile(r"events_p(\d{4})_(\d{2})")
+# A plain DETACH waits at most this long for its lock on `events` and is retried this many times.
+DETACH_LOCK_TIMEOUT = "5s"
+DETACH_ATTEMPTS = 5
+
+
+def retention_cutoff(today: date, retention_months: int) -> date:
+    """First day of the oldest month that is kept."""
+    months = today.year * 12 + today.month - 1 - retention_months
+    return date(months // 12, months % 12 + 1, 1)
+
+
+async def detach_partition(db: Database, name: str, has_default: bool) -> None:
+    """Detaches `name` from `events` without holding up inserts into the other partitions."""
+    if not has_default:
+        # Runs in its own implicit transaction; CONCURRENTLY can't be used inside a transaction block.
+        await db.execute(f"ALTER TABLE events DETACH PARTITION {name} CONCURRENTLY")
+        return
+    # Postgres refuses CONCURRENTLY while events_default exists. A plain DETACH only needs its lock on
+    # `events` for a moment, so take it with a short lock_timeout rather than queueing writers behind it.
+    for attempt in range(1, DETACH_ATTEMPTS + 1):
+        try:
+            await db.execute(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'; ALTER TABLE events DETACH PARTITION {name}")
+            return
+        except asyncpg.LockNotAvailableError:
+            if attempt == DETACH_ATTEMPTS:
+                raise
+            print(f"Timed out waiting to detach {name}, retrying ({attempt}/{DETACH_ATTEMPTS}).")
+            await asyncio.sleep(attempt)
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Archive monthly event partitions older than the retention window to gzipped CSV and drop them."
+    )
+    parser.add_argument("--output-dir", default="archive", help="Directory for the archived partitions.")
+    parser.add_argument("--retention-months", type=int, help="Months to keep (default: EVENTS_RETENTION_MONTHS).")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the partitions that would be archived.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    config = load_config()
+    retention_months = args.retention_months if args.retention_months is not None else config.events_retention_months
+    db = Database(config.postgres_dsn)
+    await db.connect()
+
+    cutoff = retention_cutoff(date.today(), retention_months)
+    # Partitions left detached, or half-detached, by an interrupted run are listed too and finished off.
+    rows = await db.fetchall("""
+    SELECT c.relname AS name, i.inhrelid IS NOT NULL AS attached, COALESCE(i.inhdetachpending, FALSE) AS detach_pending
+    FROM pg_class c
+    LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = 'events'::regclass
+    WHERE c.relkind = 'r' AND c.relname LIKE 'events\\_p%' AND pg_table_is_visible(c.oid)
+    ORDER BY c.relname
+    """)
+    expired = []
+    for row in rows:
+        match = PARTITION_NAME.fullmatch(row["name"])
+        if match and date(int(match.group(1)), int(match.group(2)), 1) < cutoff:
+            expired.append(row)
+    has_default = await db.fetchval(
+        "SELECT partdefid <> 0 FROM pg_partitioned_table WHERE partrelid = 'events'::regclass"
+    )
+
+    if not expired:
+        print(f"No partitions older than {cutoff.isoformat()}.")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    for row in expired:
+        name = row["name"]
+        path = os.path.join(args.output_dir, f"{name}.csv.gz")
+        if args.dry_run:
+            print(f"Would archive {name} to {path}")
+            continue
+        # Detached first, so no new row can land in it between the archive and the DROP,
+        # and the DROP itself doesn't need a lock on `events`.
+        if row["detach_pending"]:
+            await db.execute(f"ALTER TABLE events DETACH PARTITION {name} FINALIZE")
+        elif row["attached"]:
+            await detach_partition(db, name, has_default)
+        with gzip.open(path, "wb") as f:
+            await db.copy_from_query(f"SELECT id, user_id, type, slug, ts FROM {name} ORDER BY id", (), output=f,
+                                     format="csv", header=True)
+        # Funnel counts per slug and day already live in slug_daily_stats; keep per-type daily totals too.
+        # Both statements go in one call so they commit together and a rerun can't count a month twice.
+        await db.execute(f"""
+        INSERT INTO event_daily_counts (day, type, count)
+        SELECT (ts AT TIME ZONE 'UTC')::date, type, COUNT(*) FROM {name} GROUP BY 1, 2
+        ON CONFLICT (day, type) DO UPDATE SET count = event_daily_counts.count + excluded.count;
+        DROP TABLE {name};
+        """)
+        print(f"Archived {name} to {path} and dropped it.")
+
+    if not args.dry_run:
+        await ensure_event_partitions(db)
+    await db.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(main())
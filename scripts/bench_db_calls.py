@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.config import load_config
+from app.db import Database, _prepare_query
+
+LOOKUP_QUERY = "SELECT user_id, chat_id, selected_slug, joined_ok FROM users WHERE user_id = ? AND joined_ok >= ?"
+PAGE_QUERY = "SELECT id, id AS chat_id FROM generate_series(1, ?) AS id WHERE id > ?"
+
+
+def replace_each_call(query: str, params: tuple) -> str:
+    """The translation the statement layer replaced: one str.replace per parameter, on every call."""
+    for i in range(len(params)):
+        query = query.replace('?', f'${i + 1}', 1)
+    return query
+
+
+def per_call_us(fn, count: int) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - started) / count * 1e6
+
+
+async def per_call_us_async(fn, count: int) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        await fn()
+    return (time.perf_counter() - started) / count * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Measure the per-call overhead of the Database statement layer.")
+    parser.add_argument("--count", type=int, default=5000, help="Calls per measurement.")
+    parser.add_argument("--dsn", help="Postgres DSN. Defaults to the one built from .env.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    dsn = args.dsn or load_config().postgres_dsn
+    params = (1, 0)
+
+    print("Placeholder translation")
+    print(f"  replace per call   {per_call_us(lambda: replace_each_call(LOOKUP_QUERY, params), args.count * 20):>8.2f} us")
+    print(f"  memoized           {per_call_us(lambda: _prepare_query(LOOKUP_QUERY, len(params)), args.count * 20):>8.2f} us\n")
+
+    for cache_size in (0, 256):
+        db = Database(dsn, auto_migrate=False, statement_cache_size=cache_size)
+        await db.connect()
+        print(f"statement_cache_size={cache_size} (sequential calls, one connection busy at a time)")
+        for name, call in (
+            ("fetchone (dict)", lambda: db.fetchone(LOOKUP_QUERY, params)),
+            ("fetchrow (record)", lambda: db.fetchrow(LOOKUP_QUERY, params)),
+            ("fetchval", lambda: db.fetchval(LOOKUP_QUERY, params)),
+            ("fetchall 1000 rows", lambda: db.fetchall(PAGE_QUERY, (1000, 0))),
+            ("fetch 1000 rows", lambda: db.fetch(PAGE_QUERY, (1000, 0))),
+        ):
+            await per_call_us_async(call, 100)  # warm the pool and the statement cache
+            count = args.count // 10 if "1000" in name else args.count
+            print(f"  {name:<20} {await per_call_us_async(call, count):>8.1f} us")
+        await db.disconnect()
+        print()
+
+if __name__ == "__main__":
+    asyncio.run(main())
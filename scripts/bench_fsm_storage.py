@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from dotenv import load_dotenv
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app.config import load_config
+from app.db import Database
+from app.states import AdminStates
+from app.storage import PostgresStorage
+
+# No real bot has id 0, so the benchmark's rows can't collide with live flows.
+BENCH_BOT_ID = 0
+
+
+async def run_flow(storage: BaseStorage, key: StorageKey) -> float:
+    """One add-slug admin flow, as the handlers drive it. Returns its duration in seconds."""
+    started = time.perf_counter()
+    await storage.set_state(key, AdminStates.add_slug_name)
+    await storage.get_state(key)
+    await storage.update_data(key, {"slug_name": "ielts_speaking"})
+    await storage.set_state(key, AdminStates.add_slug_label)
+    await storage.get_state(key)
+    await storage.update_data(key, {"slug_label": "IELTS Speaking Pack"})
+    await storage.set_state(key, AdminStates.add_slug_file)
+    await storage.get_state(key)
+    await storage.get_data(key)
+    await storage.set_state(key, None)
+    await storage.set_data(key, {})
+    return time.perf_counter() - started
+
+
+async def bench(name: str, storage: BaseStorage, flows: int, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    durations: list[float] = []
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            durations.append(await run_flow(storage, StorageKey(bot_id=BENCH_BOT_ID, chat_id=i, user_id=i)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(flows)))
+    elapsed = time.perf_counter() - started
+    quantiles = statistics.quantiles(durations, n=100)
+    print(f"{name:<10} {flows / elapsed:>10.0f} flows/s   "
+          f"p50 {quantiles[49] * 1000:>7.2f} ms   p99 {quantiles[98] * 1000:>7.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare PostgresStorage with MemoryStorage on the add-slug admin flow.")
+    parser.add_argument("--flows", type=int, default=2000, help="Number of complete flows to run.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Flows running at the same time.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    config = load_config()
+    db = Database(config.postgres_dsn)
+    await db.connect()
+
+    print(f"{args.flows} flows of 11 storage calls each, {args.concurrency} concurrent\n")
+    await bench("memory", MemoryStorage(), args.flows, args.concurrency)
+    storage = PostgresStorage(db)
+    await bench("postgres", storage, args.flows, args.concurrency)
+    await db.execute("DELETE FROM fsm_storage WHERE key LIKE ?", (f"{BENCH_BOT_ID}:%",))
+
+    await db.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(main())
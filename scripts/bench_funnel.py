@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+from functools import partial
+from dotenv import load_dotenv
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.config import load_config
+from app.db import Database
+from app import metrics
+from app.services import membership, slugs
+from bench.fake_api import FaultConfig
+from bench.harness import delete_bench_users, query_counts, start_harness, stop_harness
+from bench.updates import FUNNEL_STEPS, JOIN_REQUEST_STEPS, generate_load
+
+BENCH_SLUG_PREFIX = "bench_"
+
+
+def percentiles(values: list[float]) -> str:
+    if len(values) < 2:
+        return "n/a"
+    q = statistics.quantiles(values, n=100)
+    return f"p50 {q[49] * 1000:>8.2f} ms   p95 {q[94] * 1000:>8.2f} ms   p99 {q[98] * 1000:>8.2f} ms"
+
+
+async def cleanup(db: Database, users: int) -> None:
+    """Removes everything the run wrote, including its share of the stats rollups."""
+    slug_pattern = f"{BENCH_SLUG_PREFIX}%"
+    await delete_bench_users(db, users)
+    await db.execute("DELETE FROM slug_daily_stats WHERE slug LIKE ?", (slug_pattern,))
+    await db.execute("DELETE FROM slug_stats WHERE slug LIKE ?", (slug_pattern,))
+    await db.execute("DELETE FROM slugs WHERE slug LIKE ?", (slug_pattern,))
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Drive the /start -> verify_join -> send: funnel through the real dispatcher against a fake "
+                    "Bot API and a local Postgres. Use a scratch database: the run writes users, events and slugs."
+    )
+    parser.add_argument("--users", type=int, default=1000, help="Number of simulated users, each walking the funnel once.")
+    parser.add_argument("--rate", type=float, default=300, help="Target updates per second.")
+    parser.add_argument("--slugs", type=int, default=10, help="Number of benchmark slugs to spread users over.")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Mean Bot API latency.")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="Bot API latency spread.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of Bot API calls answered with a 500.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of Bot API calls answered with a 429.")
+    parser.add_argument("--member-ratio", type=float, default=0.8, help="Share of users reported as channel members.")
+    parser.add_argument("--outbound-per-sec", type=float, default=0,
+                        help="Global send limit of the outbound scheduler. 0 leaves sends unpaced, since the fake API has no limits.")
+    parser.add_argument("--think-time", type=float, default=0, help="Seconds each user waits between funnel steps.")
+    parser.add_argument("--prefetch-per-sec", type=float,
+                        help="Membership prefetch budget. Defaults to MEMBERSHIP_PREFETCH_PER_SEC; 0 disables prefetching.")
+    parser.add_argument("--join-requests", action="store_true",
+                        help="Run with UNLOCK_MODE=join_request: users join through per-slug links instead of verifying.")
+    parser.add_argument("--api-port", type=int, default=8081, help="Port for the fake Bot API.")
+    parser.add_argument("--dsn", help="Postgres DSN. Defaults to the one built from .env.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for injected faults and membership.")
+    parser.add_argument("--keep", action="store_true", help="Keep the rows the run wrote.")
+    parser.add_argument("--log-level", default="ERROR", help="Log level for the bot while the benchmark runs.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s %(name)s: %(message)s")
+    config = load_config().model_copy(update={"metrics_enabled": True, "outbound_global_per_sec": args.outbound_per_sec})
+    if args.join_requests:
+        config = config.model_copy(update={"unlock_mode": "join_request"})
+    if args.prefetch_per_sec is not None:
+        config = config.model_copy(update={"membership_prefetch_per_sec": args.prefetch_per_sec})
+    db = Database(args.dsn or config.postgres_dsn)
+    await db.connect()
+
+    for i in range(args.slugs):
+        await slugs.upsert_slug(db, f"{BENCH_SLUG_PREFIX}{i}", f"Bench offer {i}", f"BENCH_FILE_{i}")
+
+    faults = FaultConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, failure_rate=args.failure_rate,
+        throttle_rate=args.throttle_rate, member_ratio=args.member_ratio,
+    )
+    harness = await start_harness(config, db, faults, api_port=args.api_port, seed=args.seed)
+    api, bot = harness.api, harness.bot
+
+    steps = JOIN_REQUEST_STEPS if args.join_requests else FUNNEL_STEPS
+    print(f"{args.users} users x {len(steps)} updates at {args.rate:.0f} updates/s target, "
+          f"Bot API {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms, "
+          f"{args.failure_rate:.0%} errors, {args.throttle_rate:.0%} throttled\n")
+    queries_before = query_counts()
+    try:
+        result = await generate_load(partial(harness.dp.feed_update, bot), bot, [f"{BENCH_SLUG_PREFIX}{i}" for i in range(args.slugs)],
+                                     users=args.users, rate=args.rate, think_time=args.think_time,
+                                     join_request_chat_id=config.verify_chat_id if args.join_requests else None)
+    finally:
+        await stop_harness(harness)
+
+    queries = {site: count - queries_before.get(site, 0) for site, count in query_counts().items()}
+    queries = {site: count for site, count in queries.items() if count}
+    all_latencies = [value for values in result.latencies.values() for value in values]
+
+    for step in steps:
+        print(f"{step:<8} {percentiles(result.latencies[step])}")
+    print(f"{'all':<8} {percentiles(all_latencies)}\n")
+    print(f"Sustained throughput: {result.throughput:.0f} updates/s over {result.elapsed:.1f} s")
+    print(f"DB queries per update: {sum(queries.values()) / max(result.updates, 1):.2f} "
+          "(batched event writes not included)")
+    for site, count in sorted(queries.items(), key=lambda item: -item[1]):
+        print(f"    {count / max(result.updates, 1):>6.2f}  {site}")
+    print(f"Bot API calls: {api.stats()['calls']}")
+    probes = {result: int(count) for (result,), count in metrics.MEMBERSHIP_PREFETCH.totals().items()}
+    print(f"Membership cache at verify/send: {membership.cache.stats()['hit_rate']:.0f}% hits, prefetch probes: {probes}")
+    if api.injected:
+        print(f"Injected faults: {dict(api.injected)}")
+    if result.errors:
+        print(f"Update errors: {result.errors}")
+
+    if not args.keep:
+        await cleanup(db, args.users)
+    await db.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramAPIError
+
+from app.outbound import OutboundScheduler, bulk_lane
+from app.services.broadcast import TokenBucket, _send_with_retry
+from bench.fake_api import FakeBotAPI, FaultConfig
+from bench.updates import BENCH_USER_BASE
+
+BENCH_TOKEN = "42:BENCH"
+
+
+async def broadcast(bot: Bot, recipients: int, rate: float, concurrency: int) -> None:
+    """The broadcast sender loop: a shared token bucket and `_send_with_retry`, as BroadcastRunner uses them."""
+    bucket = TokenBucket(rate)
+    job = {"from_chat_id": 1, "message_id": 1}
+    queue = iter(range(recipients))
+
+    async def sender() -> None:
+        for i in queue:
+            await _send_with_retry(bot, bucket, BENCH_USER_BASE + i, job, max_retries=3)
+
+    with bulk_lane():
+        await asyncio.gather(*(sender() for _ in range(concurrency)))
+
+
+async def replies(bot: Bot, rate: float, stop: asyncio.Event, latencies: list[float], errors: list[str]) -> None:
+    """Replies to users arriving at `rate` per second on average, each in its own chat."""
+    async def reply(chat_id: int) -> None:
+        started = time.perf_counter()
+        try:
+            await bot.send_message(chat_id, "Reply")
+            latencies.append(time.perf_counter() - started)
+        except TelegramAPIError as e:
+            errors.append(type(e).__name__)
+
+    tasks = []
+    chat_ids = iter(range(BENCH_USER_BASE * 2, BENCH_USER_BASE * 3))
+    while not stop.is_set():
+        tasks.append(asyncio.create_task(reply(next(chat_ids))))
+        await asyncio.sleep(random.expovariate(rate))
+    await asyncio.gather(*tasks)
+
+
+async def run(name: str, args: argparse.Namespace, scheduled: bool) -> None:
+    api = FakeBotAPI(FaultConfig(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 2,
+                                 send_limit_per_sec=args.telegram_limit), seed=1)
+    api_runner = await api.start(port=args.api_port)
+    bot = Bot(BENCH_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{args.api_port}")))
+    scheduler = None
+    if scheduled:
+        scheduler = OutboundScheduler(args.telegram_limit)
+        bot.session.middleware(scheduler)
+
+    latencies: list[float] = []
+    errors: list[str] = []
+    stop = asyncio.Event()
+    started = time.perf_counter()
+    try:
+        reply_task = asyncio.create_task(replies(bot, args.reply_rate, stop, latencies, errors))
+        await broadcast(bot, args.recipients, args.broadcast_rate, args.concurrency)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await reply_task
+    finally:
+        if scheduler:
+            await scheduler.close()
+        await bot.session.close()
+        await api_runner.cleanup()
+
+    q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [float("nan")] * 99
+    print(f"{name:<11} replies p50 {q[49] * 1000:>7.1f} ms  p99 {q[98] * 1000:>7.1f} ms  failed {len(errors):>4}   "
+          f"broadcast {args.recipients / elapsed:>5.1f} msg/s   429s from Telegram {sum(api.injected.values()):>4}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Run a broadcast and a stream of user replies against a fake Bot API that enforces Telegram's "
+                    "global send limit, with and without the outbound scheduler."
+    )
+    parser.add_argument("--recipients", type=int, default=600, help="Broadcast recipients.")
+    parser.add_argument("--broadcast-rate", type=float, default=25, help="Broadcast token bucket rate, msg/s.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Broadcast senders.")
+    parser.add_argument("--reply-rate", type=float, default=10, help="User replies per second.")
+    parser.add_argument("--telegram-limit", type=float, default=30, help="Sends per second the fake API accepts.")
+    parser.add_argument("--latency-ms", type=float, default=30, help="Mean Bot API latency.")
+    parser.add_argument("--api-port", type=int, default=8081, help="Port for the fake Bot API.")
+    parser.add_argument("--log-level", default="ERROR", help="Log level while the benchmark runs.")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s %(name)s: %(message)s")
+
+    print(f"Broadcast to {args.recipients} at {args.broadcast_rate:.0f} msg/s plus {args.reply_rate:.0f} replies/s, "
+          f"Telegram limit {args.telegram_limit:.0f} msg/s\n")
+    await run("unpaced", args, scheduled=False)
+    await run("scheduled", args, scheduled=True)
+
+if __name__ == "__main__":
+    asyncio.run(main())
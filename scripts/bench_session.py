@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from app.outbound import OutboundScheduler, bulk_lane
+from app.session import BotApiSession
+from bench.fake_api import FakeBotAPI, FaultConfig
+from bench.updates import BENCH_USER_BASE
+
+BENCH_TOKEN = "42:BENCH"
+
+
+async def burst(bot: Bot, seconds: float, rate: float, concurrency: int, latencies: list[float]) -> None:
+    """Broadcast sends in the bulk lane plus a user reply every 100 ms, for `seconds`."""
+    deadline = time.monotonic() + seconds
+    chat_ids = iter(range(BENCH_USER_BASE, BENCH_USER_BASE * 2))
+
+    async def sender() -> None:
+        with bulk_lane():
+            while time.monotonic() < deadline:
+                await bot.copy_message(next(chat_ids), from_chat_id=1, message_id=1)
+                await asyncio.sleep(concurrency / rate)
+
+    async def replier() -> None:
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            await bot.send_message(next(chat_ids), "Reply")
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.1)
+
+    await asyncio.gather(replier(), *(sender() for _ in range(concurrency)))
+
+
+async def run(name: str, session: AiohttpSession, args: argparse.Namespace) -> None:
+    api = FakeBotAPI(FaultConfig(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 2), seed=1)
+    api_runner = await api.start(port=args.api_port)
+    session.api = TelegramAPIServer.from_base(f"http://127.0.0.1:{args.api_port}")
+    bot = Bot(BENCH_TOKEN, session=session)
+    scheduler = OutboundScheduler()
+    bot.session.middleware(scheduler)
+
+    latencies: list[float] = []
+    try:
+        for i in range(args.bursts):
+            if i:
+                await asyncio.sleep(args.idle_sec)
+            await burst(bot, args.burst_sec, args.rate, args.concurrency, latencies)
+    finally:
+        await scheduler.close()
+        await bot.session.close()
+        await api_runner.cleanup()
+
+    calls = sum(api.calls.values())
+    q = statistics.quantiles(latencies, n=100)
+    print(f"{name:<8} {calls:>5} requests over {len(api.connections):>3} connections "
+          f"({1 - len(api.connections) / calls:.1%} reused)   replies p50 {q[49] * 1000:>6.1f} ms  p99 {q[98] * 1000:>6.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Compare connection reuse of aiogram's default session and BotApiSession over bursts of "
+                    "broadcast and reply traffic separated by idle gaps, against a fake Bot API."
+    )
+    parser.add_argument("--bursts", type=int, default=3, help="Number of traffic bursts.")
+    parser.add_argument("--burst-sec", type=float, default=5, help="Length of each burst.")
+    parser.add_argument("--idle-sec", type=float, default=20, help="Idle gap between bursts; the default keep-alive is 15 s.")
+    parser.add_argument("--rate", type=float, default=18, help="Broadcast messages per second.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Broadcast senders.")
+    parser.add_argument("--latency-ms", type=float, default=30, help="Mean Bot API latency.")
+    parser.add_argument("--keepalive-sec", type=float, default=60, help="Keep-alive of the tuned session.")
+    parser.add_argument("--api-port", type=int, default=8081, help="Port for the fake Bot API.")
+    parser.add_argument("--log-level", default="ERROR", help="Log level while the benchmark runs.")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s %(name)s: %(message)s")
+
+    print(f"{args.bursts} bursts of {args.burst_sec:.0f} s, {args.idle_sec:.0f} s apart, "
+          f"{args.rate:.0f} broadcast msg/s + 10 replies/s\n")
+    await run("default", AiohttpSession(), args)
+    await run("tuned", BotApiSession(keepalive_timeout=args.keepalive_sec), args)
+
+if __name__ == "__main__":
+    asyncio.run(main())
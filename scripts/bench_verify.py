@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from dotenv import load_dotenv
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.config import load_config
+from app.db import Database
+from app.services import analytics, slugs, users
+from bench.harness import delete_bench_users
+from bench.updates import BENCH_USER_BASE
+
+BENCH_SLUG = "bench_verify"
+
+
+async def verify_separately(db: Database, user_id: int) -> None:
+    """The verify path as it used to be, with the same catalog lookup and event write as the current one."""
+    user_data = await db.fetchone("SELECT selected_slug, joined_ok FROM users WHERE user_id = ?", (user_id,))
+    if not user_data["joined_ok"]:
+        await db.execute("UPDATE users SET joined_ok = 1 WHERE user_id = ?", (user_id,))
+    await slugs.get_slug_data(db, user_data["selected_slug"])
+    await analytics.log_event(db, user_id, "verify_ok", slug=BENCH_SLUG)
+
+
+async def verify_current(db: Database, user_id: int) -> None:
+    """The database side of the current verify_join handler, for a member."""
+    user_data = await users.get_verify_target(db, user_id)
+    await slugs.get_slug_data(db, user_data["selected_slug"])
+    if not user_data["joined_ok"]:
+        await users.mark_joined(db, user_id)
+    await analytics.log_event(db, user_id, "verify_ok", slug=BENCH_SLUG)
+
+
+async def reset_users(db: Database, count: int) -> None:
+    await delete_bench_users(db, count)
+    await db.execute(
+        "INSERT INTO users (user_id, chat_id, selected_slug) "
+        "SELECT id, id, ? FROM generate_series(?::bigint, ?::bigint) AS id",
+        (BENCH_SLUG, BENCH_USER_BASE, BENCH_USER_BASE + count - 1),
+    )
+
+
+async def bench(name: str, db: Database, verify, count: int, concurrency: int) -> None:
+    await reset_users(db, count)
+    semaphore = asyncio.Semaphore(concurrency)
+    durations: list[float] = []
+
+    async def one(user_id: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await verify(db, user_id)
+            durations.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(BENCH_USER_BASE + i) for i in range(count)))
+    elapsed = time.perf_counter() - started
+    quantiles = statistics.quantiles(durations, n=100)
+    print(f"{name:<10} {count / elapsed:>10.0f} verifies/s   "
+          f"p50 {quantiles[49] * 1000:>7.2f} ms   p99 {quantiles[98] * 1000:>7.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the old verify path with the current one. "
+                    "Writes users and events in the benchmark id range and removes them afterwards."
+    )
+    parser.add_argument("--count", type=int, default=5000, help="Number of first-time verifications per variant.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Verifications running at the same time.")
+    parser.add_argument("--dsn", help="Postgres DSN. Defaults to the one built from .env.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    config = load_config()
+    db = Database(args.dsn or config.postgres_dsn)
+    await db.connect()
+    await db.execute(
+        "INSERT INTO slugs (slug, label, file_id, active) VALUES (?, 'Bench', 'BENCH_FILE', 1) ON CONFLICT (slug) DO NOTHING",
+        (BENCH_SLUG,),
+    )
+    # As in the bot: slugs come from the catalog and events go through the batched sink.
+    await slugs.catalog.start(db, config.slug_cache_refresh_sec)
+    analytics.start_sink(db, config.event_batch_size, config.event_flush_interval_sec, config.event_max_pending)
+
+    print(f"{args.count} first-time verifications, {args.concurrency} concurrent\n")
+    try:
+        await bench("separate", db, verify_separately, args.count, args.concurrency)
+        await bench("current", db, verify_current, args.count, args.concurrency)
+    finally:
+        await analytics.stop_sink()
+        await slugs.catalog.stop()
+        await delete_bench_users(db, args.count)
+        await db.execute("DELETE FROM slug_daily_stats WHERE slug = ?", (BENCH_SLUG,))
+        await db.execute("DELETE FROM slug_stats WHERE slug = ?", (BENCH_SLUG,))
+        await db.execute("DELETE FROM slugs WHERE slug = ?", (BENCH_SLUG,))
+        await db.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,9 @@
 import argparse
 import asyncio
-import csv
+import gzip
 import os
 import sys
+from datetime import datetime
 from dotenv import load_dotenv
 
 # Add project root to sys.path
@@ -11,32 +12,80 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from app.db import Database
 from app.config import load_config
 
+EVENT_COLUMNS = ["id", "user_id", "type", "slug", "ts"]
+# How often to check whether the transactions that may still insert below the watermark have finished.
+WAIT_POLL_SEC = 0.5
+
+
+def parse_columns(value: str) -> list[str]:
+    columns = [c.strip() for c in value.split(",") if c.strip()]
+    unknown = [c for c in columns if c not in EVENT_COLUMNS]
+    if unknown or not columns:
+        raise argparse.ArgumentTypeError(f"Unknown columns: {', '.join(unknown)}. Choose from: {', '.join(EVENT_COLUMNS)}")
+    return columns
+
+
 async def main():
-    parser = argparse.ArgumentParser(description="Export the events table to a CSV file.")
-    parser.add_argument("output_file", help="Path to the output CSV file.")
+    parser = argparse.ArgumentParser(
+        description="Stream the events table to a CSV file. Memory use is flat regardless of table size."
+    )
+    parser.add_argument("output_file", help="Path to the output CSV file. A '.gz' suffix enables gzip.")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Only events with ts >= this ISO timestamp.")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Only events with ts < this ISO timestamp.")
+    parser.add_argument("--after-id", type=int, default=0, help="Only events with id > this value (incremental exports).")
+    parser.add_argument("--columns", type=parse_columns, default=EVENT_COLUMNS, help="Comma-separated columns to export.")
+    parser.add_argument("--gzip", action="store_true", help="Gzip the output even without a '.gz' suffix.")
+    parser.add_argument("--wait-timeout", type=float, default=60,
+                        help="Seconds to wait for in-flight writes below the watermark to commit (default: 60).")
     args = parser.parse_args()
 
     load_dotenv()
     config = load_config()
-    db = Database(config.db_path)
+    db = Database(config.postgres_dsn)
     await db.connect()
 
-    events = await db.fetchall("SELECT id, user_id, type, slug, ts FROM events ORDER BY ts ASC")
+    conditions, params = ["id > ?"], [args.after_id]
+    if args.since:
+        conditions.append("ts >= ?"); params.append(args.since)
+    if args.until:
+        conditions.append("ts < ?"); params.append(args.until)
+    where = " AND ".join(conditions)
 
-    if not events:
+    # Ids come from the sequence before the inserting transaction commits, so a lower id can become
+    # visible after a higher one (a slow COPY batch, a spool replay). The watermark is therefore the last
+    # id handed out, and only once every transaction that was open at that point has ended is everything
+    # up to it visible. Anything later gets a higher id and is left for the next run.
+    seq = await db.fetchone("SELECT last_value, is_called, clock_timestamp() AS taken FROM events_id_seq")
+    max_id = seq["last_value"] if seq["is_called"] else seq["last_value"] - 1
+    if max_id <= args.after_id:
         print("No events to export.")
+        await db.disconnect()
         return
+    open_query = """
+    SELECT COUNT(*) FROM pg_stat_activity
+    WHERE datname = current_database() AND backend_type = 'client backend'
+        AND pid <> pg_backend_pid() AND xact_start < ?
+    """
+    deadline = asyncio.get_running_loop().time() + args.wait_timeout
+    while await db.fetchval(open_query, (seq["taken"],)):
+        if asyncio.get_running_loop().time() > deadline:
+            print(f"Transactions open since before the watermark are still running after {args.wait_timeout:.0f}s; "
+                  "try again later.")
+            await db.disconnect()
+            sys.exit(1)
+        await asyncio.sleep(WAIT_POLL_SEC)
 
+    query = f"SELECT {', '.join(args.columns)} FROM events WHERE {where} AND id <= ? ORDER BY id"
+    use_gzip = args.gzip or args.output_file.endswith(".gz")
     try:
-        with open(args.output_file, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=events[0].keys())
-            writer.writeheader()
-            writer.writerows(events)
-        print(f"Successfully exported {len(events)} events to {args.output_file}")
+        with (gzip.open(args.output_file, "wb") if use_gzip else open(args.output_file, "wb")) as f:
+            await db.copy_from_query(query, (*params, max_id), output=f, format="csv", header=True)
+        print(f"Successfully exported events up to id {max_id} to {args.output_file}")
+        print(f"Next incremental export: --after-id {max_id}")
     except IOError as e:
         print(f"Error writing to file: {e}")
 
     await db.disconnect()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
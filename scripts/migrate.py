@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import os
+import sys
+from dotenv import load_dotenv
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncpg
+
+from app.config import load_config
+from app.migrations import apply_migrations, get_applied_versions, load_migrations
+
+# Rows moved per statement by --move-legacy-events; each batch commits on its own.
+LEGACY_BATCH_SIZE = 5000
+
+
+async def move_legacy_events(connection: asyncpg.Connection, batch_size: int) -> int:
+    """
+    Moves the rows migration 0003 left in `events_legacy` into the partitioned `events`,
+    oldest month first, and drops the legacy table once it is empty. Safe to interrupt and rerun.
+
+    Rows are inserted straight into their month's partition, not through `events`: they
+    are already in the rollups, and the parent's statement triggers would count them again.
+    """
+    if await connection.fetchval("SELECT to_regclass('events_legacy')") is None:
+        return 0
+    # The legacy column allowed NULL; the partition key doesn't.
+    await connection.execute("UPDATE events_legacy SET ts = NOW() WHERE ts IS NULL")
+    moved = 0
+    while (oldest := await connection.fetchval("SELECT MIN(ts) FROM events_legacy")) is not None:
+        month = await connection.fetchval("SELECT date_trunc('month', $1::timestamptz)::date", oldest)
+        # Also brings back a month that was archived meanwhile, so its rows don't end up in events_default.
+        await connection.execute("SELECT create_events_partitions($1, 0)", month)
+        partition = f"events_p{month:%Y_%m}"
+        if await connection.fetchval("SELECT to_regclass($1)", partition) is None:
+            # Months after the ones created ahead of time.
+            partition = "events_default"
+        query = f"""
+        WITH moved AS (
+            DELETE FROM events_legacy WHERE id IN (
+                SELECT id FROM events_legacy WHERE ts >= $1 AND ts < $1 + INTERVAL '1 month' ORDER BY ts LIMIT $2
+            ) RETURNING id, user_id, type, slug, ts
+        )
+        INSERT INTO {partition} (id, user_id, type, slug, ts) SELECT * FROM moved
+        """
+        start = await connection.fetchval("SELECT $1::date::timestamptz", month)
+        while True:
+            count = int((await connection.execute(query, start, batch_size)).rsplit(" ", 1)[-1])
+            moved += count
+            if count < batch_size:
+                break
+        print(f"Moved {moved} legacy events so far (through {month:%Y-%m}).")
+    await connection.execute("DROP TABLE events_legacy")
+    return moved
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Apply or list schema migrations.")
+    parser.add_argument("--list", action="store_true", help="Only show which migrations are applied or pending.")
+    parser.add_argument("--move-legacy-events", action="store_true",
+                        help="Move the rows migration 0003 left in events_legacy into the partitioned table, "
+                             "in batches that don't block event writes. Bot startup never does this.")
+    parser.add_argument("--batch-size", type=int, default=LEGACY_BATCH_SIZE, help="Rows per batch for --move-legacy-events.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    config = load_config()
+    connection = await asyncpg.connect(dsn=config.postgres_dsn, timeout=10)
+
+    try:
+        if args.list:
+            applied = await get_applied_versions(connection)
+            for migration in load_migrations():
+                status = "applied" if migration.version in applied else "pending"
+                print(f"{migration.version:04d}_{migration.name:<40} {status}")
+            return
+
+        migrations = await apply_migrations(connection)
+        if not migrations:
+            print("Database is up to date.")
+        for migration in migrations:
+            print(f"Applied {migration.version:04d}_{migration.name}")
+
+        if args.move_legacy_events:
+            moved = await move_legacy_events(connection, args.batch_size)
+            print(f"Moved {moved} legacy events; events_legacy is gone.")
+    finally:
+        await connection.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+from functools import partial
+from dotenv import load_dotenv
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.config import load_config
+from app.db import Database
+from bench.fake_api import FaultConfig
+from bench.harness import query_counts, start_harness, stop_harness
+from bench.replay import HandlerTimer, compare, read_records, replay, replay_slugs, summarize
+
+
+def current_build() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def seed_slugs(db: Database, slugs: set[str]) -> None:
+    """Makes sure every replayed slug exists; real slugs already in the database are left alone."""
+    for slug in sorted(slugs):
+        await db.execute(
+            "INSERT INTO slugs (slug, label, file_id, active) VALUES (?, ?, ?, 1) ON CONFLICT (slug) DO NOTHING",
+            (slug, f"Replay {slug}", f"REPLAY_FILE_{slug}"),
+        )
+
+
+async def run(args: argparse.Namespace) -> None:
+    records = read_records(args.files)
+    print(f"Loaded {len(records)} updates from {len(args.files)} file(s).")
+
+    load_dotenv()
+    # Replays compare handler time, so sends are not paced by the outbound scheduler.
+    config = load_config().model_copy(update={"metrics_enabled": True, "outbound_global_per_sec": 0})
+    db = Database(args.dsn or config.postgres_dsn)
+    await db.connect()
+    await seed_slugs(db, replay_slugs(records))
+
+    faults = FaultConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, member_ratio=args.member_ratio)
+    harness = await start_harness(config, db, faults, api_port=args.api_port, seed=args.seed)
+    timer = HandlerTimer()
+    timer.install(harness.dp)
+
+    queries_before = sum(query_counts().values())
+    try:
+        result = await replay(partial(harness.dp.feed_update, harness.bot), harness.bot, records,
+                              speed=args.speed, concurrency=args.concurrency)
+    finally:
+        await stop_harness(harness)
+    queries = sum(query_counts().values()) - queries_before
+    await db.disconnect()
+
+    summary = summarize(args.label or current_build(), result, timer, dict(harness.api.calls), queries)
+    print(f"Replayed {summary['updates']} updates in {summary['elapsed_sec']:.1f} s "
+          f"({summary['updates_per_sec']:.0f}/s, {summary['db_queries_per_update']:.2f} DB queries per update)\n")
+    for name, timings in {"(whole update)": summary["update"], **summary["handlers"]}.items():
+        print(f"{name:<36} {timings['count']:>7}   p50 {timings['p50_ms']:>8.2f} ms   "
+              f"p95 {timings['p95_ms']:>8.2f} ms   p99 {timings['p99_ms']:>8.2f} ms")
+    if summary["errors"]:
+        print(f"\nErrors: {summary['errors']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nSummary written to {args.output}")
+
+
+def run_compare(args: argparse.Namespace) -> None:
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    print("\n".join(compare(old, new)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured updates against a fake Bot API and compare runs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser(
+        "run", help="Feed capture files through the dispatcher. Use a scratch database: handlers write to it.")
+    run_parser.add_argument("files", nargs="+", help="Capture files, rotated ones included (e.g. updates.jsonl*).")
+    run_parser.add_argument("--speed", type=float, default=1.0,
+                            help="1 keeps the original pacing, N is N times faster, 0 is as fast as possible.")
+    run_parser.add_argument("--concurrency", type=int, default=100, help="Updates handled at the same time, at most.")
+    run_parser.add_argument("--latency-ms", type=float, default=20, help="Mean Bot API latency.")
+    run_parser.add_argument("--jitter-ms", type=float, default=10, help="Bot API latency spread.")
+    run_parser.add_argument("--member-ratio", type=float, default=0.8, help="Share of users reported as channel members.")
+    run_parser.add_argument("--api-port", type=int, default=8081, help="Port for the fake Bot API.")
+    run_parser.add_argument("--dsn", help="Postgres DSN. Defaults to the one built from .env.")
+    run_parser.add_argument("--seed", type=int, default=1, help="Random seed for the fake Bot API.")
+    run_parser.add_argument("--label", help="Name of this build in the summary. Defaults to the git commit.")
+    run_parser.add_argument("--output", help="Write a JSON summary here, for `compare`.")
+    run_parser.add_argument("--log-level", default="ERROR", help="Log level for the bot while replaying.")
+
+    compare_parser = commands.add_parser("compare", help="Show how two run summaries differ.")
+    compare_parser.add_argument("old", help="Summary of the baseline build.")
+    compare_parser.add_argument("new", help="Summary of the build under test.")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        run_compare(args)
+        return
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s %(name)s: %(message)s")
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
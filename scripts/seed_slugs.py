@@ -9,7 +9,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from app.db import Database
 from app.config import load_config
-from app.services.slugs import is_valid_slug
+from app.services.slugs import is_valid_slug, upsert_slug
 
 async def main():
     parser = argparse.ArgumentParser(description="Seed or manage slugs in the database.")
@@ -28,7 +28,7 @@ async def main():
 
     load_dotenv()
     config = load_config()
-    db = Database(config.db_path)
+    db = Database(config.postgres_dsn)
     await db.connect()
 
     if args.command == "add":
@@ -36,13 +36,7 @@ async def main():
             print(f"Error: Invalid slug format for '{args.slug}'. Use a-z, 0-9, _ (2-50 chars).")
             return
 
-        query = """
-        INSERT INTO slugs (slug, label, file_id, active) VALUES (?, ?, ?, 1)
-        ON CONFLICT(slug) DO UPDATE SET
-            label = excluded.label,
-            file_id = excluded.file_id;
-        """
-        await db.execute(query, (args.slug, args.label, args.file_id))
+        await upsert_slug(db, args.slug, args.label, args.file_id)
         print(f"Successfully added/updated slug '{args.slug}'.")
 
     elif args.command == "list":